@@ -55,6 +55,7 @@ import click
 from rich.console import Console
 from rich.table import Table
 
+from pelita.launcher import PlayerPool
 from pelita.network import ZMQClientError
 from pelita.scripts.script_utils import start_logging
 from pelita.tournament import call_pelita, check_team
@@ -92,6 +93,12 @@ class CI_Engine:
         self.db_file = config.get('general', 'db_file')
         self.dbwrapper = DB_Wrapper(self.db_file)
 
+        #: address of a served PlayerPool which keeps the player processes alive between games
+        self.player_pool = None
+
+        #: transport between the game processes and their players ('tcp' or 'ipc')
+        self.transport = 'tcp'
+
     def load_players(self):
         hash_cache = {}
 
@@ -150,7 +157,9 @@ class CI_Engine:
                                                             rounds=self.rounds,
                                                             size=self.size,
                                                             viewer=self.viewer,
-                                                            seed=self.seed)
+                                                            seed=self.seed,
+                                                            player_pool=self.player_pool,
+                                                            transport=self.transport)
 
         if final_state['whowins'] == 2:
             result = -1
@@ -813,7 +822,11 @@ class DB_Wrapper:
               help='Print scores and exit.')
 @click.option('--nohash', is_flag=True, default=False,
               help='Do not hash the players')
-def main(log, config, n, print, nohash):
+@click.option('--player-pool', is_flag=True, default=False,
+              help='Reuse the player processes across games')
+@click.option('--transport', type=click.Choice(['tcp', 'ipc']), default='tcp',
+              help='Connect the games and their players over tcp or ipc socket files')
+def main(log, config, n, print, nohash, player_pool, transport):
     if log is not None:
         start_logging(log, __name__)
         start_logging(log, 'pelita')
@@ -824,7 +837,13 @@ def main(log, config, n, print, nohash):
     else:
         if not nohash:
             ci_engine.load_players()
-        ci_engine.start(n)
+        ci_engine.transport = transport
+        if player_pool:
+            with PlayerPool() as pool:
+                ci_engine.player_pool = pool.serve([player['path'] for player in ci_engine.players])
+                ci_engine.start(n)
+        else:
+            ci_engine.start(n)
 
 if __name__ == '__main__':
     main()
@@ -4,8 +4,10 @@ import argparse
 import cProfile
 import functools
 import subprocess
+import time
 import timeit
 
+from pelita.batch import run_games
 from pelita.layout import parse_layout
 from pelita.game import run_game
 from pelita.player import stopping_player, nq_random_player
@@ -43,6 +45,8 @@ def parse_args():
     parser.add_argument('--max-rounds', help="Max rounds.", default=300, type=int)
 
     parser.add_argument('--cprofile', help="Show cProfile output with test teams (int).", default=None, type=int)
+    parser.add_argument('--batch', help="Play this many games with each test team on a process pool.", default=None, type=int)
+    parser.add_argument('--workers', help="Number of worker processes for --batch.", default=None, type=int)
 
     return parser.parse_args()
 
@@ -59,7 +63,17 @@ if __name__ == '__main__':
         ("NQ_Random (remote)", ["pelita/player/RandomPlayers.py", "pelita/player/RandomPlayers.py"]),
     ]
 
-    if args.cprofile is None:
+    if args.batch is not None:
+        print(f"Running {args.batch} games with max {MAX_ROUNDS} rounds in parallel:")
+
+        for name, teams in tests:
+            start = time.monotonic()
+            results = list(run_games([teams], [layout], range(args.batch),
+                                     workers=args.workers, max_rounds=MAX_ROUNDS))
+            result = time.monotonic() - start
+            print(f"{name:<20}: {result} ({len(results) / result:.1f} games/s)")
+
+    elif args.cprofile is None:
         print(f"Running {NUMBER} times with max {MAX_ROUNDS} rounds. Fastest out of {REPEAT}:")
 
         for name, teams in tests:
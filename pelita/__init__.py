@@ -1,5 +1,18 @@
-# ruff: noqa: F401
-
-from . import game, layout, maze_generator, network, viewer
+import importlib
 
 __version__ = '2.5.3'
+
+# The submodules are only imported on first access (PEP 562), so that
+# `import pelita` (and the remote players) do not have to load the game,
+# the viewers and their dependencies.
+_SUBMODULES = {'analyze', 'game', 'layout', 'maze_generator', 'network', 'replay', 'viewer'}
+
+
+def __getattr__(name):
+    if name in _SUBMODULES:
+        return importlib.import_module(f'.{name}', __name__)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def __dir__():
+    return sorted([*globals(), *_SUBMODULES])
@@ -0,0 +1,292 @@
+""" Aggregate statistics over many replay files.
+
+`analyze_replay` streams through the states of a single replay (of any
+format that `pelita.replay.read_replay` understands) and reduces it to a
+few NumPy arrays. The statistics of many replays are simply summed up with
+`merge_stats`, so that `update_stats` can analyse a directory of replays in
+a process pool and, when it is run again, only needs to process the files
+that are new since the last run.
+
+The statistics are a dict of arrays, which is saved as an `.npz` file:
+
+    files           the replay files that have been analysed (relative to
+                    the directory of the replays in `update_stats`)
+    games           the number of games
+    wins            the number of games won by team 0, team 1 and draws
+    rounds          (R,) the number of games that reached round r + 1
+    food_eaten      (2, R) the food eaten by each team in round r + 1
+    enemy_zone      (2, R) the number of moves that ended in the enemy
+                    homezone for each team in round r + 1
+    moves           (2,) the number of moves of each team
+    errors          (2,) the number of (non-fatal) errors of each team
+    fatal_errors    (2,) the number of fatal errors of each team
+    kills_WxH       (2, W, H) where the bots of each team were killed
+    positions_WxH   (2, W, H) where the bots of each team moved to
+
+The heatmaps are stored per maze shape (e.g. `kills_32x16`).
+"""
+
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+import numpy as np
+
+from .replay import MAGIC, MOVES_MAGIC, LegacyReplayReader, read_replay
+
+_logger = logging.getLogger(__name__)
+
+#: The statistics which are indexed by the round
+ROUND_FIELDS = ('rounds', 'food_eaten', 'enemy_zone')
+
+#: The statistics which are heatmaps of a maze shape
+HEATMAP_FIELDS = ('kills', 'positions')
+
+#: The number of bytes in which the first state of an old replay must be found
+LEGACY_SNIFF_SIZE = 2 ** 20
+
+
+def _heatmap_key(field, shape):
+    width, height = shape
+    return f'{field}_{width}x{height}'
+
+
+def empty_stats():
+    """ Returns the statistics of no games. """
+    return {
+        'files': np.array([], dtype=str),
+        'games': np.array(0),
+        'wins': np.zeros(3, dtype=int),
+        'rounds': np.zeros(0, dtype=int),
+        'food_eaten': np.zeros((2, 0), dtype=int),
+        'enemy_zone': np.zeros((2, 0), dtype=int),
+        'moves': np.zeros(2, dtype=int),
+        'errors': np.zeros(2, dtype=int),
+        'fatal_errors': np.zeros(2, dtype=int),
+    }
+
+
+def _grow(array, length):
+    """ Pads the last axis of `array` with zeros to `length`. """
+    missing = length - array.shape[-1]
+    if missing <= 0:
+        return array
+    return np.pad(array, [(0, 0)] * (array.ndim - 1) + [(0, missing)])
+
+
+def merge_stats(stats, other):
+    """ Returns the sum of two statistics. """
+    merged = {}
+    for key in stats.keys() | other.keys():
+        if key not in stats:
+            merged[key] = other[key]
+        elif key not in other:
+            merged[key] = stats[key]
+        elif key == 'files':
+            merged[key] = np.concatenate([stats[key], other[key]])
+        elif key in ROUND_FIELDS:
+            length = max(stats[key].shape[-1], other[key].shape[-1])
+            merged[key] = _grow(stats[key], length) + _grow(other[key], length)
+        else:
+            merged[key] = stats[key] + other[key]
+    return merged
+
+
+def _homezone_team(position, shape):
+    """ Returns the team that the position belongs to. """
+    return 0 if position[0] < shape[0] // 2 else 1
+
+
+def analyze_replay(path):
+    """ Returns the statistics of a single replay.
+
+    The states are read lazily, so that the memory use does not depend on
+    the length of the game. A replay whose game is not over (e.g. one that
+    is still being written) raises a ValueError.
+
+    Parameters
+    ----------
+    path : str or Path
+        The replay file
+
+    Returns
+    -------
+    stats : dict of arrays
+        The statistics (see the module documentation)
+    """
+    stats = empty_stats()
+    stats['files'] = np.array([str(path)])
+    stats['games'] = np.array(1)
+
+    rounds = {}
+    shape = None
+    previous = None
+    state = None
+    for state in read_replay(path):
+        if shape is None:
+            shape = tuple(state['shape'])
+            kills = np.zeros((2, *shape), dtype=int)
+            positions = np.zeros((2, *shape), dtype=int)
+
+        round, turn = state.get('round'), state.get('turn')
+        if round is not None and turn is not None:
+            # food eaten, enemy zone (for each team)
+            counts = rounds.setdefault(round, np.zeros((2, 2), dtype=int))
+            team = turn % 2
+            position = state['bots'][turn]
+            positions[team][tuple(position)] += 1
+            stats['moves'][team] += 1
+            if _homezone_team(position, shape) != team:
+                counts[1, team] += 1
+
+            if previous is not None:
+                # the food in the homezone of a team is eaten by the other team
+                for home in (0, 1):
+                    before = sum(1 for pos in previous['food'] if _homezone_team(pos, shape) == home)
+                    after = sum(1 for pos in state['food'] if _homezone_team(pos, shape) == home)
+                    counts[0, 1 - home] += max(0, before - after)
+
+                for bot, (deaths, previous_deaths) in enumerate(zip(state['deaths'], previous['deaths'])):
+                    if deaths <= previous_deaths:
+                        continue
+                    requested_moves = state.get('requested_moves') or [None] * len(state['bots'])
+                    move = requested_moves[bot] if bot == turn else None
+                    if move and move.get('success'):
+                        # the bot has walked into an enemy
+                        location = move['requested_position']
+                    else:
+                        location = previous['bots'][bot]
+                    kills[bot % 2][tuple(location)] += deaths - previous_deaths
+        previous = state
+
+    if state is None:
+        raise ValueError(f"{path} has no states.")
+    if not state.get('gameover'):
+        raise ValueError(f"{path} is incomplete (the game is not over).")
+
+    num_rounds = max(rounds, default=0)
+    stats['rounds'] = np.zeros(num_rounds, dtype=int)
+    stats['food_eaten'] = np.zeros((2, num_rounds), dtype=int)
+    stats['enemy_zone'] = np.zeros((2, num_rounds), dtype=int)
+    for round, counts in rounds.items():
+        stats['rounds'][round - 1] = 1
+        stats['food_eaten'][:, round - 1] = counts[0]
+        stats['enemy_zone'][:, round - 1] = counts[1]
+
+    whowins = state.get('whowins')
+    if whowins in (0, 1, 2):
+        stats['wins'][whowins] += 1
+    stats['errors'] = np.array(state.get('num_errors') or [0, 0])
+    stats['fatal_errors'] = np.array([len(errors) for errors in state.get('fatal_errors') or [[], []]])
+    stats[_heatmap_key('kills', shape)] = kills
+    stats[_heatmap_key('positions', shape)] = positions
+    return stats
+
+
+def is_replay_file(path):
+    """ Checks if the file at `path` looks like a replay (of any format). """
+    with open(path, 'rb') as f:
+        start = f.read(max(len(MAGIC), len(MOVES_MAGIC)))
+        if start.startswith((MAGIC, MOVES_MAGIC)):
+            return True
+        if not start.startswith(b'{'):
+            return False
+        # The old replays are JSON states, separated by a special character.
+        # Other JSON files (e.g. the output of a player) have no game state.
+        start += f.read(LEGACY_SNIFF_SIZE)
+    first, separator, _rest = start.partition(LegacyReplayReader.SEPARATOR)
+    if not separator:
+        return False
+    try:
+        state = json.loads(first)
+    except ValueError:
+        return False
+    return isinstance(state, dict) and {'walls', 'round'} <= state.keys()
+
+
+def find_replays(directory):
+    """ Returns the sorted paths of all replay files in `directory` and its
+    subdirectories. """
+    return sorted(path for path in Path(directory).rglob('*')
+                  if path.is_file() and is_replay_file(path))
+
+
+def load_stats(path):
+    """ Loads the statistics from an `.npz` file. """
+    with np.load(path, allow_pickle=False) as data:
+        return {key: data[key] for key in data.files}
+
+
+def save_stats(path, stats):
+    """ Saves the statistics to an `.npz` file. """
+    np.savez_compressed(path, **stats)
+
+
+def analyze_replays(paths, processes=None):
+    """ Returns the summed statistics of the given replays.
+
+    The replays are analysed in a pool of `processes` processes (default:
+    the number of CPUs). Replays which cannot be read or are incomplete
+    are logged and skipped.
+    """
+    stats = empty_stats()
+    paths = [str(path) for path in paths]
+    if not paths:
+        return stats
+    processes = processes or os.cpu_count() or 1
+    chunksize = max(1, len(paths) // (4 * processes))
+    with ProcessPoolExecutor(max_workers=processes) as executor:
+        results = executor.map(_analyze_or_none, paths, chunksize=chunksize)
+        for path, result in zip(paths, results):
+            if result is None:
+                _logger.warning("Could not analyse %s. Skipping.", path)
+                continue
+            stats = merge_stats(stats, result)
+    return stats
+
+
+def _analyze_or_none(path):
+    try:
+        return analyze_replay(path)
+    except Exception as e:
+        _logger.debug("Could not analyse %s: %r", path, e)
+        return None
+
+
+def update_stats(directory, output, processes=None):
+    """ Analyses the replays in `directory` and stores the statistics in `output`.
+
+    If `output` exists, only the replays which have not been analysed
+    before are processed and added to the stored statistics. The replays
+    are recorded by their path relative to `directory`, so that it does not
+    matter how `directory` is given. Replays which are incomplete (e.g. in
+    the log folder of a running tournament) are not recorded, so that they
+    are analysed again by the next run.
+
+    Returns
+    -------
+    stats, new_files : dict of arrays, list of str
+        The statistics of all replays and the files (relative to
+        `directory`) that have been added
+    """
+    directory = Path(directory)
+    output = Path(output)
+    stats = load_stats(output) if output.exists() else empty_stats()
+    known = set(stats['files'])
+    # the path of every new replay and its relative name
+    new_files = {}
+    for path in find_replays(directory):
+        name = path.relative_to(directory).as_posix()
+        if name not in known and path.resolve() != output.resolve():
+            new_files[str(path)] = name
+    added = []
+    if new_files:
+        new_stats = analyze_replays(new_files, processes=processes)
+        added = [new_files[path] for path in new_stats['files']]
+        new_stats['files'] = np.array(added, dtype=str)
+        stats = merge_stats(stats, new_stats)
+    if added:
+        save_stats(output, stats)
+    return stats, added
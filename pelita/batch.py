@@ -0,0 +1,198 @@
+""" Run many headless games in parallel.
+
+`run_games` plays every combination of team specs, layouts and seeds on a
+pool of worker processes and streams back a compact `GameResult` for each
+game as soon as it has finished:
+
+    >>> from pelita.batch import run_games
+    >>> from pelita.player import nq_random_player, smart_eating_player
+    >>> specs = [(nq_random_player, smart_eating_player)]
+    >>> for result in run_games(specs, [None], range(100), workers=8):
+    ...     print(result.index, result.seed, result.whowins)
+
+Every game gets its own random number generator, seeded from the seed of the
+game alone. The outcome of a game therefore does not depend on the number of
+workers or on the order in which the games are scheduled.
+"""
+
+import itertools
+import os
+import subprocess
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import dataclass
+from random import Random
+
+from .layout import parse_layout
+from .maze_generator import generate_maze
+
+
+@dataclass(frozen=True)
+class GameResult:
+    """ The outcome of a single game played by `run_games`. """
+    #: position of the game in the list of all games
+    index: int
+    #: index of the team specs in `specs`
+    spec_index: int
+    #: index of the layout in `layouts`
+    layout_index: int
+    #: the seed of the random number generator of the game
+    seed: int
+    #: the final score of both teams
+    score: tuple
+    #: 0 or 1 for the winning team, 2 for a draw
+    whowins: int
+    #: the last round that has been played
+    rounds: int
+    #: number of non-fatal errors (timeouts, illegal moves) of both teams
+    errors: tuple
+    #: types of the fatal errors of both teams
+    fatal_errors: tuple
+    #: number of deaths of all four bots
+    deaths: tuple
+    #: number of kills of all four bots
+    kills: tuple
+    #: time both teams have spent computing their moves, in seconds
+    team_time: tuple
+    #: wall time of the whole game (including setup), in seconds
+    duration: float
+
+
+def _load_layout(layout, rng):
+    """ Returns the layout dict for the given layout spec. """
+    if layout is None:
+        return generate_maze(rng=rng)
+    elif isinstance(layout, str):
+        return parse_layout(layout)
+    else:
+        return layout
+
+
+def play_game(index, spec_index, team_specs, layout_index, layout, seed, game_kwargs):
+    """ Plays a single game and returns its `GameResult`.
+
+    This is the function that is run on the worker processes. The random
+    number generator is seeded with `seed` alone. If `layout` is None,
+    a random maze is generated from the same generator (as
+    `pelita.utils.run_background_game` does).
+    """
+    from .game import run_game
+
+    start = time.monotonic()
+    rng = Random(seed)
+    layout_dict = _load_layout(layout, rng)
+    state = run_game(team_specs, layout_dict=layout_dict, rng=rng, **game_kwargs)
+    duration = time.monotonic() - start
+
+    return GameResult(
+        index=index,
+        spec_index=spec_index,
+        layout_index=layout_index,
+        seed=seed,
+        score=tuple(state['score']),
+        whowins=state['whowins'],
+        rounds=state['round'],
+        errors=tuple(len(team_errors) for team_errors in state['errors']),
+        fatal_errors=tuple(tuple(error['type'] for error in team_errors)
+                           for team_errors in state['fatal_errors']),
+        deaths=tuple(state['deaths']),
+        kills=tuple(state['kills']),
+        team_time=tuple(state['team_time']),
+        duration=duration,
+    )
+
+
+def iter_games(specs, layouts, seeds):
+    """ Yields the arguments of all games in the order they are indexed.
+
+    The games are all combinations of `specs`, `layouts` and `seeds`
+    with the seed changing fastest.
+    """
+    games = itertools.product(enumerate(specs), enumerate(layouts), seeds)
+    for index, ((spec_index, team_specs), (layout_index, layout), seed) in enumerate(games):
+        yield index, spec_index, tuple(team_specs), layout_index, layout, seed
+
+
+def run_games(specs, layouts, seeds, *, workers=None, max_rounds=300, engine='array',
+              store_output=subprocess.DEVNULL, **game_kwargs):
+    """ Play all combinations of `specs`, `layouts` and `seeds` on a process pool.
+
+    This is a generator which yields a `GameResult` for every game as soon as
+    it has finished. The results are therefore not ordered; use
+    `GameResult.index` to restore the order.
+
+    Parameters
+    ----------
+    specs : list of (team0, team1)
+        the pairs of team specs to play with. A team spec is either the path to
+        a module (a remote team) or a move function. Move functions must be
+        defined at module level, so that they can be pickled and sent to the
+        worker processes.
+
+    layouts : list
+        the layouts to play on. Each item is either a layout dict as returned
+        by `pelita.layout.parse_layout`, a layout string or None. For None,
+        a new random maze is generated for each game from its seed.
+
+    seeds : iterable of int
+        the seeds of the games. Every game uses its own random number generator
+        initialised with its seed, so that each game can be replayed with
+        `run_game(..., rng=seed)` (or with `play_game`).
+
+    workers : int or None
+        the number of worker processes. When None (default), the number of CPUs
+        is used. With `workers=1`, the games are played one after another in the
+        current process.
+
+    max_rounds, engine, store_output, **game_kwargs
+        passed on to `pelita.game.run_game`. Games are played with the
+        array-backed engine and the output of remote teams is discarded
+        by default.
+
+    Yields
+    ------
+    result : GameResult
+        the result of each game, in the order of completion
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers < 1:
+        raise ValueError(f"Number of workers must be at least 1, got {workers}.")
+
+    game_kwargs = {
+        **game_kwargs,
+        'max_rounds': max_rounds,
+        'engine': engine,
+        'store_output': store_output,
+        'print_result': False,
+    }
+    # we iterate over the seeds multiple times
+    seeds = list(seeds)
+    layouts = list(layouts)
+    games = iter_games(specs, layouts, seeds)
+
+    if workers == 1:
+        for game in games:
+            yield play_game(*game, game_kwargs)
+        return
+
+    # Only keep a limited number of games in flight, so that very long batches
+    # do not need to be submitted (and kept in memory) all at once
+    max_pending = 2 * workers
+    executor = ProcessPoolExecutor(max_workers=workers)
+    try:
+        pending = set()
+        for game in games:
+            pending.add(executor.submit(play_game, *game, game_kwargs))
+            if len(pending) >= max_pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+    finally:
+        # do not start any more games, if the generator is closed early
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,459 @@
+""" Array-backed game state for headless and batch games.
+
+The default game state in `pelita.game` is a plain dict which keeps walls and
+food in Python sets and the food ages in dicts. This module provides an
+alternative `GameState` which stores the same information in NumPy grids
+and fixed-size arrays and implements the per-turn rules (food ageing, food
+relocation and moving a bot) directly on these arrays.
+
+`GameState` is a `MutableMapping` with the same keys as the dict-based state,
+so all other functions in `pelita.game` can use it unchanged. The
+array-backed keys ('walls', 'food', 'food_age', 'bots', 'score', 'kills',
+'deaths', 'bot_was_killed') return fresh copies (or read-only views) on
+access; to change them, assign the whole key.
+
+Use it with `run_game(..., engine='array')` or `setup_game(..., engine='array')`.
+
+`GameState` is also the forward model for search-based bots: `GameState.fork`
+returns a cheap, detached copy of a position and `GameState.step` plays the
+next turn with a given move, using the same rules as the game itself.
+Move functions get such a state from `Bot.simulate`.
+"""
+
+import logging
+import math
+from collections.abc import MutableMapping
+from random import Random
+
+import numpy as np
+
+from . import game
+from .layout import get_layout_index
+
+_logger = logging.getLogger(__name__)
+
+#: The keys of the game state that are backed by arrays
+ARRAY_KEYS = ('walls', 'food', 'food_age', 'bots', 'score', 'kills', 'deaths', 'bot_was_killed')
+
+
+class GameState(MutableMapping):
+    """ A game state backed by NumPy arrays.
+
+    Parameters
+    ----------
+    game_state : dict
+        a dict-based game state as created by `pelita.game.setup_game`
+    """
+    __slots__ = ('_shape', '_walls', '_walls_grid', '_food_grid', '_food_age_grid',
+                 '_bots', '_score', '_kills', '_deaths', '_bot_was_killed',
+                 '_layout_index', '_food_cache', '_food_age_cache', '_shadow_masks', '_fields')
+
+    def __init__(self, game_state):
+        self._fields = {}
+        self._shape = tuple(game_state['shape'])
+        width, height = self._shape
+
+        self._walls = frozenset(tuple(pos) for pos in game_state['walls'])
+        self._walls_grid = np.zeros((width, height), dtype=bool)
+        for x, y in self._walls:
+            self._walls_grid[x, y] = True
+        self._walls_grid.flags.writeable = False
+        self._layout_index = (game_state.get('layout_index')
+                              or get_layout_index(self._walls, self._shape))
+
+        self._food_grid = np.zeros((width, height), dtype=bool)
+        self._food_age_grid = np.zeros((width, height), dtype=np.int64)
+        self._bots = np.zeros((4, 2), dtype=np.int64)
+        self._score = np.zeros(2, dtype=np.int64)
+        self._kills = np.zeros(4, dtype=np.int64)
+        self._deaths = np.zeros(4, dtype=np.int64)
+        self._bot_was_killed = np.zeros(4, dtype=bool)
+        self._food_cache = None
+        self._food_age_cache = None
+        self._shadow_masks = {}
+
+        for key, value in game_state.items():
+            self[key] = value
+
+    ### Mapping interface
+
+    def __getitem__(self, key):
+        # most keys are plain Python objects: look them up first
+        fields = self._fields
+        if key in fields:
+            return fields[key]
+        elif key == 'walls':
+            return self._walls
+        elif key == 'shape':
+            return self._shape
+        elif key == 'food':
+            if self._food_cache is None:
+                self._food_cache = self._materialize_food()
+            return self._food_cache
+        elif key == 'food_age':
+            if self._food_age_cache is None:
+                self._food_age_cache = self._materialize_food_age()
+            return self._food_age_cache
+        elif key == 'bots':
+            return [tuple(pos) for pos in self._bots.tolist()]
+        elif key == 'score':
+            return self._score.tolist()
+        elif key == 'kills':
+            return self._kills.tolist()
+        elif key == 'deaths':
+            return self._deaths.tolist()
+        elif key == 'bot_was_killed':
+            return self._bot_was_killed.tolist()
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        if key == 'walls':
+            if frozenset(tuple(pos) for pos in value) != self._walls:
+                raise ValueError("The walls of an array-backed game state cannot be changed.")
+        elif key == 'shape':
+            if tuple(value) != self._shape:
+                raise ValueError("The shape of an array-backed game state cannot be changed.")
+        elif key == 'food':
+            self._food_grid[...] = False
+            for team_food in value:
+                for x, y in team_food:
+                    self._food_grid[x, y] = True
+            self._food_cache = None
+        elif key == 'food_age':
+            self._food_age_grid[...] = 0
+            for team_food_age in value:
+                for (x, y), age in team_food_age.items():
+                    self._food_age_grid[x, y] = age
+            self._food_age_cache = None
+        elif key == 'bots':
+            self._bots[...] = value
+        elif key == 'score':
+            self._score[...] = value
+        elif key == 'kills':
+            self._kills[...] = value
+        elif key == 'deaths':
+            self._deaths[...] = value
+        elif key == 'bot_was_killed':
+            self._bot_was_killed[...] = value
+        else:
+            self._fields[key] = value
+
+    def __delitem__(self, key):
+        if key in ARRAY_KEYS or key == 'shape':
+            raise KeyError(f"Cannot remove array-backed key {key!r}.")
+        del self._fields[key]
+
+    def __iter__(self):
+        yield 'walls'
+        yield 'shape'
+        yield from ARRAY_KEYS[1:]
+        yield from self._fields
+
+    def __len__(self):
+        return len(ARRAY_KEYS) + 1 + len(self._fields)
+
+    def __contains__(self, key):
+        return key in ARRAY_KEYS or key == 'shape' or key in self._fields
+
+    def __repr__(self):
+        return f"GameState(shape={self._shape}, round={self._fields.get('round')}, turn={self._fields.get('turn')})"
+
+    def _materialize_food(self):
+        half = self._shape[0] // 2
+        food = [set(), set()]
+        for x, y in np.argwhere(self._food_grid).tolist():
+            food[x // half].add((x, y))
+        return [frozenset(food[0]), frozenset(food[1])]
+
+    def _materialize_food_age(self):
+        half = self._shape[0] // 2
+        food_age = [{}, {}]
+        for x, y in np.argwhere(self._food_age_grid).tolist():
+            food_age[x // half][(x, y)] = int(self._food_age_grid[x, y])
+        return food_age
+
+    def _home_slice(self, team):
+        """ The x range of the homezone of `team` as a slice. """
+        half = self._shape[0] // 2
+        return slice(half * team, half * (team + 1))
+
+    def _in_homezone(self, position, team):
+        half = self._shape[0] // 2
+        return (position[0] < half) if team == 0 else (position[0] >= half)
+
+    ### Game rules
+
+    def legal_positions(self, position):
+        """ Returns the legal positions for a bot at `position`
+        in the same order as `pelita.layout.get_legal_positions`. """
+        return self._layout_index.get_legal_positions(position)
+
+    def update_food_age(self, team, radius):
+        """ Array version of `pelita.gamestate_filters.update_food_age`.
+
+        Increases the age of all food pellets of `team` that are in the shadow
+        of one of its ghosts and resets the age of all other pellets.
+        """
+        home = self._home_slice(team)
+        food = self._food_grid[home]
+        food_age = self._food_age_grid[home]
+
+        shadow = None
+        for x, y in self._bots[team::2].tolist():
+            # Only ghosts can cast a shadow
+            if not self._in_homezone((x, y), team):
+                continue
+            mask = self._shadow_mask((x, y), radius)
+            shadow = mask if shadow is None else shadow | mask
+
+        # Pellets that have already been eaten keep their age,
+        # just as in the dict-based state
+        if shadow is None:
+            food_age[food] = 0
+        else:
+            shadow = shadow[home]
+            food_age[food & ~shadow] = 0
+            food_age[food & shadow] += 1
+        self._food_age_cache = None
+
+    def _shadow_mask(self, position, radius):
+        """ Returns a (cached) grid which is True for all positions
+        within Manhattan distance `radius` of `position`. """
+        key = (position, radius)
+        try:
+            return self._shadow_masks[key]
+        except KeyError:
+            width, height = self._shape
+            xs = np.arange(width)[:, None]
+            ys = np.arange(height)[None, :]
+            mask = (np.abs(xs - position[0]) + np.abs(ys - position[1])) <= radius
+            mask.flags.writeable = False
+            self._shadow_masks[key] = mask
+            return mask
+
+    def relocate_expired_food(self, team, radius, max_food_age=None):
+        """ Array version of `pelita.gamestate_filters.relocate_expired_food`.
+
+        The random number generator is consumed in exactly the same way as in the
+        dict-based version, so that both produce identical games.
+        """
+        if max_food_age is None:
+            max_food_age = self._fields['max_food_age']
+        if max_food_age == math.inf:
+            # camping is allowed; food never expires
+            return
+
+        home = self._home_slice(team)
+        expired = self._food_grid[home] & (self._food_age_grid[home] > max_food_age)
+        if not expired.any():
+            # nothing to relocate; we can skip building the target list
+            return
+
+        width, height = self._shape
+        home_width = width // 2
+        bots = self._bots[team::2].tolist()
+        enemy_bots = self._bots[1 - team::2].tolist()
+
+        # generate the sorted list of possible positions to relocate food
+        # (see pelita.gamestate_filters.relocate_expired_food for the rules)
+        free = ~(self._walls_grid[home] | self._food_grid[home])
+        # exclude the border
+        border = [home_width - 1 - home.start, home_width - home.start]
+        for col in border:
+            if 0 <= col < free.shape[0]:
+                free[col, :] = False
+        # exclude the team's bots and their shadows
+        xs = np.arange(home.start, home.stop)[:, None]
+        ys = np.arange(height)[None, :]
+        for bx, by in bots:
+            free &= (np.abs(xs - bx) + np.abs(ys - by)) > radius
+        # exclude the enemy bots
+        for ex, ey in enemy_bots:
+            if home.start <= ex < home.stop:
+                free[ex - home.start, ey] = False
+        targets = [(x + home.start, y) for x, y in np.argwhere(free).tolist()]
+
+        for x, y in np.argwhere(expired).tolist():
+            pellet = (x + home.start, y)
+            if not targets:
+                # we have no free positions anymore, just let the food stay where it is
+                continue
+            new_pos = self._fields['rng'].choice(targets)
+            targets.remove(new_pos)
+
+            self._food_grid[pellet] = False
+            self._food_age_grid[pellet] = 0
+            self._food_grid[new_pos] = True
+
+        self._food_cache = None
+        self._food_age_cache = None
+
+    def fork(self):
+        """ Returns an independent copy of this game state.
+
+        The copy shares the walls and the layout index with this state and
+        gets its own copies of the arrays, of the error lists and of the random
+        number generator. It is detached from the teams and the viewers of the
+        game and is meant to be advanced with `step`.
+        """
+        clone = GameState.__new__(GameState)
+        clone._shape = self._shape
+        clone._walls = self._walls
+        clone._walls_grid = self._walls_grid
+        clone._layout_index = self._layout_index
+        clone._food_grid = self._food_grid.copy()
+        clone._food_age_grid = self._food_age_grid.copy()
+        clone._bots = self._bots.copy()
+        clone._score = self._score.copy()
+        clone._kills = self._kills.copy()
+        clone._deaths = self._deaths.copy()
+        clone._bot_was_killed = self._bot_was_killed.copy()
+        # the cached food list holds frozensets and is replaced on every change
+        clone._food_cache = self._food_cache
+        clone._food_age_cache = None
+        clone._shadow_masks = self._shadow_masks
+
+        fields = dict(self._fields)
+        if 'errors' in fields:
+            fields['errors'] = [dict(team_errors) for team_errors in fields['errors']]
+        if 'fatal_errors' in fields:
+            fields['fatal_errors'] = [list(team_errors) for team_errors in fields['fatal_errors']]
+        if fields.get('rng') is not None:
+            rng = Random.__new__(Random)
+            rng.setstate(fields['rng'].getstate())
+            fields['rng'] = rng
+        for key, detached in (('teams', None), ('viewers', []), ('controller', None)):
+            if key in fields:
+                fields[key] = detached
+        clone._fields = fields
+        return clone
+
+    def step(self, position):
+        """ Plays the next turn, in which the next bot moves to `position`.
+
+        This applies the rules of `pelita.game.play_turn` without requesting a
+        move from a team: the round and turn counters are advanced, the food of
+        the moving team ages (and is relocated, if it has expired), the bot
+        moves, eats food or bots, and the state is checked for the final move.
+
+        Returns
+        -------
+        self : GameState
+            the updated game state
+
+        Raises
+        ------
+        ValueError
+            if the game is already over or if `position` is not a legal
+            position for the bot. In that case, the state is left unchanged.
+        """
+        fields = self._fields
+        if fields['gameover']:
+            raise ValueError("Game is already over!")
+
+        next_step = game.next_round_turn(self)
+        turn = next_step['turn']
+        previous_position = tuple(self._bots[turn].tolist())
+        position = tuple(position)
+        if position not in self.legal_positions(previous_position):
+            raise ValueError(f"Illegal position for bot {turn}: {previous_position}➔{position}.")
+
+        fields.update(next_step)
+        team = turn % 2
+        self.update_food_age(team, game.SHADOW_DISTANCE)
+        self.relocate_expired_food(team, game.SHADOW_DISTANCE)
+        self.apply_move(position)
+
+        # This is check_gameover(detect_final_move=True) without the errors
+        # (which a step cannot produce) and counting the food on the arrays
+        if not fields['gameover']:
+            half = self._shape[0] // 2
+            next_round = game.next_round_turn(self)['round']
+            if (next_round > fields['max_rounds']
+                    or not self._food_grid[:half].any() or not self._food_grid[half:].any()):
+                score = self._score.tolist()
+                if score[0] > score[1]:
+                    whowins = 0
+                elif score[0] < score[1]:
+                    whowins = 1
+                else:
+                    whowins = 2
+                fields['gameover'] = True
+                fields['whowins'] = whowins
+        return self
+
+    def apply_move(self, bot_position):
+        """ Array version of `pelita.game.apply_move`. """
+        turn = self._fields['turn']
+        n_round = self._fields['round']
+        team = turn % 2
+        enemy_idx = (1, 3) if team == 0 else (0, 2)
+
+        # reset our own bot_was_killed flag
+        self._bot_was_killed[turn] = False
+
+        team_errors = self._fields['errors'][team]
+        previous_position = tuple(self._bots[turn].tolist())
+        legal_positions = self.legal_positions(previous_position)
+
+        # unless we have already made an error, check if we made a legal move
+        if (n_round, turn) not in team_errors:
+            if bot_position not in legal_positions:
+                game.game_print(turn, f"Illegal position. {previous_position}➔{bot_position} not in legal positions:"
+                                 f" {sorted(legal_positions)}.")
+                exception_event = {
+                        'type': 'IllegalPosition',
+                        'description': f"bot{turn}: {previous_position}➔{bot_position}",
+                        'turn': turn,
+                        'round': n_round,
+                }
+                self._fields['fatal_errors'][team].append(exception_event)
+
+        # only execute move if errors not exceeded
+        self.update(game.check_gameover(self))
+        if self._fields['gameover']:
+            return self
+
+        # Now check if we must make a random move
+        if (n_round, turn) in team_errors:
+            bot_position = self._fields['rng'].choice(legal_positions)
+            game.game_print(turn, f"Setting a legal position at random: {bot_position}")
+        else:
+            # use the canonical int tuple for indexing the arrays
+            bot_position = legal_positions[legal_positions.index(bot_position)]
+
+        # take step
+        self._bots[turn] = bot_position
+        _logger.info(f"Bot {turn} moves to {bot_position}.")
+
+        bot_in_homezone = self._in_homezone(bot_position, team)
+        if not bot_in_homezone:
+            if self._food_grid[bot_position]:
+                _logger.info(f"Bot {turn} eats food at {bot_position}.")
+                self._food_grid[bot_position] = False
+                self._food_cache = None
+                self._score[team] += 1
+
+        bots = self._bots.tolist()
+        if bot_in_homezone:
+            killed_enemies = [idx for idx in enemy_idx if tuple(bots[idx]) == bot_position]
+            for killed in killed_enemies:
+                _logger.info(f"Bot {turn} eats enemy bot {killed} at {bot_position}.")
+                self._score[team] += game.KILL_POINTS
+                self._bots[killed] = self._layout_index.initial_positions[killed]
+                self._kills[turn] += 1
+                self._deaths[killed] += 1
+                self._bot_was_killed[killed] = True
+                _logger.info(f"Bot {killed} reappears at {self._layout_index.initial_positions[killed]}.")
+        else:
+            enemies_on_target = [idx for idx in enemy_idx if tuple(bots[idx]) == bot_position]
+            if len(enemies_on_target) > 0:
+                _logger.info(f"Bot {turn} was eaten by bots {enemies_on_target} at {bot_position}.")
+                self._score[1 - team] += game.KILL_POINTS
+                self._bots[turn] = self._layout_index.initial_positions[turn]
+                self._deaths[turn] += 1
+                self._kills[enemies_on_target[0]] += 1
+                self._bot_was_killed[turn] = True
+                _logger.info(f"Bot {turn} reappears at {self._layout_index.initial_positions[turn]}.")
+
+        return self
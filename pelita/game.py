@@ -1,11 +1,13 @@
 """This is the game module. Written in 2019 in Born by Carlos and Lisa."""
 
+import inspect
 import logging
 import math
 import os
 import subprocess
 import sys
 import time
+from concurrent.futures import ThreadPoolExecutor
 from warnings import warn
 
 from . import layout
@@ -13,11 +15,15 @@ from .base_utils import default_rng
 from .exceptions import (FatalException, NoFoodWarning, NonFatalException,
                          PlayerTimeout)
 from .gamestate_filters import noiser, relocate_expired_food, update_food_age
-from .layout import get_legal_positions, initial_positions
-from .network import ZMQPublisher, setup_controller
-from .team import make_team
-from .viewer import (AsciiViewer, ProgressViewer, ReplayWriter, ReplyToViewer,
-                     ResultPrinter)
+from .layout import get_layout_index
+# get_legal_positions and initial_positions are part of the pelita.game namespace
+from .layout import get_legal_positions, initial_positions  # noqa: F401
+from .network import ZMQPublisher, local_address, setup_controller
+from .team import AsyncRemoteTeam, make_team
+from .replay import MovesWriter, ReplayWriter
+from .viewer import (ALL_STATES, AsciiViewer, ProgressViewer, ReplyToViewer,
+                     ResultPrinter, Subscription, show_viewer_state,
+                     subscribed_fields, subscribed_viewers)
 
 _logger = logging.getLogger(__name__)
 _mswindows = (sys.platform == "win32")
@@ -109,7 +115,8 @@ def run_game(team_specs, *, layout_dict, max_rounds=300,
              rng=None, allow_camping=False, error_limit=5, timeout_length=3,
              viewers=None, store_output=False,
              team_names=(None, None), team_infos=(None, None),
-             allow_exceptions=False, print_result=True):
+             allow_exceptions=False, print_result=True, engine='dict', launcher=None,
+             transport='tcp'):
     """ Run a pelita match.
 
     Parameters
@@ -151,7 +158,8 @@ def run_game(team_specs, *, layout_dict, max_rounds=300,
 
     viewers : list[viewer1, viewer2, ...]
            List of viewers to attach to the game. Implemented viewers: 'ascii',
-           'progress', tk'. If None, no viewer is attached.
+           'progress', tk'. Viewer objects are attached as they are.
+           If None, no viewer is attached.
 
     store_output : False or str
                 if store_output is a string it will be interpreted as a path to a
@@ -178,6 +186,24 @@ def run_game(team_specs, *, layout_dict, max_rounds=300,
     print_result : bool
                 when True (default), print the result of the match on the command line
 
+    launcher : launcher object, optional
+            starts the processes of remote teams. By default, a new process is
+            started for each remote team. Pass a `pelita.launcher.PlayerPool`
+            to reuse the player processes across games.
+
+    transport : str
+            the transport for the connections to the remote teams that are
+            started on this host and to the Tk viewer: 'tcp' (default), 'ipc'
+            (socket files, faster and without running out of ports when many
+            games run in parallel; not on Windows) or 'inproc' (the players
+            run in threads of this process, see `pelita.launcher.ThreadLauncher`)
+
+    engine : str
+          the representation of the game state. 'dict' (default) uses a plain
+          dict of Python sets and lists, 'array' uses the NumPy-backed
+          `pelita.engine.GameState`, which is faster for headless games.
+          Both engines produce identical games for the same seed.
+
     Notes
     -----
 
@@ -211,7 +237,10 @@ def run_game(team_specs, *, layout_dict, max_rounds=300,
                        rng=rng, viewers=viewers,
                        store_output=store_output, team_names=team_names,
                        team_infos=team_infos,
-                       print_result=print_result)
+                       print_result=print_result,
+                       engine=engine,
+                       launcher=launcher,
+                       transport=transport)
 
     # Play the game until it is gameover.
     while not state.get('gameover'):
@@ -228,8 +257,59 @@ def run_game(team_specs, *, layout_dict, max_rounds=300,
     return state
 
 
-def setup_viewers(viewers, print_result=True):
-    """ Returns a list of viewers from the given strings. """
+async def run_game_async(team_specs, *, layout_dict, max_rounds=300,
+                         rng=None, allow_camping=False, error_limit=5, timeout_length=3,
+                         viewers=None, store_output=False,
+                         team_names=(None, None), team_infos=(None, None),
+                         allow_exceptions=False, print_result=True, engine='dict', launcher=None,
+                         transport='tcp'):
+    """ Run a pelita match in an asyncio event loop.
+
+    The parameters are the same as for `run_game`. Remote teams are
+    `pelita.team.AsyncRemoteTeam`s which do not block the event loop while
+    the players are thinking. One process can thus play many games
+    concurrently:
+
+        async def play_all(team_specs, layout_dict):
+            games = [run_game_async(team_specs, layout_dict=layout_dict, rng=seed, print_result=False)
+                     for seed in range(20)]
+            return await asyncio.gather(*games)
+
+        states = asyncio.run(play_all(["team1/", "team2/"], layout_dict))
+
+    Local teams (move functions) and a controller (the Tk viewer) still
+    block the event loop and all other games while they are busy. The
+    time that a team is waiting for the event loop is counted as part of
+    its team_time.
+    """
+    state = await setup_game_async(team_specs, layout_dict=layout_dict, max_rounds=max_rounds,
+                                   allow_camping=allow_camping,
+                                   error_limit=error_limit, timeout_length=timeout_length,
+                                   rng=rng, viewers=viewers,
+                                   store_output=store_output, team_names=team_names,
+                                   team_infos=team_infos,
+                                   allow_exceptions=allow_exceptions,
+                                   print_result=print_result,
+                                   engine=engine,
+                                   launcher=launcher,
+                                   transport=transport)
+
+    # Play the game until it is gameover.
+    while not state.get('gameover'):
+        if controller_exit(state):
+            break
+
+        state = await play_turn_async(state, allow_exceptions=allow_exceptions)
+
+    return state
+
+
+def setup_viewers(viewers, print_result=True, transport='tcp'):
+    """ Returns a list of viewers from the given strings.
+
+    The Tk viewer runs in its own process and is connected
+    over ipc for transport 'ipc' and over tcp otherwise. """
+    viewer_address = local_address('ipc' if transport == 'ipc' else 'tcp')
 
     viewer_state = {
         'viewers': [],
@@ -241,24 +321,42 @@ def setup_viewers(viewers, print_result=True):
         if isinstance(v, str):
             viewer = v
             viewer_opts = {}
-        else:
+        elif isinstance(v, (tuple, list)):
             viewer, viewer_opts = v
+        else:
+            # a viewer object
+            viewer_state['viewers'].append(v)
+            continue
 
         if viewer == 'ascii':
             viewer_state['viewers'].append(AsciiViewer())
         elif viewer == 'progress':
             viewer_state['viewers'].append(ProgressViewer())
         elif viewer == 'reply-to':
-            viewer_state['viewers'].append(ReplyToViewer(viewer_opts))
+            if isinstance(viewer_opts, str):
+                viewer_opts = {'address': viewer_opts}
+            subscription = viewer_opts.get('subscription') or ALL_STATES
+            if isinstance(subscription, str):
+                subscription = Subscription.from_string(subscription)
+            viewer_state['viewers'].append(ReplyToViewer(viewer_opts['address'], subscription=subscription))
         elif viewer == 'write-replay-to':
-            viewer_state['viewers'].append(ReplayWriter(open(viewer_opts, 'w')))
+            if isinstance(viewer_opts, str):
+                viewer_opts = {'path': viewer_opts}
+            viewer_state['viewers'].append(ReplayWriter(open(viewer_opts['path'], 'wb'),
+                                                        compression=viewer_opts.get('compression', 'gzip')))
+        elif viewer == 'record-moves-to':
+            viewer_state['viewers'].append(MovesWriter(open(viewer_opts, 'wb')))
         elif viewer == 'publish-to':
-            zmq_external_publisher = ZMQPublisher(address=viewer_opts, bind=False)
+            if isinstance(viewer_opts, str):
+                viewer_opts = {'address': viewer_opts}
+            zmq_external_publisher = ZMQPublisher(address=viewer_opts['address'], bind=False,
+                                                  max_fps=viewer_opts.get('max_fps'),
+                                                  hwm=viewer_opts.get('hwm'))
             viewer_state['viewers'].append(zmq_external_publisher)
         elif viewer == 'tk':
-            zmq_publisher = ZMQPublisher(address='tcp://127.0.0.1')
+            zmq_publisher = ZMQPublisher(address=viewer_address)
             viewer_state['viewers'].append(zmq_publisher)
-            viewer_state['controller'] = setup_controller()
+            viewer_state['controller'] = setup_controller(address=viewer_address)
 
             _proc = TkViewer(address=zmq_publisher.socket_addr, controller=viewer_state['controller'].socket_addr,
                             stop_after=viewer_opts.get('stop_at'),
@@ -281,11 +379,82 @@ def setup_game(team_specs, *, layout_dict, max_rounds=300, rng=None,
                allow_camping=False, error_limit=5, timeout_length=3,
                viewers=None, store_output=False,
                team_names=(None, None), team_infos=(None, None),
-               allow_exceptions=False, print_result=True):
+               allow_exceptions=False, print_result=True, engine='dict', launcher=None,
+               transport='tcp'):
     """ Generates a game state for the given teams and layout with otherwise default values. """
+    game_state = _new_game_state(team_specs, layout_dict=layout_dict, max_rounds=max_rounds, rng=rng,
+                                 allow_camping=allow_camping, error_limit=error_limit,
+                                 timeout_length=timeout_length, viewers=viewers,
+                                 team_names=team_names, team_infos=team_infos,
+                                 print_result=print_result, engine=engine, transport=transport)
+
+    # Wait until the controller tells us that it is ready
+    # We then can send the initial maze
+    # This call *blocks* until the controller replies
+    if controller_exit(game_state, await_action='set_initial'):
+        return game_state
+
+    # Send maze before team creation.
+    # This gives a more fluent UI as it does not have to wait for the clients
+    # to answer to the server.
+    update_viewers(game_state)
+
+    team_state = setup_teams(team_specs, game_state, store_output=store_output, allow_exceptions=allow_exceptions,
+                             launcher=launcher, transport=transport)
+    game_state.update(team_state)
+
+    # Check if one of the teams has already generate a fatal error
+    # or if the game has finished (might happen if we set it up with max_rounds=0).
+    game_state.update(check_gameover(game_state, detect_final_move=True))
+
+    # Send updated game state with team names to the viewers
+    update_viewers(game_state)
+
+    # exit remote teams in case we are game over
+    check_exit_remote_teams(game_state)
+
+    return game_state
+
+
+async def setup_game_async(team_specs, *, layout_dict, max_rounds=300, rng=None,
+                           allow_camping=False, error_limit=5, timeout_length=3,
+                           viewers=None, store_output=False,
+                           team_names=(None, None), team_infos=(None, None),
+                           allow_exceptions=False, print_result=True, engine='dict', launcher=None,
+                           transport='tcp'):
+    """ Generates a game state like `setup_game`, with teams for an asyncio game loop. """
+    game_state = _new_game_state(team_specs, layout_dict=layout_dict, max_rounds=max_rounds, rng=rng,
+                                 allow_camping=allow_camping, error_limit=error_limit,
+                                 timeout_length=timeout_length, viewers=viewers,
+                                 team_names=team_names, team_infos=team_infos,
+                                 print_result=print_result, engine=engine, transport=transport)
+
+    if controller_exit(game_state, await_action='set_initial'):
+        return game_state
+
+    update_viewers(game_state)
+
+    team_state = await setup_teams_async(team_specs, game_state, store_output=store_output,
+                                         allow_exceptions=allow_exceptions, launcher=launcher,
+                                         transport=transport)
+    game_state.update(team_state)
+
+    game_state.update(check_gameover(game_state, detect_final_move=True))
+    update_viewers(game_state)
+    check_exit_remote_teams(game_state)
+
+    return game_state
+
+
+def _new_game_state(team_specs, *, layout_dict, max_rounds, rng, allow_camping, error_limit, timeout_length,
+                    viewers, team_names, team_infos, print_result, engine, transport):
+    """ Checks the layout and returns the initial game state (without the teams). """
     if viewers is None:
         viewers = []
 
+    if engine not in ('dict', 'array'):
+        raise ValueError(f"Unknown engine {engine}.")
+
     # check that two teams have been given
     if not len(team_specs) == 2:
         raise ValueError("Two teams must be given.")
@@ -319,10 +488,17 @@ def setup_game(team_specs, *, layout_dict, max_rounds=300, rng=None,
     if side_no_food:
         warn(f"Layout has no food for team {side_no_food}.", NoFoodWarning)
 
-    viewer_state = setup_viewers(viewers, print_result=print_result)
+    viewer_state = setup_viewers(viewers, print_result=print_result, transport=transport)
 
+    rng_seed = rng if isinstance(rng, int) else None
     rng = default_rng(rng)
 
+    # viewers which record the game for a re-simulation (see `pelita.replay.MovesWriter`)
+    # need the seed or the initial state of the rng
+    for viewer in viewer_state['viewers']:
+        if hasattr(viewer, 'show_rng_state'):
+            viewer.show_rng_state(seed=rng_seed, state=rng.getstate())
+
     # Initialize the game state.
 
     game_state = dict(
@@ -425,6 +601,9 @@ def setup_game(team_specs, *, layout_dict, max_rounds=300, rng=None,
         #: Random number generator
         rng=rng,
 
+        #: Precomputed information about the maze
+        layout_index=get_layout_index(layout_dict['walls'], layout_dict['shape']),
+
         #: Timeout length, int, None
         timeout_length=timeout_length,
 
@@ -438,34 +617,15 @@ def setup_game(team_specs, *, layout_dict, max_rounds=300, rng=None,
         controller=viewer_state['controller']
     )
 
-    # Wait until the controller tells us that it is ready
-    # We then can send the initial maze
-    # This call *blocks* until the controller replies
-    if controller_exit(game_state, await_action='set_initial'):
-        return game_state
-
-    # Send maze before team creation.
-    # This gives a more fluent UI as it does not have to wait for the clients
-    # to answer to the server.
-    update_viewers(game_state)
-
-    team_state = setup_teams(team_specs, game_state, store_output=store_output, allow_exceptions=allow_exceptions)
-    game_state.update(team_state)
-
-    # Check if one of the teams has already generate a fatal error
-    # or if the game has finished (might happen if we set it up with max_rounds=0).
-    game_state.update(check_gameover(game_state, detect_final_move=True))
-
-    # Send updated game state with team names to the viewers
-    update_viewers(game_state)
-
-    # exit remote teams in case we are game over
-    check_exit_remote_teams(game_state)
+    if engine == 'array':
+        from .engine import GameState
+        game_state = GameState(game_state)
 
     return game_state
 
 
-def setup_teams(team_specs, game_state, store_output=False, allow_exceptions=False):
+def setup_teams(team_specs, game_state, store_output=False, allow_exceptions=False, launcher=None,
+                transport='tcp'):
     """ Creates the teams according to the `teams`. """
 
     # we start with a dummy zmq_context
@@ -477,41 +637,98 @@ def setup_teams(team_specs, game_state, store_output=False, allow_exceptions=Fal
     # First, create all teams
     # If a team is a RemoteTeam, this will start a subprocess
     for idx, team_spec in enumerate(team_specs):
-        team, zmq_context = make_team(team_spec, idx=idx, zmq_context=zmq_context, store_output=store_output, team_name=game_state['team_names'][idx])
+        team, zmq_context = make_team(team_spec, idx=idx, zmq_context=zmq_context, store_output=store_output,
+                                      team_name=game_state['team_names'][idx], launcher=launcher,
+                                      transport=transport)
         teams.append(team)
 
     # Send the initial state to the teams and await the team name (if the teams are local, the name can be get from the game_state directly
+    # The bot states are prepared in the order of the teams (they draw the seeds
+    # from the game’s rng) but the teams are initialised concurrently, so that
+    # the players load their layouts at the same time. Each request has its own timeout.
+    bot_states = [prepare_bot_state(game_state, idx) for idx in range(len(teams))]
+    with ThreadPoolExecutor(max_workers=len(teams)) as executor:
+        futures = [executor.submit(team.set_initial, idx, bot_state)
+                   for idx, (team, bot_state) in enumerate(zip(teams, bot_states))]
+
+    # The exceptions are not re-raised with `future.result()` here: their
+    # traceback would then reference this frame and keep the teams (and their
+    # zmq context) alive in a reference cycle until the next garbage collection.
     team_names = []
-    for idx, team in enumerate(teams):
+    for idx, future in enumerate(futures):
+        e = future.exception()
+        if e is None:
+            team_name = future.result()
+        elif allow_exceptions or not isinstance(e, (FatalException, PlayerTimeout)):
+            raise e
+        else:
+            team_name = _set_initial_failed(game_state, idx, e)
+        team_names.append(team_name)
+
+    team_state = {
+        'teams': teams,
+        'team_names': team_names
+    }
+    return team_state
+
+
+async def setup_teams_async(team_specs, game_state, store_output=False, allow_exceptions=False, launcher=None,
+                            transport='tcp'):
+    """ Creates the teams like `setup_teams`, but with an `AsyncRemoteTeam`
+    for every remote team. Both teams get their initial state concurrently. """
+    import asyncio
+
+    teams = []
+    for idx, team_spec in enumerate(team_specs):
+        if isinstance(team_spec, str):
+            team = AsyncRemoteTeam(team_spec, idx=idx, store_output=store_output, launcher=launcher,
+                                   transport=transport)
+        else:
+            team, _ = make_team(team_spec, idx=idx, team_name=game_state['team_names'][idx])
+        teams.append(team)
+
+    async def set_initial(idx, team):
         try:
             team_name = team.set_initial(idx, prepare_bot_state(game_state, idx))
+            if inspect.isawaitable(team_name):
+                team_name = await team_name
         except (FatalException, PlayerTimeout) as e:
-            # TODO: Not sure if PlayerTimeout should let the other payer win.
-            # It could simply be a network problem.
             if allow_exceptions:
                 raise
-            exception_event = {
-                'type': e.__class__.__name__,
-                'description': str(e),
-                'turn': idx,
-                'round': None,
-            }
-            game_state['fatal_errors'][idx].append(exception_event)
-            if len(e.args) > 1:
-                game_print(idx, f"{type(e).__name__} ({e.args[0]}): {e.args[1]}")
-                team_name = f"%%%{e.args[0]}%%%"
-            else:
-                game_print(idx, f"{type(e).__name__}: {e}")
-                team_name = "%%%error%%%"
-        team_names.append(team_name)
+            team_name = _set_initial_failed(game_state, idx, e)
+        return team_name
+
+    # The bot states are prepared in the order of the teams,
+    # so that the random seeds are the same as in `setup_teams`
+    team_names = await asyncio.gather(*[set_initial(idx, team) for idx, team in enumerate(teams)])
 
     team_state = {
         'teams': teams,
-        'team_names': team_names
+        'team_names': list(team_names)
     }
     return team_state
 
 
+def _set_initial_failed(game_state, idx, e):
+    """ Adds the error from the set_initial request of team `idx`
+    to the fatal errors and returns a replacement team name. """
+    # TODO: Not sure if PlayerTimeout should let the other payer win.
+    # It could simply be a network problem.
+    exception_event = {
+        'type': e.__class__.__name__,
+        'description': str(e),
+        'turn': idx,
+        'round': None,
+    }
+    game_state['fatal_errors'][idx].append(exception_event)
+    if len(e.args) > 1:
+        game_print(idx, f"{type(e).__name__} ({e.args[0]}): {e.args[1]}")
+        return f"%%%{e.args[0]}%%%"
+    else:
+        game_print(idx, f"{type(e).__name__}: {e}")
+        return "%%%error%%%"
+
+
 def request_new_position(game_state):
     team = game_state['turn'] % 2
     move_fun = game_state['teams'][team]
@@ -530,6 +747,27 @@ def request_new_position(game_state):
     return new_position
 
 
+async def request_new_position_async(game_state):
+    """ Requests the move like `request_new_position`
+    and awaits the reply of an `AsyncRemoteTeam`. """
+    team = game_state['turn'] % 2
+    move_fun = game_state['teams'][team]
+
+    bot_state = prepare_bot_state(game_state)
+
+    start_time = time.monotonic()
+
+    new_position = move_fun.get_move(bot_state)
+    if inspect.isawaitable(new_position):
+        new_position = await new_position
+
+    duration = time.monotonic() - start_time
+    # update the team_time
+    game_state['team_time'][team] += duration
+
+    return new_position
+
+
 def prepare_bot_state(game_state, idx=None):
     """ Prepares the bot’s game state for the current bot.
 
@@ -563,7 +801,8 @@ def prepare_bot_state(game_state, idx=None):
                               enemy_positions=enemy_positions,
                               noise_radius=game_state['noise_radius'],
                               sight_distance=game_state['sight_distance'],
-                              rng=game_state['rng'])
+                              rng=game_state['rng'],
+                              layout_index=game_state.get('layout_index'))
 
 
     # Update noisy_positions in the game_state
@@ -575,8 +814,10 @@ def prepare_bot_state(game_state, idx=None):
             zip(noised_positions['is_noisy'], noised_positions['enemy_positions'])
     ]
     game_state['noisy_positions'][enemy_team::2] = noisy_or_none
-    shaded_food = list(pos for pos, age in game_state['food_age'][own_team].items()
-                       if age > 0)
+    # food lists are sorted so that the bots get the same lists
+    # independent of the engine and the history of the food sets
+    shaded_food = sorted(pos for pos, age in game_state['food_age'][own_team].items()
+                         if age > 0)
 
     team_state = {
         'team_index': own_team,
@@ -586,7 +827,7 @@ def prepare_bot_state(game_state, idx=None):
         'deaths': game_state['deaths'][own_team::2],
         'bot_was_killed': game_state['bot_was_killed'][own_team::2],
         'error_count': len(game_state['errors'][own_team]),
-        'food': list(game_state['food'][own_team]),
+        'food': sorted(game_state['food'][own_team]),
         'shaded_food': shaded_food,
         'name': game_state['team_names'][own_team],
         'team_time': game_state['team_time'][own_team]
@@ -601,7 +842,7 @@ def prepare_bot_state(game_state, idx=None):
         'deaths': game_state['deaths'][enemy_team::2],
         'bot_was_killed': game_state['bot_was_killed'][enemy_team::2],
         'error_count': 0, # TODO. Could be left out for the enemy
-        'food': list(game_state['food'][enemy_team]),
+        'food': sorted(game_state['food'][enemy_team]),
         'shaded_food': [],
         'name': game_state['team_names'][enemy_team],
         'team_time': game_state['team_time'][enemy_team]
@@ -626,14 +867,26 @@ def prepare_bot_state(game_state, idx=None):
     return bot_state
 
 
+#: Keys of the game state that are never sent to the viewers
+_UNSERIALIZABLE_KEYS = {'teams', 'rng', 'viewers', 'controller', 'layout_index'}
+
+
 def update_viewers(game_state):
-    """ Sends the current game_state to the viewers. """
-    viewer_state = prepare_viewer_state(game_state)
-    for viewer in game_state['viewers']:
-        viewer.show_state(viewer_state)
+    """ Sends the current game_state to the viewers.
+
+    Only the viewers which subscribed to the current state receive it and
+    only the fields that they asked for are prepared (see `Subscription`).
+    Viewers with the same `serialization` share the encoded state (see
+    `show_viewer_state`).
+    """
+    viewers = subscribed_viewers(game_state['viewers'], game_state)
+    if not viewers:
+        return
+    viewer_state = prepare_viewer_state(game_state, fields=subscribed_fields(viewers))
+    show_viewer_state(viewers, viewer_state)
 
 
-def prepare_viewer_state(game_state):
+def prepare_viewer_state(game_state, fields=None):
     """ Prepares a state that can be sent to the viewers by removing
     date that cannot be serialized (ie. sockets or keys that
     cannot be used in a json object).
@@ -641,19 +894,29 @@ def prepare_viewer_state(game_state):
     Furthermore, some redundant data is removed when it has
     already been sent at an earlier date.
 
+    Parameters
+    ----------
+    game_state : dict
+       the current game state
+    fields : collection of str, optional
+       only these keys are prepared (all keys if None)
+
     Returns
     -------
     viewer_state : dict
        a new state dict
     """
-    viewer_state = {}
-    viewer_state.update(game_state)
+    # remove unserializable values
+    viewer_state = {key: value for key, value in game_state.items()
+                    if key not in _UNSERIALIZABLE_KEYS and (fields is None or key in fields)}
 
     # Flatten food and food_age
-    viewer_state['food'] = list((viewer_state['food'][0] | viewer_state['food'][1]))
-    # We must transform the food age dict to a list or we cannot serialise it
-    viewer_state['food_age'] = [item for team_food_age in viewer_state['food_age']
-                                          for item in team_food_age.items()]
+    if 'food' in viewer_state:
+        viewer_state['food'] = list((viewer_state['food'][0] | viewer_state['food'][1]))
+    if 'food_age' in viewer_state:
+        # We must transform the food age dict to a list or we cannot serialise it
+        viewer_state['food_age'] = [item for team_food_age in viewer_state['food_age']
+                                              for item in team_food_age.items()]
 
     # game_state["errors"] has a tuple as a dict key
     # that cannot be serialized in json.
@@ -661,25 +924,21 @@ def prepare_viewer_state(game_state):
     # and add another attribute "num_errors"
     # to the final dict.
 
-    # the key for the current round, turn
-    round_turn = (game_state["round"], game_state["turn"])
-    viewer_state["errors"] = [
-        # retrieve the current error or None
-        team_errors.get(round_turn)
-        for team_errors in game_state["errors"]
-    ]
-
-    # add the number of errors
-    viewer_state["num_errors"] = [
-        len(team_errors)
-        for team_errors in game_state["errors"]
-    ]
-
-    # remove unserializable values
-    del viewer_state['teams']
-    del viewer_state['rng']
-    del viewer_state['viewers']
-    del viewer_state['controller']
+    if 'errors' in viewer_state:
+        # the key for the current round, turn
+        round_turn = (game_state["round"], game_state["turn"])
+        viewer_state["errors"] = [
+            # retrieve the current error or None
+            team_errors.get(round_turn)
+            for team_errors in game_state["errors"]
+        ]
+
+    if fields is None or 'num_errors' in fields:
+        # add the number of errors
+        viewer_state["num_errors"] = [
+            len(team_errors)
+            for team_errors in game_state["errors"]
+        ]
 
     return viewer_state
 
@@ -697,6 +956,37 @@ def play_turn(game_state, allow_exceptions=False):
     """
     # TODO: Return a copy of the game_state
 
+    _begin_turn(game_state)
+
+    # request a new move from the current team
+    try:
+        position = _requested_position(game_state, request_new_position(game_state))
+    except (FatalException, NonFatalException) as e:
+        if allow_exceptions:
+            raise
+        position = _turn_failed(game_state, e)
+
+    return _end_turn(game_state, position)
+
+
+async def play_turn_async(game_state, allow_exceptions=False):
+    """ Plays the next turn of the game like `play_turn`,
+    but awaits the move of an `AsyncRemoteTeam`. """
+    _begin_turn(game_state)
+
+    try:
+        position = _requested_position(game_state, await request_new_position_async(game_state))
+    except (FatalException, NonFatalException) as e:
+        if allow_exceptions:
+            raise
+        position = _turn_failed(game_state, e)
+
+    return _end_turn(game_state, position)
+
+
+def _begin_turn(game_state):
+    """ Advances the round and turn counters and updates the food ages for
+    the team that is about to move (the first half of `play_turn`). """
     # if the game is already over, we return a value error
     if game_state['gameover']:
         raise ValueError("Game is already over!")
@@ -704,32 +994,49 @@ def play_turn(game_state, allow_exceptions=False):
     # Now update the round counter
     game_state.update(next_round_turn(game_state))
 
-    turn = game_state['turn']
-    round = game_state['round']
-    team = turn % 2
+    team = game_state['turn'] % 2
 
     # update food age and relocate expired food for the current team
-    game_state.update(update_food_age(game_state, team, SHADOW_DISTANCE))
-    game_state.update(relocate_expired_food(game_state, team, SHADOW_DISTANCE))
+    if isinstance(game_state, dict):
+        game_state.update(update_food_age(game_state, team, SHADOW_DISTANCE))
+        game_state.update(relocate_expired_food(game_state, team, SHADOW_DISTANCE))
+    else:
+        # array-backed game state (see pelita.engine)
+        game_state.update_food_age(team, SHADOW_DISTANCE)
+        game_state.relocate_expired_food(team, SHADOW_DISTANCE)
 
-    # request a new move from the current team
+
+def _requested_position(game_state, position_dict):
+    """ Returns the position in the reply of a team and stores what the bot said.
+
+    Raises
+    ------
+    FatalException
+        if the team reported an exception
+    NonFatalException
+        if the reply does not contain a position
+    """
+    if "error" in position_dict:
+        error_type, error_string = position_dict['error']
+        raise FatalException(f"Exception in client ({error_type}): {error_string}")
     try:
-        position_dict = request_new_position(game_state)
-        if "error" in position_dict:
-            error_type, error_string = position_dict['error']
-            raise FatalException(f"Exception in client ({error_type}): {error_string}")
-        try:
-            position = tuple(position_dict['move'])
-        except TypeError as e:
-            raise NonFatalException(f"Type error {e}")
+        position = tuple(position_dict['move'])
+    except TypeError as e:
+        raise NonFatalException(f"Type error {e}")
 
-        if position_dict.get('say'):
-            game_state['say'][game_state['turn']] = position_dict['say']
-        else:
-            game_state['say'][game_state['turn']] = ""
-    except FatalException as e:
-        if allow_exceptions:
-            raise
+    if position_dict.get('say'):
+        game_state['say'][game_state['turn']] = position_dict['say']
+    else:
+        game_state['say'][game_state['turn']] = ""
+    return position
+
+
+def _turn_failed(game_state, e):
+    """ Adds the exception from the move request to the errors
+    of the current team. The bot does not get a position (None). """
+    turn = game_state['turn']
+    team = turn % 2
+    if isinstance(e, FatalException):
         # FatalExceptions (such as PlayerDisconnect) should immediately
         # finish the game
         exception_event = {
@@ -739,20 +1046,24 @@ def play_turn(game_state, allow_exceptions=False):
             'round': game_state['round'],
         }
         game_state['fatal_errors'][team].append(exception_event)
-        position = None
-        game_print(turn, f"{type(e).__name__}: {e}")
-    except NonFatalException as e:
-        if allow_exceptions:
-            raise
+    else:
         # NonFatalExceptions (such as Timeouts and ValueErrors in the JSON handling)
         # are collected and added to team_errors
         exception_event = {
             'type': e.__class__.__name__,
             'description': str(e)
         }
-        game_state['errors'][team][(round, turn)] = exception_event
-        position = None
-        game_print(turn, f"{type(e).__name__}: {e}")
+        game_state['errors'][team][(game_state['round'], turn)] = exception_event
+    game_print(turn, f"{type(e).__name__}: {e}")
+    return None
+
+
+def _end_turn(game_state, position):
+    """ Applies the requested `position` of the current bot, checks for game over
+    and informs the viewers (the second half of `play_turn`). """
+    turn = game_state['turn']
+    round = game_state['round']
+    team = turn % 2
 
     # If the returned move looks okay, we add it to the list of requested moves
     old_position = game_state['bots'][turn]
@@ -814,6 +1125,10 @@ def apply_move(gamestate, bot_position):
         state of the game after applying current turn
 
     """
+    if not isinstance(gamestate, dict):
+        # array-backed game state (see pelita.engine)
+        return gamestate.apply_move(bot_position)
+
     # TODO is a timeout counted as an error?
     # define local variables
     bots = gamestate["bots"]
@@ -836,8 +1151,10 @@ def apply_move(gamestate, bot_position):
     # previous errors
     team_errors = gamestate["errors"][team]
 
+    layout_index = gamestate.get('layout_index') or get_layout_index(walls, shape)
+
     # the allowed moves for the current bot
-    legal_positions = get_legal_positions(walls, shape, gamestate["bots"][gamestate["turn"]])
+    legal_positions = layout_index.get_legal_positions(gamestate["bots"][gamestate["turn"]])
 
     # unless we have already made an error, check if we made a legal move
     if (n_round, turn) not in team_errors:
@@ -889,7 +1206,7 @@ def apply_move(gamestate, bot_position):
         for enemy_idx in killed_enemies:
             _logger.info(f"Bot {turn} eats enemy bot {enemy_idx} at {bot_position}.")
             score[team] = score[team] + KILL_POINTS
-            init_positions = initial_positions(walls, shape)
+            init_positions = layout_index.initial_positions
             bots[enemy_idx] = init_positions[enemy_idx]
             kills[turn] += 1
             deaths[enemy_idx] += 1
@@ -901,7 +1218,7 @@ def apply_move(gamestate, bot_position):
         if len(enemies_on_target) > 0:
             _logger.info(f"Bot {turn} was eaten by bots {enemies_on_target} at {bot_position}.")
             score[1 - team] = score[1 - team] + KILL_POINTS
-            init_positions = initial_positions(walls, shape)
+            init_positions = layout_index.initial_positions
             bots[turn] = init_positions[turn]
             deaths[turn] += 1
             kills[enemies_on_target[0]] += 1
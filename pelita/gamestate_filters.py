@@ -1,8 +1,9 @@
 """ collecting the game state filter functions """
 from .base_utils import default_rng
+from .layout import get_layout_index
 
 
-def noiser(walls, shape, bot_position, enemy_positions, noise_radius=5, sight_distance=5, rng=None):
+def noiser(walls, shape, bot_position, enemy_positions, noise_radius=5, sight_distance=5, rng=None, layout_index=None):
     """Function to make bot positions noisy in a game state.
 
     Applies uniform noise in maze space. Noise will only be applied if the
@@ -40,6 +41,8 @@ def noiser(walls, shape, bot_position, enemy_positions, noise_radius=5, sight_di
         the distance at which noise is no longer applied.
     rng : Random, optional
         the game’s random number generator (or None for an independent one)
+    layout_index : LayoutIndex, optional
+        the layout index of the maze, used to cache the possible noisy positions
 
     Returns
     -------
@@ -63,7 +66,7 @@ def noiser(walls, shape, bot_position, enemy_positions, noise_radius=5, sight_di
 
         if cur_distance is None or cur_distance > sight_distance:
             # If so then alter the position of the enemy
-            new_pos, noisy_flag = alter_pos(b, noise_radius, rng, walls, shape)
+            new_pos, noisy_flag = alter_pos(b, noise_radius, rng, walls, shape, layout_index=layout_index)
             noised_positions[count] = new_pos
             is_noisy[count] = noisy_flag
         else:
@@ -73,9 +76,35 @@ def noiser(walls, shape, bot_position, enemy_positions, noise_radius=5, sight_di
     return { "enemy_positions": noised_positions, "is_noisy": is_noisy }
 
 
-def alter_pos(bot_pos, noise_radius, rng, walls, shape):
+def alter_pos(bot_pos, noise_radius, rng, walls, shape, layout_index=None):
     """ alter the position """
 
+    if layout_index is not None:
+        possible_positions = layout_index.noise_positions(bot_pos, noise_radius)
+    else:
+        possible_positions = noise_positions(bot_pos, noise_radius, walls, shape)
+
+    if len(possible_positions) < 1:
+        # this should not happen
+        # anyway. return the bot’s current position
+        # TODO: Should probably raise?
+        final_pos = bot_pos
+        noisy = False
+    elif len(possible_positions) == 1:
+        final_pos = possible_positions[0]
+        noisy = False
+    else:
+        # select a random position
+        final_pos = rng.choice(possible_positions)
+        noisy = True
+
+    # return the final_pos and a flag if it is noisy or not
+    return (final_pos, noisy)
+
+
+def noise_positions(bot_pos, noise_radius, walls, shape):
+    """ Returns all positions that a bot at `bot_pos` may be shown at when noise is applied. """
+
     # get a list of possible positions
     x_min, x_max = bot_pos[0] - noise_radius, bot_pos[0] + noise_radius
     y_min, y_max = bot_pos[1] - noise_radius, bot_pos[1] + noise_radius
@@ -97,23 +126,8 @@ def alter_pos(bot_pos, noise_radius, rng, walls, shape):
         if manhattan_dist((i, j), bot_pos) <= noise_radius
         and (i, j) not in walls # check that the bot won't returned as positioned on a wall square
     ]
+    return possible_positions
 
-    if len(possible_positions) < 1:
-        # this should not happen
-        # anyway. return the bot’s current position
-        # TODO: Should probably raise?
-        final_pos = bot_pos
-        noisy = False
-    elif len(possible_positions) == 1:
-        final_pos = possible_positions[0]
-        noisy = False
-    else:
-        # select a random position
-        final_pos = rng.choice(possible_positions)
-        noisy = True
-
-    # return the final_pos and a flag if it is noisy or not
-    return (final_pos, noisy)
 
 def in_homezone(position, team_id, shape):
     boundary = shape[0] / 2
@@ -150,32 +164,31 @@ def relocate_expired_food(game_state, team, radius, max_food_age=None):
     enemy_bots = game_state['bots'][1-team::2]
     food = [set(team_food) for team_food in game_state['food']]
     food_age = [dict(team_food_age) for team_food_age in game_state['food_age']]
-    width, height = game_state['shape']
-    walls = game_state['walls']
     rng = game_state['rng']
     if max_food_age is None:
         max_food_age = game_state['max_food_age']
 
-    # generate a set of possible positions to relocate food:
+    if not any(food_age[team].get(pellet, 0) > max_food_age for pellet in food[team]):
+        # nothing to relocate
+        return {'food' : food, 'food_age' : food_age}
+
+    layout_index = game_state.get('layout_index') or get_layout_index(game_state['walls'], game_state['shape'])
+
+    # generate a list of possible positions to relocate food:
     #  - in the bot's homezone
     #  - not a wall
+    #  - not on the border
+    #  (these are precomputed in the layout index)
     #  - not on a already present food pellet
     #  - not on a bot
-    #  - not on the border
     #  - not within the shadow of a bot
-    home_width = width // 2
-    left_most_x = home_width * team
-    targets = { (x, y) for x in range(left_most_x, left_most_x+home_width) # this line and the next define the homezone
-                       for y in range(height)
-                       if (x not in (home_width, home_width - 1) # this excludes the border
-                           and manhattan_dist(bots[0], (x, y)) > radius # this line and the next excludes the team's bots and their shadows
-                           and manhattan_dist(bots[1], (x, y)) > radius )
-              }
-    targets = targets.difference(walls) # remove the walls
-    targets = targets.difference(food[team]) # remove the team's food
-    targets = targets.difference(enemy_bots) # remove the enemy bots
-    # now convert to a list and sort, so that we have reproducibility (sets are unordered)
-    targets = sorted(list(targets))
+    # the homezone is sorted, so that we have reproducibility
+    targets = [pos for pos in layout_index.inner_homezones[team]
+               if (manhattan_dist(bots[0], pos) > radius # this line and the next excludes the team's bots and their shadows
+                   and manhattan_dist(bots[1], pos) > radius
+                   and pos not in food[team] # remove the team's food
+                   and pos not in enemy_bots) # remove the enemy bots
+              ]
     for pellet in sorted(list(food[team])):
         # We move the pellet if it is in the food_age dict and exceeds the max_food_age
         if food_age[team].get(pellet, 0) > max_food_age:
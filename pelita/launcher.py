@@ -0,0 +1,724 @@
+""" Starting the processes of remote players.
+
+A `RemoteTeam` binds a zmq.PAIR socket and then asks a launcher to start a
+player for its team spec which connects to that socket. The launchers are:
+
+`SubprocessLauncher`
+    starts a new `pelita_player` process for every team (the default)
+
+`PlayerPool`
+    keeps long-lived player processes around and hands them new games, so
+    that the interpreter start and the imports are only paid once per team
+    (and again when the team’s source changes)
+
+`ForkServer`
+    forks the players of the preloaded teams from a process which has
+    already imported pelita, zmq, numpy, networkx and the team modules
+
+`PoolClient`
+    forwards the launch requests to a `PlayerPool` in another process
+    (see `PlayerPool.serve`)
+
+`ThreadLauncher`
+    runs the players in threads of the game process (connected over
+    inproc sockets)
+
+A launcher has a single method `launch(team_spec, address, *, color, store_output)`
+which returns a handle for the player. The handle has a method `release()`,
+which is called when the game of the player is over, and a method
+`terminate()` to stop the player.
+"""
+
+import contextlib
+import hashlib
+import hmac
+import json
+import logging
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from pathlib import Path
+
+import zmq
+
+from .network import bind_socket, local_address, remove_address
+
+_logger = logging.getLogger(__name__)
+
+#: The module that runs a remote player
+PLAYER_MODULE = 'pelita.scripts.pelita_player'
+
+
+def hash_files(paths):
+    """ Returns a hash of the contents of the files at `paths` (in the given
+    order). A file that is missing changes the hash as well.
+
+    With the files of the modules that a team has imported (see
+    `pelita.scripts.pelita_player.team_module_files`), this tells whether
+    a loaded team is still up to date.
+    """
+    sha1 = hashlib.sha1()
+    for path in paths:
+        try:
+            sha1.update(Path(path).read_bytes())
+        except OSError:
+            sha1.update(f"missing: {path}".encode())
+    return sha1.hexdigest()
+
+
+def _resolve_team_spec(team_spec):
+    """ Returns the absolute path of a team spec which is a local file or
+    folder (the `.py` suffix may be omitted). Other specs (remote
+    `pelita://` teams, modules) are returned as they are. """
+    if team_spec.startswith('pelita://'):
+        return team_spec
+    if Path(team_spec).exists() or Path(f"{team_spec}.py").exists():
+        return str(Path(team_spec).resolve())
+    return team_spec
+
+
+def output_paths(store_output, team_spec, color=''):
+    """ Returns the paths of the files for stdout and stderr of a player
+    (or None) for the given `store_output` value. """
+    if store_output == subprocess.DEVNULL:
+        return os.devnull, None
+    elif store_output:
+        store_path = Path(store_output)
+        return (str(store_path / f"{color or team_spec}.out"),
+                str(store_path / f"{color or team_spec}.err"))
+    else:
+        return None, None
+
+
+class PlayerProcess(namedtuple('PlayerProcess', ['proc', 'stdout', 'stderr'], defaults=[None, None])):
+    """ Handle for a player running in its own subprocess
+    and the files its output is written to. """
+
+    def release(self):
+        pass
+
+    def terminate(self):
+        self.proc.terminate()
+
+
+class SubprocessLauncher:
+    """ Starts a new `pelita_player` process for every team. """
+
+    def launch(self, team_spec, address, *, color='', store_output=False):
+        """ Starts another process with the same Python executable,
+        the same start script (pelitagame) and runs `team_spec`
+        as a standalone client on URL `address`.
+        """
+        external_call = [sys.executable,
+                         '-m',
+                         PLAYER_MODULE,
+                         'remote-game',
+                         team_spec,
+                         address]
+
+        _logger.debug("Executing: %r", external_call)
+        if store_output == subprocess.DEVNULL:
+            return PlayerProcess(subprocess.Popen(external_call, stdout=store_output))
+        elif store_output:
+            stdout_path, stderr_path = output_paths(store_output, team_spec, color)
+            stdout = open(stdout_path, 'w')
+            stderr = open(stderr_path, 'w')
+
+            # We must run in unbuffered mode to enforce flushing of stdout/stderr,
+            # otherwise we may lose some of what is printed
+            proc = subprocess.Popen(external_call, stdout=stdout, stderr=stderr,
+                                    env=dict(os.environ, PYTHONUNBUFFERED='x'))
+            return PlayerProcess(proc, stdout, stderr)
+        else:
+            return PlayerProcess(subprocess.Popen(external_call))
+
+
+class PlayerThread:
+    """ Handle for a player that runs in a thread of the game process. """
+    def __init__(self, thread):
+        self.thread = thread
+
+    def release(self):
+        # the player returns after the exit message
+        self.thread.join(timeout=1)
+
+    def terminate(self):
+        # A thread cannot be stopped from the outside. A player that does
+        # not return from its move function stays around as a daemon thread.
+        pass
+
+
+class ThreadLauncher:
+    """ Runs the players in threads of the game process.
+
+    The players and the game communicate over the same zmq protocol as
+    with a subprocess, but with inproc sockets of the global zmq context
+    (`zmq.Context.instance()`), which a `RemoteTeam` with transport
+    'inproc' also uses. Every team spec is only loaded once and a new
+    `Team` is made from its move function for every game.
+
+    The players are not isolated from the game: they share the interpreter
+    (and the GIL), their output cannot be stored and a move that does not
+    return cannot be interrupted. This is meant for trusted teams, in tests
+    and benchmarks.
+    """
+    _instance = None
+
+    def __init__(self):
+        self.zmq_context = zmq.Context.instance()
+        self._teams = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def instance(cls):
+        """ Returns a global ThreadLauncher (a module file can
+        only be loaded once per process). """
+        if cls._instance is None:
+            cls._instance = cls()
+        return cls._instance
+
+    def launch(self, team_spec, address, *, color='', store_output=False):
+        thread = threading.Thread(target=self._run, args=(team_spec, address),
+                                  name=f"pelita-player-{color or team_spec}", daemon=True)
+        thread.start()
+        return PlayerThread(thread)
+
+    def _load_team(self, team_spec):
+        from .scripts.pelita_player import load_team
+        from .team import Team
+
+        with self._lock:
+            if team_spec not in self._teams:
+                self._teams[team_spec] = load_team(team_spec)
+            team = self._teams[team_spec]
+        return Team(team._team_move, team_name=team.team_name)
+
+    def _run(self, team_spec, address):
+        from .scripts.pelita_player import reply_load_error, run_player
+
+        try:
+            team = self._load_team(team_spec)
+        except Exception as e:
+            socket = self.zmq_context.socket(zmq.PAIR)
+            socket.connect(address)
+            try:
+                reply_load_error(socket, team_spec, address, e)
+            finally:
+                socket.close()
+            return
+        run_player(team_spec, address, team=team, zmq_context=self.zmq_context)
+
+
+class ForkedPlayer:
+    """ Handle for a player that has been forked by a `ForkServer`. """
+    def __init__(self, pid):
+        self.pid = pid
+
+    def release(self):
+        pass
+
+    def terminate(self):
+        try:
+            os.kill(self.pid, signal.SIGTERM)
+        except ProcessLookupError:
+            # the player has already exited
+            pass
+
+
+class ForkServer:
+    """ Forks the remote players from a process which has already imported
+    everything a player needs.
+
+    The fork server (a `pelita_player fork-server` process) imports pelita,
+    zmq, numpy and networkx and the teams in `preload` once. Every player of
+    a preloaded team is then forked from it instead of starting a new
+    interpreter. The players are still separate processes with their own
+    output files. When a preloaded team changes on disk, the fork server is
+    restarted.
+
+    All other teams (and the preloaded teams which could not be loaded) are
+    started with the `SubprocessLauncher`: a forked player already has the
+    modules of the preloaded teams, so that a team with the same module name
+    (e.g. another version of the same team) could not be loaded there. The
+    same holds on platforms without `os.fork`.
+
+        with ForkServer(preload=["team1/"]) as fork_server:
+            for seed in range(100):
+                run_game(["team1/", "team2/"], layout_dict=layout, rng=seed, launcher=fork_server)
+
+    Parameters
+    ----------
+    preload : list of str
+        the team specs to load in the fork server
+    """
+    def __init__(self, preload=()):
+        self.preload = list(preload)
+        self._proc = None
+        self._reply = None
+        # the source files and their hash for every preloaded team
+        self._preloaded = {}
+        self._lock = threading.Lock()
+
+    def start(self):
+        """ Starts the fork server (done automatically by `launch`). """
+        reply_r, reply_w = os.pipe()
+        preload = [arg for team_spec in self.preload for arg in ('--preload', team_spec)]
+        external_call = [sys.executable,
+                         '-m',
+                         PLAYER_MODULE,
+                         'fork-server',
+                         str(reply_w),
+                         *preload]
+        _logger.debug("Executing: %r", external_call)
+        try:
+            # unbuffered, so that the output of the players is not lost
+            self._proc = subprocess.Popen(external_call, stdin=subprocess.PIPE, pass_fds=(reply_w,),
+                                          text=True, env=dict(os.environ, PYTHONUNBUFFERED='x'))
+        finally:
+            os.close(reply_w)
+        self._reply = os.fdopen(reply_r, 'r')
+        # the fork server reports the teams it has loaded
+        reply = self._reply.readline()
+        if not reply:
+            self.close()
+            raise RuntimeError("The fork server has exited.")
+        self._preloaded = json.loads(reply)['preloaded']
+
+    def launch(self, team_spec, address, *, color='', store_output=False):
+        """ Forks a new player for `team_spec` which connects to `address`. """
+        if not hasattr(os, 'fork') or team_spec not in self.preload:
+            return SubprocessLauncher().launch(team_spec, address, color=color, store_output=store_output)
+
+        stdout, stderr = output_paths(store_output, team_spec, color)
+        if stdout is not None:
+            stdout = os.path.abspath(stdout)
+        if stderr is not None:
+            stderr = os.path.abspath(stderr)
+        with self._lock:
+            if self._proc is not None and self._outdated():
+                _logger.info("Restarting the fork server as a preloaded team has changed.")
+                self.close()
+            if self._proc is None:
+                self.start()
+            preloaded = team_spec in self._preloaded
+            if preloaded:
+                try:
+                    self._proc.stdin.write(json.dumps({
+                        'team_spec': team_spec,
+                        'address': address,
+                        'stdout': stdout,
+                        'stderr': stderr,
+                    }) + '\n')
+                    self._proc.stdin.flush()
+                    reply = self._reply.readline()
+                except BrokenPipeError:
+                    reply = ''
+                if not reply:
+                    self.close()
+                    raise RuntimeError("The fork server has exited.")
+        if not preloaded:
+            _logger.debug("%s could not be preloaded. Starting a new process.", team_spec)
+            return SubprocessLauncher().launch(team_spec, address, color=color, store_output=store_output)
+
+        pid = json.loads(reply)['pid']
+        _logger.debug("Forked player %d for %s on %s.", pid, team_spec, address)
+        return ForkedPlayer(pid)
+
+    def _outdated(self):
+        return any(hash_files(team['files']) != team['hash']
+                   for team in self._preloaded.values())
+
+    def close(self):
+        """ Stops the fork server. Running players are not affected. """
+        if self._proc is None:
+            return
+        try:
+            self._proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        try:
+            self._proc.wait(3)
+        except subprocess.TimeoutExpired:
+            self._proc.kill()
+            self._proc.wait()
+        self._reply.close()
+        self._proc = None
+        self._reply = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return f"ForkServer<preload={self.preload!r}>"
+
+
+class _PoolWorker:
+    """ A long-lived `pelita_player pool-worker` process and its control socket. """
+    def __init__(self, context, team_spec, key):
+        self.key = key
+        self.control = context.socket(zmq.PAIR)
+        self.control.setsockopt(zmq.LINGER, 0)
+        port = self.control.bind_to_random_port('tcp://127.0.0.1')
+        external_call = [sys.executable,
+                         '-m',
+                         PLAYER_MODULE,
+                         'pool-worker',
+                         team_spec,
+                         f'tcp://127.0.0.1:{port}']
+        _logger.debug("Executing: %r", external_call)
+        # unbuffered, so that the output of a game ends up in its files
+        self.proc = subprocess.Popen(external_call, env=dict(os.environ, PYTHONUNBUFFERED='x'))
+        #: True while the worker plays a game
+        self.busy = False
+        #: The time when the team of the current game has been terminated
+        self.released_at = None
+        #: The number of games the worker has been given
+        self.games = 0
+        #: The source files of the loaded team and their hash
+        self.files = None
+        self.files_hash = None
+        self._closed = False
+
+    @property
+    def alive(self):
+        return not self._closed and self.proc.poll() is None
+
+    def play(self, address, stdout, stderr):
+        self.control.send_json({
+            'action': 'play',
+            'address': address,
+            'stdout': stdout,
+            'stderr': stderr,
+        })
+        self.busy = True
+        self.released_at = None
+        self.games += 1
+
+    def update(self):
+        """ Processes the status messages from the worker. """
+        while self.control.poll(0):
+            message = self.control.recv_json()
+            status = message.get('status')
+            if status == 'loaded':
+                self.files = message['files']
+                self.files_hash = message['hash']
+            elif status == 'done':
+                self.busy = False
+                self.released_at = None
+            elif status == 'failed':
+                # the team could not be loaded
+                self.kill()
+                return
+
+    def outdated(self):
+        """ Checks if the source of the loaded team has changed. """
+        return self.files is not None and hash_files(self.files) != self.files_hash
+
+    def wait(self, timeout):
+        """ Waits up to `timeout` seconds for the worker to finish its game. """
+        if self.alive and self.control.poll(timeout * 1000):
+            self.update()
+
+    def close(self):
+        if self.alive:
+            try:
+                self.control.send_json({'action': 'exit'}, zmq.NOBLOCK)
+            except zmq.ZMQError:
+                pass
+            try:
+                self.proc.wait(1)
+            except subprocess.TimeoutExpired:
+                self.proc.terminate()
+        self._closed = True
+        self.control.close()
+
+    def kill(self):
+        if self.alive:
+            self.proc.terminate()
+        self._closed = True
+        self.control.close()
+
+
+class PooledPlayer:
+    """ Handle for a game played by a worker of a `PlayerPool`. """
+    def __init__(self, pool, worker):
+        self.pool = pool
+        self.worker = worker
+        #: the number of the game of the worker
+        self.game = worker.games
+
+    @property
+    def proc(self):
+        return self.worker.proc
+
+    def release(self):
+        self.pool._release(self.worker, self.game)
+
+    def terminate(self):
+        # The worker is not terminated but returned to the pool
+        self.pool._release(self.worker, self.game)
+
+
+class PlayerPool:
+    """ A pool of long-lived player processes that are reused across games.
+
+    Every worker process loads its team once and then plays the games that
+    it is handed by the pool. Before every game, `Team.set_initial` resets the
+    team’s state, its random number generator and the bot tracks. Note that
+    module-level state of the team’s code is kept between games.
+
+    Every worker reports the source files of the modules that its team has
+    imported. When one of them has changed, the worker is replaced by a
+    fresh one. When a game is abandoned
+    without being finished, its worker is terminated after `release_timeout`
+    seconds.
+
+    Use it as a launcher for remote teams:
+
+        with PlayerPool() as pool:
+            for seed in range(100):
+                run_game(["team1/", "team2/"], layout_dict=layout, rng=seed, launcher=pool)
+
+    Parameters
+    ----------
+    release_timeout : float
+        time in seconds that an abandoned game may take to finish
+    """
+    def __init__(self, release_timeout=3):
+        self.release_timeout = release_timeout
+        self._context = zmq.Context()
+        self._workers = []
+        # launch may be called from the thread of `serve`
+        self._lock = threading.Lock()
+        self._server = None
+        self._closed = False
+
+    def launch(self, team_spec, address, *, color='', store_output=False):
+        """ Hands a new game on `address` to an idle worker for `team_spec`
+        (starting a new worker if needed). """
+        key = team_spec
+        stdout, stderr = output_paths(store_output, team_spec, color)
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("PlayerPool has been closed.")
+            self._update(key)
+            worker = next((w for w in self._workers if w.key == key and not w.busy), None)
+            if worker is None:
+                # A worker whose game has just ended will be ready soon
+                for released in self._workers:
+                    if released.key == key and released.released_at is not None:
+                        released.wait(self.release_timeout)
+                        if released.alive and not released.busy and not released.outdated():
+                            worker = released
+                            break
+            if worker is None:
+                worker = _PoolWorker(self._context, team_spec, key)
+                self._workers.append(worker)
+            _logger.debug("Worker %d plays game %d at %s.", worker.proc.pid, worker.games + 1, address)
+            worker.play(address, stdout, stderr)
+        return PooledPlayer(self, worker)
+
+    def _update(self, key=None):
+        """ Updates the status of all workers and removes dead, abandoned and
+        outdated workers. Must be called with the lock held. """
+        now = time.monotonic()
+        for worker in list(self._workers):
+            if worker.alive:
+                worker.update()
+            if not worker.alive:
+                _logger.debug("Removing dead worker %d.", worker.proc.pid)
+                worker.kill()
+                self._workers.remove(worker)
+            elif worker.busy and worker.released_at is not None and now - worker.released_at > self.release_timeout:
+                _logger.info("Terminating worker %d which did not finish its game.", worker.proc.pid)
+                worker.kill()
+                self._workers.remove(worker)
+            elif key is not None and not worker.busy and worker.key == key and worker.outdated():
+                _logger.info("Closing worker %d for %s as the team has changed.", worker.proc.pid, key)
+                worker.close()
+                self._workers.remove(worker)
+
+    def _release(self, worker, game):
+        with self._lock:
+            # the worker may already be playing its next game
+            if worker.busy and worker.games == game and worker.released_at is None:
+                worker.released_at = time.monotonic()
+
+    @property
+    def num_workers(self):
+        """ The number of worker processes. """
+        with self._lock:
+            self._update()
+            return len(self._workers)
+
+    def serve(self, team_specs, *, output_dir=None, address=None):
+        """ Accepts launch requests from `PoolClient`s in other processes.
+
+        The requests are handled in a background thread. As the pool runs
+        the code of the teams, it only accepts requests which carry a random
+        token (which is part of the returned address), only for the given
+        team specs and only with output files in `output_dir`.
+
+        Parameters
+        ----------
+        team_specs : list of str
+            the team specs that the clients may launch
+        output_dir : str or Path, optional
+            the folder in which the clients may store the output of the
+            players (none if not given)
+        address : str, optional
+            the address to bind to (default: an ipc socket in a private
+            temporary folder or, if ipc is not available, tcp://127.0.0.1)
+
+        Returns
+        -------
+        address : str
+            the address to pass to `PoolClient`
+        """
+        if address is None:
+            address = local_address('ipc' if zmq.has('ipc') else 'tcp')
+        served_specs = {_resolve_team_spec(team_spec) for team_spec in team_specs}
+        if output_dir is not None:
+            output_dir = Path(output_dir).resolve()
+        token = secrets.token_hex(16)
+
+        socket = self._context.socket(zmq.REP)
+        socket.setsockopt(zmq.LINGER, 0)
+        bound_address = bind_socket(socket, address)
+        self._server = threading.Thread(target=self._serve,
+                                        args=(socket, bound_address, token, served_specs, output_dir),
+                                        daemon=True)
+        self._server.start()
+        return f"{bound_address}#{token}"
+
+    def _serve(self, socket, address, token, served_specs, output_dir):
+        try:
+            while not self._closed:
+                if not socket.poll(100):
+                    continue
+                # every request must get a reply, or the REP socket is stuck
+                try:
+                    reply = self._handle_request(socket.recv_json(), token, served_specs, output_dir)
+                except Exception as e:
+                    _logger.warning("Could not handle pool request: %r", e)
+                    reply = {'error': repr(e)}
+                socket.send_json(reply)
+        finally:
+            socket.close()
+            remove_address(address)
+
+    def _handle_request(self, request, token, served_specs, output_dir):
+        """ Handles a request of a `PoolClient` and returns the reply. """
+        if not isinstance(request, dict):
+            raise ValueError(f"Invalid request {request!r}.")
+        if not hmac.compare_digest(str(request.get('token')).encode(), token.encode()):
+            raise PermissionError("Invalid token.")
+        if request.get('action') == 'release':
+            pid, game = request['worker'], request['game']
+            with self._lock:
+                workers = [w for w in self._workers if w.proc.pid == pid]
+            for worker in workers:
+                self._release(worker, game)
+            return {'ok': True}
+
+        team_spec = request['team_spec']
+        if team_spec not in served_specs:
+            raise PermissionError(f"Team {team_spec!r} is not served by this pool.")
+        color = request.get('color', '')
+        store_output = request.get('store_output', False)
+        if store_output not in (False, None, subprocess.DEVNULL):
+            if not isinstance(store_output, str):
+                raise ValueError(f"Invalid store_output {store_output!r}.")
+            for path in output_paths(store_output, team_spec, color):
+                if output_dir is None or not Path(path).resolve().is_relative_to(output_dir):
+                    raise PermissionError(f"Output path {path!r} is not in the output folder of this pool.")
+        player = self.launch(team_spec, request['address'], color=color, store_output=store_output)
+        return {'ok': True, 'worker': player.proc.pid, 'game': player.game}
+
+    def close(self):
+        """ Stops all workers. """
+        with self._lock:
+            self._closed = True
+            for worker in self._workers:
+                worker.close()
+            self._workers = []
+        if self._server is not None:
+            self._server.join()
+        self._context.term()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __repr__(self):
+        return f"PlayerPool<{len(self._workers)} workers>"
+
+
+class _RemoteHandle:
+    """ Handle for a player that has been started by a served `PlayerPool`. """
+    def __init__(self, client, worker, game):
+        self.client = client
+        self.worker = worker
+        self.game = game
+
+    def release(self):
+        try:
+            self.client._request({'action': 'release', 'worker': self.worker, 'game': self.game})
+        except RuntimeError:
+            # the worker is released by the pool after a timeout anyway
+            pass
+
+    def terminate(self):
+        self.release()
+
+
+class PoolClient:
+    """ Launches players through a `PlayerPool` that is served (see
+    `PlayerPool.serve`) by another process.
+
+    Parameters
+    ----------
+    address : str
+        the address returned by `PlayerPool.serve` (including its token)
+    timeout : float
+        time in seconds to wait for the pool to reply
+    """
+    def __init__(self, address, timeout=5):
+        self.address, _, self._token = address.partition('#')
+        self.timeout = timeout
+
+    def launch(self, team_spec, address, *, color='', store_output=False):
+        # the pool may run in another working directory
+        team_spec = _resolve_team_spec(team_spec)
+        if isinstance(store_output, (str, Path)):
+            store_output = str(Path(store_output).resolve())
+        reply = self._request({
+            'action': 'launch',
+            'team_spec': team_spec,
+            'address': address,
+            'color': color,
+            'store_output': store_output,
+        })
+        if 'error' in reply:
+            raise RuntimeError(f"Player pool could not launch {team_spec}: {reply['error']}")
+        return _RemoteHandle(self, reply['worker'], reply['game'])
+
+    def _request(self, request):
+        context = zmq.Context.instance()
+        with contextlib.closing(context.socket(zmq.REQ)) as socket:
+            socket.setsockopt(zmq.LINGER, 0)
+            socket.connect(self.address)
+            socket.send_json({**request, 'token': self._token})
+            if not socket.poll(self.timeout * 1000):
+                raise RuntimeError(f"Player pool at {self.address} did not reply.")
+            return socket.recv_json()
@@ -1,4 +1,6 @@
 
+import functools
+import hashlib
 import io
 
 # bot to index conversion
@@ -328,3 +330,310 @@ def get_legal_positions(walls, shape, bot_position):
     potential_moves = [(i[0] + bot_position[0], i[1] + bot_position[1]) for i in directions]
     possible_moves = [i for i in potential_moves if i not in walls]
     return possible_moves
+
+
+class Walls(tuple):
+    """ The walls of a maze as a sorted tuple of positions.
+
+    Walls behaves like the sorted tuple of wall positions that has been used
+    before (iteration order, indexing, comparison), but membership tests are
+    set lookups instead of a linear scan. It additionally offers a packed
+    grid of the maze for fast `is_wall` and neighbour queries.
+
+    Parameters
+    ----------
+    walls : iterable of (int, int)
+        the positions of the walls
+    shape : (int, int), optional
+        the shape of the maze. If not given, it is derived from the walls.
+
+    Attributes
+    ----------
+    shape : (int, int)
+        the shape of the maze
+    """
+    def __new__(cls, walls, shape=None):
+        self = super().__new__(cls, sorted(tuple(pos) for pos in walls))
+        self._set = frozenset(self)
+        self.shape = tuple(shape) if shape is not None else wall_dimensions(self)
+        width, height = self.shape
+        # one byte per position, column-major as in [x, y]
+        grid = bytearray(width * height)
+        for x, y in self:
+            grid[x * height + y] = 1
+        self._grid = bytes(grid)
+        return self
+
+    def __getnewargs__(self):
+        return (tuple(self), self.shape)
+
+    def __contains__(self, pos):
+        try:
+            return pos in self._set
+        except TypeError:
+            # unhashable positions (like lists) are never equal to a wall tuple
+            return False
+
+    def is_wall(self, x, y):
+        """ Returns True if there is a wall at (x, y).
+
+        Positions outside of the maze are considered walls.
+        """
+        width, height = self.shape
+        if not (0 <= x < width and 0 <= y < height):
+            return True
+        return self._grid[x * height + y] == 1
+
+    def neighbors(self, pos):
+        """ Returns the free positions next to `pos`
+        (in the order north, east, west, south). """
+        x, y = pos
+        return [(nx, ny) for nx, ny in ((x, y - 1), (x + 1, y), (x - 1, y), (x, y + 1))
+                if not self.is_wall(nx, ny)]
+
+    @property
+    def grid(self):
+        """ The maze as a read-only NumPy array of booleans, indexed by [x, y],
+        which is True for walls. """
+        import numpy as np
+        grid = np.frombuffer(self._grid, dtype=bool).reshape(self.shape)
+        return grid
+
+
+#: The number of LayoutIndex objects that are cached per process
+LAYOUT_INDEX_CACHE_SIZE = 128
+
+
+def layout_hash(walls, shape):
+    """ Returns a hash (as a hex string) that identifies a maze by its walls and shape.
+
+    The hash does not depend on the order of the walls.
+    """
+    sha1 = hashlib.sha1()
+    sha1.update(repr(tuple(shape)).encode())
+    sha1.update(repr(tuple(sorted(tuple(pos) for pos in walls))).encode())
+    return sha1.hexdigest()
+
+
+class LayoutIndex:
+    """ Information about a maze that does not change during a game.
+
+    A LayoutIndex is built once for the walls and shape of a maze and then
+    shared by the game engine, the game state filters and the teams. Use
+    `get_layout_index` to get a cached instance.
+
+    Parameters
+    ----------
+    walls : iterable of (int, int)
+        the positions of the walls
+    shape : (int, int)
+        the shape of the maze
+
+    Attributes
+    ----------
+    walls : Walls
+        the sorted positions of the walls
+    wall_set : frozenset of (int, int)
+        the positions of the walls for fast lookups
+    shape : (int, int)
+        the shape of the maze
+    legal_positions : dict of (int, int) to tuple of (int, int)
+        for every free position, the positions that a bot can move to
+        (in the same order as `get_legal_positions`)
+    initial_positions : list of (int, int)
+        the initial positions of the bots (see `initial_positions`)
+    homezones : tuple of (tuple of (int, int), tuple of (int, int))
+        the sorted free positions in the homezones of both teams
+    border : (int, int)
+        the x coordinates of the two columns next to the border
+    inner_homezones : tuple of (tuple of (int, int), tuple of (int, int))
+        the sorted free positions in the homezones, excluding the border columns
+    """
+    def __init__(self, walls, shape):
+        self.shape = tuple(shape)
+        self.walls = Walls(walls, self.shape)
+        self.wall_set = self.walls._set
+        width, height = self.shape
+
+        free = [(x, y) for x in range(width) for y in range(height) if (x, y) not in self.wall_set]
+        self.legal_positions = {
+            pos: tuple(get_legal_positions(self.wall_set, self.shape, pos))
+            for pos in free
+        }
+        self.initial_positions = initial_positions(self.wall_set, self.shape)
+
+        home_width = width // 2
+        self.homezones = (
+            tuple(pos for pos in free if pos[0] < home_width),
+            tuple(pos for pos in free if pos[0] >= home_width),
+        )
+        self.border = (home_width - 1, home_width)
+        self.inner_homezones = tuple(
+            tuple(pos for pos in homezone if pos[0] not in self.border)
+            for homezone in self.homezones
+        )
+        self._graph = None
+        self._hash = None
+        self._noise_positions = {}
+        self._distance_maps = {}
+
+    @property
+    def hash(self):
+        """ The `layout_hash` of this maze. """
+        if self._hash is None:
+            self._hash = layout_hash(self.walls, self.shape)
+        return self._hash
+
+    @property
+    def graph(self):
+        """ A read-only networkx graph of the maze (see `pelita.team.walls_to_graph`).
+
+        The graph is shared by all users of this index. Use `new_graph` to get
+        a graph with edge attributes that can be changed independently.
+        """
+        if self._graph is None:
+            from .team import walls_to_graph
+            self._graph = walls_to_graph(self.wall_set, shape=self.shape).copy(as_view=True)
+        return self._graph
+
+    def new_graph(self):
+        """ Returns a read-only view on a new copy of `graph`. """
+        return self.graph.copy().copy(as_view=True)
+
+    def noise_positions(self, bot_position, noise_radius):
+        """ Returns the (cached) positions that a bot at `bot_position`
+        may be shown at when noise is applied
+        (see `pelita.gamestate_filters.noise_positions`). """
+        key = (tuple(bot_position), noise_radius)
+        try:
+            return self._noise_positions[key]
+        except KeyError:
+            from .gamestate_filters import noise_positions
+            positions = tuple(noise_positions(bot_position, noise_radius, self.wall_set, self.shape))
+            self._noise_positions[key] = positions
+            return positions
+
+    def distance_map(self, target):
+        """ Returns the (cached) maze distances of all positions to `target`.
+
+        The distances are computed with a breadth-first search the first time
+        they are requested for a target.
+
+        Returns
+        -------
+        distances : numpy.ndarray
+            a read-only integer array of the same shape as the maze, indexed by
+            [x, y]. Walls and positions that cannot reach `target` are -1.
+
+        Raises
+        ------
+        ValueError
+            if target is not a free position in the maze
+        """
+        try:
+            return self._distance_maps[target]
+        except (KeyError, TypeError):
+            pass
+
+        target = tuple(target)
+        if target not in self.legal_positions:
+            raise ValueError(f"Position {target} is not a free position in the maze.")
+        if target in self._distance_maps:
+            return self._distance_maps[target]
+
+        import numpy as np
+
+        distances = {target: 0}
+        frontier = [target]
+        distance = 0
+        while frontier:
+            distance += 1
+            next_frontier = []
+            for pos in frontier:
+                for neighbor in self.legal_positions[pos]:
+                    if neighbor not in distances:
+                        distances[neighbor] = distance
+                        next_frontier.append(neighbor)
+            frontier = next_frontier
+
+        distance_map = np.full(self.shape, -1, dtype=np.int32)
+        xs, ys = zip(*distances)
+        distance_map[xs, ys] = list(distances.values())
+        distance_map.flags.writeable = False
+        self._distance_maps[target] = distance_map
+        return distance_map
+
+    def maze_distance(self, pos1, pos2):
+        """ Returns the length of the shortest path between `pos1` and `pos2`.
+
+        Raises
+        ------
+        ValueError
+            if one of the positions is not free or if there is no path
+        """
+        pos1, pos2 = tuple(pos1), tuple(pos2)
+        # use an existing distance map, if we have one
+        if pos1 in self._distance_maps:
+            pos1, pos2 = pos2, pos1
+        if pos1 not in self.legal_positions:
+            raise ValueError(f"Position {pos1} is not a free position in the maze.")
+        distance = int(self.distance_map(pos2)[pos1])
+        if distance < 0:
+            raise ValueError(f"There is no path from {pos1} to {pos2}.")
+        return distance
+
+    def next_step(self, position, target):
+        """ Returns the next position on a shortest path from `position` to `target`.
+
+        When several shortest paths exist, the first one in the order of
+        `get_legal_positions` is taken. If `position` is `target`, the position
+        is returned unchanged.
+
+        Raises
+        ------
+        ValueError
+            if one of the positions is not free or if there is no path
+        """
+        position = tuple(position)
+        distance = self.maze_distance(position, target)
+        if distance == 0:
+            return position
+        distance_map = self.distance_map(target)
+        for neighbor in self.legal_positions[position]:
+            if distance_map[neighbor] == distance - 1:
+                return neighbor
+
+    def get_legal_positions(self, bot_position):
+        """ Returns all legal positions that a bot at `bot_position` can go to.
+
+        Same as `pelita.layout.get_legal_positions` but with a table lookup.
+
+        Raises
+        ------
+        ValueError
+            if bot_position invalid or on wall
+        """
+        try:
+            return list(self.legal_positions[bot_position])
+        except (KeyError, TypeError):
+            # use the original function to generate the error message
+            get_legal_positions(self.wall_set, self.shape, bot_position)
+            raise ValueError(f"Position {bot_position} is not a legal position.") from None
+
+    def __repr__(self):
+        return f"LayoutIndex(shape={self.shape}, hash={self.hash[:8]})"
+
+
+def get_layout_index(walls, shape):
+    """ Returns the (cached) LayoutIndex for the given walls and shape.
+
+    The indexes for the most recently used `LAYOUT_INDEX_CACHE_SIZE` mazes
+    are kept in memory, so that playing many games on the same mazes
+    does not repeat the setup work.
+    """
+    return _cached_layout_index(frozenset(tuple(pos) for pos in walls), tuple(shape))
+
+
+@functools.lru_cache(maxsize=LAYOUT_INDEX_CACHE_SIZE)
+def _cached_layout_index(walls, shape):
+    return LayoutIndex(walls, shape)
@@ -1,9 +1,19 @@
 
+import atexit
+import contextlib
+import itertools
 import json
 import logging
+import math
+import os
+import shutil
+import struct
 import sys
+import tempfile
+import threading
 import time
 import uuid
+from array import array
 from urllib.parse import urlparse
 
 import zmq
@@ -31,6 +41,29 @@ PELITA_PORT = 41736
 # Error
 # {__uuid__, __error__, __error_msg__}
 
+# The messages between a RemoteTeam and its player are JSON strings (protocol 1).
+# With the first request, the RemoteTeam offers the compact protocols that it
+# understands in a list `__protocols__`. If the player knows one of them, it
+# adds its choice as `__protocol__` to its (JSON) reply and from then on, both
+# sides use it (see `encode_message`). Older players ignore the offer.
+
+#: Binary messages: positions are packed as unsigned 16 bit integers, the rest of
+#: the message is JSON. Message ids are integers.
+PROTOCOL_V2 = 'pelita-v2'
+#: Like PROTOCOL_V2 but the rest of the message is encoded with msgpack
+PROTOCOL_V2_MSGPACK = 'pelita-v2-msgpack'
+
+# A binary message starts with the magic bytes, the codec of the header
+# (0: JSON, 1: msgpack) and the length of the header. It is followed
+# by the header and the packed positions.
+_V2_MAGIC = b'PEL2'
+_V2_PREFIX = struct.Struct('<4sBI')
+_V2_CODECS = {PROTOCOL_V2: 0, PROTOCOL_V2_MSGPACK: 1}
+
+#: The fields of a message which hold lists of (x, y) positions. Only these
+#: are packed by the binary protocols, all other values are left as they are.
+PACKED_FIELDS = frozenset({'bot_positions', 'bots', 'food', 'shaded_food', 'walls'})
+
 
 class ZMQUnreachablePeer(Exception):
     """ Raised when ZMQ cannot send a message (connection may have been lost). """
@@ -53,7 +86,52 @@ class ZMQClientError(Exception):
 DEAD_CONNECTION_TIMEOUT = 3.0
 
 
+#: The addresses for connections on the same host (tcp, ipc) or inside
+#: of the same process (inproc). `bind_socket` picks a free port, socket
+#: file or name for them.
+TRANSPORT_ADDRESSES = {
+    'tcp': 'tcp://127.0.0.1',
+    'ipc': 'ipc://',
+    'inproc': 'inproc://',
+}
+
+def local_address(transport):
+    """ Returns the address to bind to for the given transport
+    ('tcp', 'ipc' or 'inproc'). """
+    try:
+        return TRANSPORT_ADDRESSES[transport]
+    except KeyError:
+        raise ValueError(f"Unknown transport {transport!r} (must be one of {', '.join(TRANSPORT_ADDRESSES)}).") from None
+
+
+# The folder for the ipc socket files of this process
+_ipc_dir = None
+
+def _new_ipc_address():
+    global _ipc_dir
+    if _ipc_dir is None:
+        _ipc_dir = tempfile.mkdtemp(prefix='pelita-')
+        # zmq does not remove the socket files
+        atexit.register(shutil.rmtree, _ipc_dir, ignore_errors=True)
+    return f'ipc://{_ipc_dir}/{uuid.uuid4().hex[:16]}'
+
+def remove_address(address):
+    """ Removes the socket file of an ipc address that has been returned
+    by `bind_socket`, once the socket has been closed. """
+    parsed_address = urlparse(address)
+    if parsed_address.scheme == 'ipc' and _ipc_dir is not None and parsed_address.path.startswith(_ipc_dir):
+        with contextlib.suppress(FileNotFoundError):
+            os.unlink(parsed_address.path)
+
+
 def bind_socket(socket: zmq.Socket, address, option_hint=None):
+    """ Binds `socket` to `address` and returns the address that others
+    can connect to.
+
+    A tcp address without a port is bound to a random port, an ipc address
+    without a path to a new socket file in a temporary folder and an inproc
+    address without a name to a new name.
+    """
     parsed_address = urlparse(address)
 
     # NB: We cannot use parsed_address.geturl() to generate a nice url for zmq
@@ -64,6 +142,13 @@ def bind_socket(socket: zmq.Socket, address, option_hint=None):
         if parsed_address.scheme == 'tcp' and parsed_address.port is None:
             port = socket.bind_to_random_port(address)
             return f'tcp://{parsed_address.hostname}:{port}'
+        elif parsed_address.scheme in ('ipc', 'inproc') and not (parsed_address.netloc or parsed_address.path):
+            if parsed_address.scheme == 'ipc':
+                address = _new_ipc_address()
+            else:
+                address = f'inproc://pelita-{uuid.uuid4().hex}'
+            socket.bind(address)
+            return address
         else:
             socket.bind(address)
             return address
@@ -78,9 +163,9 @@ def bind_socket(socket: zmq.Socket, address, option_hint=None):
 
 class SetEncoder(json.JSONEncoder):
    def default(self, obj):
-      if isinstance(obj, set):
+      if isinstance(obj, (set, frozenset)):
          return list(obj)
-      return json.JSONEncoder.default(self, obj)
+      return json_default_handler(obj)
 
 
 def json_default_handler(o):
@@ -98,6 +183,157 @@ def json_default_handler(o):
     raise TypeError("Cannot convert %r of type %s to json" % (o, type(o)))
 
 
+def encode_viewer_state(viewer_state, serialization):
+    """ Serializes the viewer state for the viewers which declare the
+    given `serialization` (currently only 'json').
+
+    The engine calls this at most once per format and frame and hands the
+    result to all viewers with that format (see `pelita.viewer.show_viewer_state`).
+    """
+    if serialization == 'json':
+        return json.dumps(viewer_state, cls=SetEncoder)
+    raise ValueError(f"Unknown viewer serialization {serialization!r}.")
+
+
+def _msgpack():
+    """ Returns the msgpack module or None if it is not installed. """
+    try:
+        import msgpack
+    except ImportError:
+        return None
+    return msgpack
+
+
+def supported_protocols():
+    """ The compact protocols that can be used in this process, most preferred first. """
+    if _msgpack() is not None:
+        return [PROTOCOL_V2_MSGPACK, PROTOCOL_V2]
+    return [PROTOCOL_V2]
+
+
+def _pack_positions(obj, coords):
+    """ Appends the coordinates of `obj` to `coords`, if it is a non-empty
+    collection of (x, y) positions. Returns the reference to the positions
+    or None. """
+    start = len(coords)
+    try:
+        coords.extend(itertools.chain.from_iterable(obj))
+    except TypeError:
+        return None
+    if len(coords) - start != 2 * len(obj):
+        # not pairs
+        del coords[start:]
+        return None
+    return {'__pos__': [start // 2, len(obj)]}
+
+
+def _pack(obj, coords, key=None):
+    """ Returns `obj` with the lists of positions in `PACKED_FIELDS` replaced
+    by references to `coords`. `key` is the field of `obj`. """
+    if isinstance(obj, dict):
+        return {field: _pack(value, coords, field) for field, value in obj.items()}
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        if obj and key in PACKED_FIELDS:
+            packed = _pack_positions(obj, coords)
+            if packed is not None:
+                return packed
+        return [_pack(value, coords) for value in obj]
+    return obj
+
+
+def encode_message(message_obj, protocol=None):
+    """ Encodes a message dict for the given protocol.
+
+    For protocol None, the message is a JSON string. For PROTOCOL_V2 and
+    PROTOCOL_V2_MSGPACK, the lists and sets of (x, y) positions in the
+    `PACKED_FIELDS` (like the food) are packed as 16 bit integers and the
+    message is returned as bytes. Messages with coordinates that do not fit
+    are sent as JSON.
+    """
+    if protocol is None:
+        return json.dumps(message_obj, cls=SetEncoder)
+
+    coords = []
+    header_obj = _pack(message_obj, coords)
+    try:
+        packed_coords = struct.pack(f'<{len(coords)}H', *coords)
+    except struct.error:
+        # negative, large or non-integer coordinates
+        _logger.debug("Cannot pack the positions of the message. Sending it as JSON.")
+        return json.dumps(message_obj, cls=SetEncoder)
+
+    codec = _V2_CODECS[protocol]
+    if codec == 1:
+        header = _msgpack().packb(header_obj, default=json_default_handler)
+    else:
+        header = json.dumps(header_obj, separators=(',', ':'), default=json_default_handler).encode()
+    return b''.join([_V2_PREFIX.pack(_V2_MAGIC, codec, len(header)), header, packed_coords])
+
+
+def message_protocol(message):
+    """ Returns the protocol of an encoded message (None for JSON). """
+    if isinstance(message, bytes) and message.startswith(_V2_MAGIC) and len(message) > len(_V2_MAGIC):
+        codec = message[len(_V2_MAGIC)]
+        for protocol, protocol_codec in _V2_CODECS.items():
+            if codec == protocol_codec:
+                return protocol
+    return None
+
+
+def choose_protocol(offered):
+    """ Returns the first protocol in `offered` that is supported (or None). """
+    supported = supported_protocols()
+    for protocol in offered or []:
+        if protocol in supported:
+            return protocol
+    return None
+
+
+def decode_message(message):
+    """ Decodes a message (as bytes or str) of any protocol.
+
+    Packed positions are returned as lists of tuples.
+
+    Raises
+    ------
+    ValueError
+        if the message cannot be decoded
+    """
+    if isinstance(message, str) or not message.startswith(_V2_MAGIC):
+        return json.loads(message)
+
+    try:
+        _magic, codec, length = _V2_PREFIX.unpack_from(message)
+    except struct.error as e:
+        raise ValueError(f"Invalid message: {e}") from None
+    start = _V2_PREFIX.size
+    coords = array('H')
+    try:
+        coords.frombytes(message[start + length:])
+    except ValueError as e:
+        raise ValueError(f"Invalid message: {e}") from None
+    if sys.byteorder == 'big':
+        coords.byteswap()
+
+    def unpack_positions(obj):
+        if len(obj) == 1 and '__pos__' in obj:
+            start, count = obj['__pos__']
+            flat = coords[2 * start:2 * (start + count)]
+            return list(zip(flat[::2], flat[1::2]))
+        return obj
+
+    header = message[start:start + length]
+    if codec == 1:
+        msgpack = _msgpack()
+        if msgpack is None:
+            raise ValueError("Cannot decode msgpack message: msgpack is not installed.")
+        try:
+            return msgpack.unpackb(header, object_hook=unpack_positions, strict_map_key=False)
+        except Exception as e:
+            raise ValueError(f"Invalid message: {e}") from None
+    return json.loads(header, object_hook=unpack_positions)
+
+
 class ZMQConnection:
     """ This class is supposed to ease request–reply connections
     through a zmq socket. It does so by attaching a uuid to each
@@ -115,19 +351,31 @@ class ZMQConnection:
     ----------
     socket : zmq socket
         The zmq socket of this connection
+    protocols : list of str, optional
+        The compact protocols to offer to the other side (defaults to
+        `supported_protocols()`). Pass an empty list to only use JSON.
 
     Attributes
     ----------
     socket : zmq socket
         The zmq socket of this connection
+    protocol : str or None
+        The negotiated protocol (None for JSON)
     pollin : zmq poller
         Poller for incoming connections
     pollout : zmq poller
         Poller for outgoing connections
     """
-    def __init__(self, socket):
+    def __init__(self, socket, protocols=None):
         self.socket = socket
 
+        if protocols is None:
+            protocols = supported_protocols()
+        self.protocols = list(protocols)
+        self.protocol = None
+        self._offered = False
+        self._msg_ids = itertools.count()
+
         self.socket.setsockopt(zmq.LINGER, 0)
         self.socket.setsockopt(zmq.AFFINITY, 1)
         #self.setsockopt(zmq.RCVTIMEO, 2000)
@@ -146,19 +394,15 @@ class ZMQConnection:
         if timeout is None:
             timeout = DEAD_CONNECTION_TIMEOUT
 
-        msg_id = str(uuid.uuid4())
-        _logger.debug("---> %r [%s]", action, msg_id)
-
         # Check before sending that the socket can receive
         socks = dict(self.pollout.poll(timeout * 1000))
         if socks.get(self.socket) == zmq.POLLOUT:
             # I think we need to set NOBLOCK here, else we may run into a
             # race condition if a connection was closed between poll and send.
             # NOBLOCK should raise, so we can catch that
-            message_obj = {"__uuid__": msg_id, "__action__": action, "__data__": data}
-            json_message = json.dumps(message_obj, cls=SetEncoder)
+            msg_id, message = self._encode_request(action, data)
             try:
-                self.socket.send_unicode(json_message, flags=zmq.NOBLOCK)
+                self.socket.send(message, flags=zmq.NOBLOCK)
             except zmq.ZMQError as e:
                 _logger.info("Could not send message. Assume socket is unavailable. %r", e)
                 raise ZMQUnreachablePeer()
@@ -166,6 +410,23 @@ class ZMQConnection:
             raise ZMQUnreachablePeer()
         return msg_id
 
+    def _encode_request(self, action, data):
+        """ Returns a new message id and the encoded request. """
+        if self.protocol is None:
+            msg_id = str(uuid.uuid4())
+        else:
+            msg_id = next(self._msg_ids)
+        _logger.debug("---> %r [%s]", action, msg_id)
+
+        message_obj = {"__uuid__": msg_id, "__action__": action, "__data__": data}
+        if self.protocols and not self._offered:
+            message_obj["__protocols__"] = self.protocols
+            self._offered = True
+        message = encode_message(message_obj, self.protocol)
+        if isinstance(message, str):
+            message = message.encode()
+        return msg_id, message
+
     def _recv(self):
         """ Receive the next message on the socket.
 
@@ -177,17 +438,32 @@ class ZMQConnection:
         Raises
         ------
         ZMQReplyTimeout
-            if the message cannot be parsed from JSON
+            if the message cannot be decoded
         ZMQClientError
             if an error message is returned
         """
-        json_message = self.socket.recv_unicode()
+        return self._decode_reply(self.socket.recv())
+
+    def _decode_reply(self, message):
+        """ Decodes a reply (see `_recv`). """
         try:
-            py_obj = json.loads(json_message)
-        except ValueError:
-            _logger.warning('Received non-json message from self. Triggering a timeout.')
+            py_obj = decode_message(message)
+        except (ValueError, UnicodeDecodeError):
+            _logger.warning('Received message that cannot be decoded. Triggering a timeout.')
             raise ZMQReplyTimeout()
 
+        if not isinstance(py_obj, dict):
+            _logger.warning('Received message that is not a dict. Triggering a timeout.')
+            raise ZMQReplyTimeout()
+
+        protocol = py_obj.get('__protocol__')
+        if protocol is not None and self.protocol is None:
+            if protocol in self.protocols:
+                _logger.debug("Switching to protocol %s.", protocol)
+                self.protocol = protocol
+            else:
+                _logger.warning("Other side chose unknown protocol %r. Ignoring.", protocol)
+
         try:
             error_type = py_obj['__error__']
             error_message = py_obj.get('__error_msg__', '')
@@ -267,21 +543,121 @@ class ZMQConnection:
     def __repr__(self):
         return "ZMQConnection(%r)" % self.socket
 
+
+class AsyncZMQConnection(ZMQConnection):
+    """ A `ZMQConnection` for a `zmq.asyncio` socket.
+
+    `send` and `recv_timeout` are coroutines which wait for the socket
+    without blocking the event loop. `send_nowait` sends a message
+    without waiting at all (for the exit message).
+
+    Parameters
+    ----------
+    socket : zmq.asyncio socket
+        The zmq socket of this connection
+    protocols : list of str, optional
+        The compact protocols to offer to the other side
+    """
+    async def send(self, action, data, timeout=None):
+        """ Sends a message or request `action` and attached data
+        to the socket and returns the message id of the reply. """
+        if timeout is None:
+            timeout = DEAD_CONNECTION_TIMEOUT
+
+        # Check before sending that the socket can receive
+        if not await self.socket.poll(timeout * 1000, zmq.POLLOUT):
+            raise ZMQUnreachablePeer()
+        return self.send_nowait(action, data)
+
+    def send_nowait(self, action, data):
+        """ Sends a message or request `action` if the socket is ready
+        and returns its message id. """
+        msg_id, message = self._encode_request(action, data)
+        try:
+            # NOBLOCK sends immediately (or raises) on an asyncio socket as well
+            self.socket.send(message, flags=zmq.NOBLOCK)
+        except zmq.ZMQError as e:
+            _logger.info("Could not send message. Assume socket is unavailable. %r", e)
+            raise ZMQUnreachablePeer()
+        return msg_id
+
+    async def recv_timeout(self, expected_id, timeout):
+        """ Waits `timeout` seconds for a reply with msg_id `expected_id`
+        (see `ZMQConnection.recv_timeout`). """
+        if timeout is None:
+            timeout_until = math.inf
+        else:
+            timeout_until = time.monotonic() + timeout
+
+        while True:
+            time_left = timeout_until - time.monotonic()
+            if time_left < 0:
+                break
+            poll_timeout = None if time_left == math.inf else time_left * 1000
+            if not await self.socket.poll(poll_timeout, zmq.POLLIN):
+                # poll timed out
+                # answer did not arrive in time
+                break
+
+            msg_id, reply = self._decode_reply(await self.socket.recv())
+            # check, if it is the correct reply and return
+            if msg_id == expected_id:
+                return reply
+
+        raise ZMQReplyTimeout()
+
+    def __repr__(self):
+        return "AsyncZMQConnection(%r)" % self.socket
+
+def is_key_state(game_state):
+    """ Returns True for the states before the first round and the final state.
+
+    Viewers need these states, so they are never skipped when a publisher or a
+    viewer drops frames to keep up with a fast game.
+    """
+    return game_state.get('round') is None or bool(game_state.get('gameover'))
+
+
 class ZMQPublisher:
     """ Sets up a simple Publisher which sends all viewed events
     over a zmq connection.
 
+    Sending never blocks the game: a PUB socket drops the messages for a
+    subscriber which is more than `hwm` messages behind. This applies to all
+    states, so a subscriber which is too slow may miss the initial or the
+    final state as well.
+
     Parameters
     ----------
     address : string
         The address which the publisher binds or connects to.
     bind : bool
         Whether we are in bind or connect mode
+    max_fps : float, optional
+        Send at most this many states per second. States which follow the
+        last sent state too quickly are dropped, apart from the initial and
+        the final states (see `is_key_state`). The last dropped state is
+        sent once the interval has passed, so that a subscriber does not
+        show a stale state when the game pauses.
+    hwm : int, optional
+        The high water mark (in messages) of the socket (zmq default if None)
     """
-    def __init__(self, address, bind=True):
+    #: The format in which the publisher wants to receive the viewer state
+    serialization = 'json'
+
+    def __init__(self, address, bind=True, *, max_fps=None, hwm=None):
         self.address = address
+        self.min_interval = 1 / max_fps if max_fps else 0
+        self._last_sent = -math.inf
+        # the last dropped state, which is sent later by the timer
+        self._pending = None
+        self._timer = None
+        # the timer sends from another thread
+        self._lock = threading.Lock()
         self.context = zmq.Context()
         self.socket = self.context.socket(zmq.PUB)
+        if hwm is not None:
+            self.socket.sndhwm = hwm
         if bind:
             self.socket_addr = bind_socket(self.socket, self.address, '--publish')
             _logger.debug("Bound zmq.PUB to {}".format(self.socket_addr))
@@ -289,17 +665,50 @@ class ZMQPublisher:
             self.socket.connect(self.address)
             _logger.debug("Connected zmq.PUB to {}".format(self.address))
 
-    def _send(self, action, data):
+    def _send(self, action, data, encoded_data):
         info = {'round': data['round'], 'turn': data['turn']}
         if data['gameover']:
             info['gameover'] = True
         _logger.debug(f"--#> [{action}] %r", info)
-        message = {"__action__": action, "__data__": data}
-        as_json = json.dumps(message, cls=SetEncoder)
+        # same as json.dumps({"__action__": action, "__data__": data}, cls=SetEncoder)
+        # but the data does not need to be encoded again
+        as_json = f'{{"__action__": {json.dumps(action)}, "__data__": {encoded_data}}}'
         self.socket.send_unicode(as_json)
 
+    def _publish(self, game_state, encoded_state):
+        """ Sends the state or, if it follows the last sent state too
+        quickly (see `max_fps`), keeps it until the interval has passed. """
+        with self._lock:
+            now = time.monotonic()
+            wait = self._last_sent + self.min_interval - now
+            if wait > 0 and not is_key_state(game_state):
+                _logger.debug("Delaying state (round %r, turn %r).", game_state['round'], game_state['turn'])
+                # a previously delayed state is dropped
+                self._pending = (game_state, encoded_state)
+                if self._timer is None:
+                    self._timer = threading.Timer(wait, self._send_pending)
+                    self._timer.daemon = True
+                    self._timer.start()
+                return
+            self._pending = None
+            self._last_sent = now
+            self._send(action="observe", data=game_state, encoded_data=encoded_state)
+
+    def _send_pending(self):
+        with self._lock:
+            self._timer = None
+            if self._pending is None:
+                return
+            game_state, encoded_state = self._pending
+            self._pending = None
+            self._last_sent = time.monotonic()
+            self._send(action="observe", data=game_state, encoded_data=encoded_state)
+
     def show_state(self, game_state):
-        self._send(action="observe", data=game_state)
+        self._publish(game_state, encode_viewer_state(game_state, self.serialization))
+
+    def show_encoded_state(self, game_state, encoded_state):
+        self._publish(game_state, encoded_state)
 
 
 class Controller:
@@ -362,9 +771,9 @@ class Controller:
         """
 
 
-def setup_controller(zmq_context=None):
+def setup_controller(zmq_context=None, address='tcp://127.0.0.1'):
     if not zmq_context:
         import zmq
         zmq_context = zmq.Context()
-    controller = Controller(zmq_context=zmq_context)
+    controller = Controller(address=address, zmq_context=zmq_context)
     return controller
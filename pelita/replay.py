@@ -0,0 +1,750 @@
+""" Reading and writing of replay files.
+
+A replay file (version 2) stores the viewer states of a game:
+
+    MAGIC
+    header   b'H' + length + JSON  (version, compression and the static
+                                    fields like the walls, which are stored once)
+    block    b'B' + length + compressed payload
+    ...
+    index    b'I' + length + JSON  (offset, round, turn and number of states
+                                    of every block)
+    footer   offset of the index + FOOTER_MAGIC
+
+Every block starts with a keyframe (the full state minus the static fields)
+which is followed by delta frames holding only the fields that changed (for
+lists of the same length like the bot positions only the changed items and
+for the food only the eaten or relocated positions). The payload of a block are these frames
+as JSON lines. A reader can therefore jump to any block with the index and
+does not need to read the file from the beginning. When the index is
+missing (because the game was aborted), the blocks are read in order.
+
+Older replay files (version 1) are a stream of JSON states separated by
+0x04. `open_replay` returns a reader for either version. The readers
+memory-map the file, so that opening even a large replay is instant and
+only the states that are used are decoded. `read_replay` iterates over
+both versions and the moves-only replays (see `MovesWriter`), which are
+re-simulated.
+"""
+
+import gzip
+import hashlib
+import itertools
+import json
+import logging
+import math
+import mmap
+import os
+import struct
+from random import Random
+
+from . import exceptions, layout
+from .network import SetEncoder, encode_viewer_state
+
+_logger = logging.getLogger(__name__)
+
+MAGIC = b'PELITA-REPLAY\n'
+FOOTER_MAGIC = b'PRIX'
+VERSION = 2
+
+#: The fields that are stored only once in the header
+STATIC_FIELDS = ('walls', 'shape')
+
+#: The fields (lists of positions) that are stored as added and removed
+#: positions in the delta frames
+SET_FIELDS = ('food',)
+
+#: The fields holding lists of positions (which are tuples in the game state)
+POSITION_FIELDS = ('walls', 'bots', 'food')
+
+COMPRESSIONS = (None, 'gzip', 'zstd')
+
+_LENGTH = struct.Struct('<I')
+_FOOTER = struct.Struct('<Q4s')
+
+
+def _zstd():
+    """ Returns the zstandard module or raises an ImportError. """
+    try:
+        import zstandard
+    except ImportError:
+        raise ImportError("Compression 'zstd' needs the zstandard package.") from None
+    return zstandard
+
+
+def _compress(data, compression):
+    if compression is None:
+        return data
+    if compression == 'gzip':
+        # no timestamp, so that the same game gives the same file
+        return gzip.compress(data, mtime=0)
+    if compression == 'zstd':
+        return _zstd().ZstdCompressor().compress(data)
+    raise ValueError(f"Unknown compression {compression!r} (must be one of {COMPRESSIONS}).")
+
+
+def _decompress(data, compression):
+    if compression is None:
+        return data
+    if compression == 'gzip':
+        return gzip.decompress(data)
+    if compression == 'zstd':
+        return _zstd().ZstdDecompressor().decompress(data)
+    raise ValueError(f"Unknown compression {compression!r} (must be one of {COMPRESSIONS}).")
+
+
+def _dumps(obj):
+    return json.dumps(obj, cls=SetEncoder, separators=(',', ':'))
+
+
+def _frame_key(round, turn):
+    """ A sortable key for the position of a state in the game. The states
+    before the first round have round (and turn) None. """
+    return (-1 if round is None else round, -1 if turn is None else turn)
+
+
+def _state_delta(previous, state):
+    """ Returns the delta frame that turns `previous` into `state`. """
+    changed = {}
+    delta = {'changed': changed}
+    for key, value in state.items():
+        if key in previous and previous[key] == value:
+            continue
+        if key in SET_FIELDS and key in previous:
+            old = set(map(tuple, previous[key]))
+            new = set(map(tuple, value))
+            delta[key] = {
+                'added': sorted(map(list, new - old)),
+                'removed': sorted(map(list, old - new)),
+            }
+        elif isinstance(value, list) and isinstance(previous.get(key), list) and len(value) == len(previous[key]):
+            # lists like the bot positions: only the changed items
+            delta.setdefault('items', {})[key] = {
+                str(idx): item for idx, (old_item, item) in enumerate(zip(previous[key], value))
+                if old_item != item
+            }
+        else:
+            changed[key] = value
+    removed = [key for key in previous if key not in state]
+    if removed:
+        delta['removed'] = removed
+    return delta
+
+
+def _apply_delta(previous, delta):
+    """ Returns the state for the given delta frame. """
+    state = dict(previous)
+    state.update(delta['changed'])
+    for key in delta.get('removed', ()):
+        del state[key]
+    for key, items in delta.get('items', {}).items():
+        state[key] = list(previous[key])
+        for idx, item in items.items():
+            state[key][int(idx)] = item
+    for key in SET_FIELDS:
+        if key in delta:
+            removed = set(map(tuple, delta[key]['removed']))
+            items = [item for item in previous[key] if tuple(item) not in removed]
+            state[key] = sorted(items + delta[key]['added'])
+    return state
+
+
+class ReplayWriter:
+    """ A viewer which streams the game into a replay file (version 2).
+
+    The states are collected in blocks of `keyframe_interval` states, which
+    are compressed and written as soon as they are full. The index is written
+    after the final state or when the writer is closed.
+
+    Parameters
+    ----------
+    stream : binary file object
+        The stream to write to
+    compression : None, 'gzip' or 'zstd'
+        The compression of the blocks ('zstd' needs the zstandard package)
+    keyframe_interval : int
+        The number of states in a block (a keyframe and the following deltas)
+    """
+    serialization = 'json'
+
+    def __init__(self, stream, compression='gzip', keyframe_interval=64):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression {compression!r} (must be one of {COMPRESSIONS}).")
+        if compression == 'zstd':
+            _zstd()
+        if keyframe_interval < 1:
+            raise ValueError(f"Keyframe interval must be positive (got {keyframe_interval}).")
+        self.stream = stream
+        self.compression = compression
+        self.keyframe_interval = keyframe_interval
+
+        self._static = None
+        self._offset = 0
+        self._index = []
+        self._block = []
+        self._block_start = None
+        self._previous = None
+        self.closed = False
+
+    def _write_record(self, kind, data):
+        self.stream.write(kind + _LENGTH.pack(len(data)) + data)
+        self._offset += 1 + _LENGTH.size + len(data)
+
+    def _write_header(self, state):
+        self._static = {key: state[key] for key in STATIC_FIELDS if key in state}
+        header = {
+            'version': VERSION,
+            'compression': self.compression,
+            'keyframe_interval': self.keyframe_interval,
+            'static': self._static,
+        }
+        self.stream.write(MAGIC)
+        self._offset += len(MAGIC)
+        self._write_record(b'H', _dumps(header).encode())
+
+    def _flush_block(self):
+        if not self._block:
+            return
+        payload = '\n'.join(_dumps(frame) for frame in self._block).encode()
+        self._index.append([self._offset, *self._block_start, len(self._block)])
+        self._write_record(b'B', _compress(payload, self.compression))
+        self.stream.flush()
+        self._block = []
+
+    def write_state(self, state):
+        """ Adds a (JSON compatible) viewer state to the replay. """
+        if self.closed:
+            raise ValueError("Replay has already been closed.")
+        if self._static is None:
+            self._write_header(state)
+        state = {key: value for key, value in state.items()
+                 if key not in self._static or value != self._static[key]}
+        for key in SET_FIELDS:
+            if key in state:
+                state[key] = sorted(state[key])
+
+        if len(self._block) == self.keyframe_interval:
+            self._flush_block()
+        if not self._block:
+            self._block_start = (state.get('round'), state.get('turn'))
+            self._block.append({'keyframe': state})
+        else:
+            self._block.append({'delta': _state_delta(self._previous, state)})
+        self._previous = state
+
+        if state.get('gameover'):
+            self.close()
+
+    def close(self):
+        """ Writes the last block and the index. The stream is not closed. """
+        if self.closed:
+            return
+        self._flush_block()
+        if self._static is not None:
+            index_offset = self._offset
+            self._write_record(b'I', _dumps(self._index).encode())
+            self.stream.write(_FOOTER.pack(index_offset, FOOTER_MAGIC))
+        self.stream.flush()
+        self.closed = True
+
+    def show_state(self, game_state):
+        self.show_encoded_state(game_state, encode_viewer_state(game_state, self.serialization))
+
+    def show_encoded_state(self, game_state, encoded_state):
+        # the encoded state has the same types as the states read from the replay
+        self.write_state(json.loads(encoded_state))
+
+
+def _as_tuples(positions):
+    return [tuple(pos) for pos in positions]
+
+
+class _Reader:
+    """ The common interface of the replay readers. """
+    def __init__(self, path, tuples=False):
+        self.path = path
+        self.tuples = tuples
+        self._file = open(path, 'rb')
+        try:
+            # an empty file cannot be mapped
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if self._size() else b''
+        except BaseException:
+            self._file.close()
+            raise
+
+    def _size(self):
+        return os.fstat(self._file.fileno()).st_size
+
+    def _decoded(self, state):
+        """ Converts the positions in `state` to tuples (if requested). """
+        if self.tuples:
+            for key in POSITION_FIELDS:
+                if key in state and key not in STATIC_FIELDS:
+                    state[key] = _as_tuples(state[key])
+        return state
+
+    def __iter__(self):
+        return self.states()
+
+    def __getitem__(self, idx):
+        if not isinstance(idx, int):
+            raise TypeError(f"Replay indices must be integers, not {type(idx).__name__}.")
+        length = len(self)
+        if idx < 0:
+            idx += length
+        if not 0 <= idx < length:
+            raise IndexError("Replay index out of range.")
+        return self._state_at(idx)
+
+    def _state_at(self, idx):
+        return next(itertools.islice(self.states(), idx, None))
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ReplayReader(_Reader):
+    """ Reads a replay file (version 2).
+
+    The file is memory-mapped and the states are decoded lazily, block by
+    block. `states(round)` starts at the given round and `reader[idx]`
+    returns a single state without decoding the blocks before it.
+
+    Parameters
+    ----------
+    path : str or Path
+        The replay file
+    tuples : bool
+        If True, the positions in the walls, bots and food are tuples (as in
+        the game state) instead of lists. The walls are converted only once.
+
+    Attributes
+    ----------
+    header : dict
+        The header of the file
+    index : list
+        The offset, round, turn and number of states for every block
+    """
+    def __init__(self, path, tuples=False):
+        super().__init__(path, tuples=tuples)
+        try:
+            if self._mmap[:len(MAGIC)] != MAGIC:
+                raise ValueError(f"{path} is not a replay file of version {VERSION}.")
+            kind, header, self._blocks_start = self._read_record(len(MAGIC))
+            if kind != b'H':
+                raise ValueError(f"{path} has no replay header.")
+            self.header = json.loads(header)
+            if self.header['version'] != VERSION:
+                raise ValueError(f"Unsupported replay version {self.header['version']}.")
+            self._static = self.header['static']
+            if tuples and 'walls' in self._static:
+                self._static = {**self._static, 'walls': _as_tuples(self._static['walls'])}
+            self.index = self._read_index()
+        except BaseException:
+            self.close()
+            raise
+
+    def _read_record(self, offset):
+        """ Returns the kind and the data of the record at `offset` and the
+        offset of the next record. """
+        start = offset + 1 + _LENGTH.size
+        if start > len(self._mmap):
+            return None, None, offset
+        (length,) = _LENGTH.unpack(self._mmap[offset + 1:start])
+        if start + length > len(self._mmap):
+            # incomplete record at the end of the file
+            return None, None, offset
+        return self._mmap[offset:offset + 1], self._mmap[start:start + length], start + length
+
+    def _read_index(self):
+        """ Reads the index at the end of the file or, if it is missing,
+        rebuilds it by scanning the blocks. """
+        size = len(self._mmap)
+        if size >= self._blocks_start + _FOOTER.size:
+            index_offset, footer_magic = _FOOTER.unpack(self._mmap[size - _FOOTER.size:])
+            if footer_magic == FOOTER_MAGIC and self._blocks_start <= index_offset < size:
+                kind, data, _next = self._read_record(index_offset)
+                if kind == b'I':
+                    return json.loads(data)
+
+        _logger.info("Replay has no index. Scanning the blocks.")
+        index = []
+        offset = self._blocks_start
+        while True:
+            kind, data, next_offset = self._read_record(offset)
+            if kind != b'B':
+                break
+            frames = self._decode_block(data)
+            keyframe = frames[0]['keyframe']
+            index.append([offset, keyframe.get('round'), keyframe.get('turn'), len(frames)])
+            offset = next_offset
+        return index
+
+    def _decode_block(self, data):
+        payload = _decompress(data, self.header['compression'])
+        return [json.loads(line) for line in payload.splitlines()]
+
+    def _read_block(self, offset):
+        kind, data, _next = self._read_record(offset)
+        if kind != b'B':
+            raise ValueError(f"No replay block at offset {offset}.")
+        return self._decode_block(data)
+
+    def _block_states(self, frames):
+        state = None
+        for frame in frames:
+            if 'keyframe' in frame:
+                state = frame['keyframe']
+            else:
+                state = _apply_delta(state, frame['delta'])
+            yield self._decoded({**self._static, **state})
+
+    def __len__(self):
+        return sum(num_states for *_, num_states in self.index)
+
+    def _state_at(self, idx):
+        for offset, _round, _turn, num_states in self.index:
+            if idx < num_states:
+                return next(itertools.islice(self._block_states(self._read_block(offset)), idx, None))
+            idx -= num_states
+
+    def states(self, round=None, turn=None):
+        """ Iterates over the states, starting at the given round and turn
+        (or at the beginning of the game if round is None). """
+        start = _frame_key(round, turn)
+        first_block = 0
+        if round is not None:
+            for idx, (_offset, block_round, block_turn, _num) in enumerate(self.index):
+                if _frame_key(block_round, block_turn) <= start:
+                    first_block = idx
+        for offset, *_ in self.index[first_block:]:
+            for state in self._block_states(self._read_block(offset)):
+                if round is None or _frame_key(state.get('round'), state.get('turn')) >= start:
+                    yield state
+
+
+class LegacyReplayReader(_Reader):
+    """ Reads a replay file of version 1 (JSON states separated by 0x04).
+
+    The file is memory-mapped and the states are decoded lazily. As there is
+    no index, `states(round)` has to decode the states before the round.
+
+    Parameters
+    ----------
+    path : str or Path
+        The replay file
+    tuples : bool
+        If True, the positions in the walls, bots and food are tuples.
+        As every state holds the walls, they are converted only when they
+        differ from the walls of the previous state.
+    """
+    SEPARATOR = b'\x04'
+
+    def _frames(self):
+        """ Iterates over the (undecoded) states in the file. """
+        offset = 0
+        size = len(self._mmap)
+        while offset < size:
+            end = self._mmap.find(self.SEPARATOR, offset)
+            if end == -1:
+                end = size
+            frame = self._mmap[offset:end]
+            if frame.strip():
+                yield frame
+            offset = end + 1
+
+    def __len__(self):
+        return sum(1 for _frame in self._frames())
+
+    def states(self, round=None, turn=None):
+        """ Iterates over the states, starting at the given round and turn
+        (or at the beginning of the game if round is None). """
+        start = _frame_key(round, turn)
+        walls = None
+        for frame in self._frames():
+            state = json.loads(frame)
+            if round is not None and _frame_key(state.get('round'), state.get('turn')) < start:
+                continue
+            if self.tuples and 'walls' in state:
+                if walls is None or walls[0] != state['walls']:
+                    walls = (state['walls'], _as_tuples(state['walls']))
+                state['walls'] = walls[1]
+            yield self._decoded(state)
+
+
+def is_replay_v2(path):
+    """ Checks if the file at `path` is a replay file of version 2. """
+    with open(path, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def open_replay(path, tuples=False):
+    """ Returns a `ReplayReader` or a `LegacyReplayReader` for the replay
+    file at `path`. """
+    if is_replay_v2(path):
+        return ReplayReader(path, tuples=tuples)
+    return LegacyReplayReader(path, tuples=tuples)
+
+
+def read_replay(path, tuples=False):
+    """ Iterates over the states in a replay file of either version
+    or in a re-simulated moves-only replay. """
+    if is_moves_file(path):
+        for state in resimulate(path):
+            if tuples:
+                for key in POSITION_FIELDS:
+                    state[key] = _as_tuples(state[key])
+            yield state
+        return
+    with open_replay(path, tuples=tuples) as reader:
+        yield from reader
+
+
+## Moves-only replays
+
+# A game is determined by the layout, the settings, the state of the game’s rng
+# and the replies of the teams. A moves file (gzip compressed JSON after
+# MOVES_MAGIC) stores only these. The states are rebuilt with `resimulate`.
+
+MOVES_MAGIC = b'PELITA-MOVES\n'
+MOVES_VERSION = 1
+
+
+def layout_hash(layout_str):
+    """ Returns a hash of the layout (as a string) to check that a
+    re-simulation uses the same layout. """
+    return hashlib.sha256(layout_str.encode()).hexdigest()
+
+
+class MovesWriter:
+    """ A viewer which records only the moves of a game (and what is needed
+    to re-simulate it with `resimulate`).
+
+    The file is written after the final state or when the writer is closed.
+    The writer must be set up with the game (see `pelita.game.setup_viewers`)
+    so that it receives the initial state of the rng in `show_rng_state`.
+
+    Parameters
+    ----------
+    stream : binary file object
+        The stream to write to
+    """
+    serialization = 'json'
+
+    def __init__(self, stream):
+        self.stream = stream
+        self._game = None
+        self._rng = None
+        self._turns = []
+        self._fatal_errors = None
+        self.closed = False
+
+    def show_rng_state(self, seed, state):
+        """ Stores the seed (if the game was set up with one) or else
+        the state of the game’s rng before the game starts. """
+        self._rng = {'seed': seed} if seed is not None else {'state': state}
+
+    def write_state(self, state):
+        """ Records the given (JSON compatible) viewer state. """
+        if self.closed:
+            raise ValueError("Replay has already been closed.")
+
+        if self._game is None:
+            layout_str = layout.layout_as_str(walls=list(map(tuple, state['walls'])),
+                                              food=list(map(tuple, state['food'])),
+                                              bots=list(map(tuple, state['bots'])),
+                                              shape=tuple(state['shape']))
+            self._game = {
+                'layout': layout_str,
+                'layout_hash': layout_hash(layout_str),
+                'max_rounds': state['max_rounds'],
+                'allow_camping': state['max_food_age'] == math.inf,
+                'error_limit': state['error_limit'],
+                'timeout_length': state['timeout_length'],
+                'team_infos': state['team_infos'],
+            }
+
+        if state['round'] is None:
+            # the team names and errors of the setup
+            self._game['team_names'] = state['team_names']
+            self._game['setup_errors'] = state['fatal_errors']
+        else:
+            turn = state['turn']
+            team = turn % 2
+            requested = state['requested_moves'][turn]
+            position = requested['requested_position'] if requested else None
+            entry = {'move': position}
+            if state['say'][turn]:
+                entry['say'] = state['say'][turn]
+            if position is None:
+                # the request failed
+                if len(state['fatal_errors'][team]) > len(self._fatal_errors[team]):
+                    entry['fatal'] = state['fatal_errors'][team][-1]
+                elif state['errors'][team] is not None:
+                    entry['error'] = state['errors'][team]
+            self._turns.append(entry)
+        self._fatal_errors = state['fatal_errors']
+
+        if state['gameover']:
+            self.close()
+
+    def close(self):
+        """ Writes the file. The stream is not closed. """
+        if self.closed:
+            return
+        self.closed = True
+        if self._game is None:
+            return
+        if self._rng is None:
+            raise ValueError("The state of the rng is unknown (the writer was not set up with the game).")
+        moves = {'version': MOVES_VERSION, **self._game, 'rng': self._rng, 'turns': self._turns}
+        self.stream.write(MOVES_MAGIC)
+        self.stream.write(gzip.compress(_dumps(moves).encode(), mtime=0))
+        self.stream.flush()
+
+    def show_state(self, game_state):
+        self.show_encoded_state(game_state, encode_viewer_state(game_state, self.serialization))
+
+    def show_encoded_state(self, game_state, encoded_state):
+        self.write_state(json.loads(encoded_state))
+
+
+def is_moves_file(path):
+    """ Checks if the file at `path` is a moves-only replay. """
+    with open(path, 'rb') as f:
+        return f.read(len(MOVES_MAGIC)) == MOVES_MAGIC
+
+
+def load_moves(path):
+    """ Reads a moves-only replay written by `MovesWriter`. """
+    with open(path, 'rb') as f:
+        if f.read(len(MOVES_MAGIC)) != MOVES_MAGIC:
+            raise ValueError(f"{path} is not a moves file.")
+        moves = json.loads(gzip.decompress(f.read()))
+    if moves['version'] != MOVES_VERSION:
+        raise ValueError(f"Unsupported moves file version {moves['version']}.")
+    return moves
+
+
+def _replayed_exception(event, fatal, args=None):
+    """ Returns an exception which the engine records exactly as `event`. """
+    base = getattr(exceptions, event['type'], None)
+    if not (isinstance(base, type) and issubclass(base, (exceptions.FatalException, exceptions.NonFatalException))):
+        base = exceptions.FatalException if fatal else exceptions.NonFatalException
+    description = event['description']
+    # a subclass with the same name and message
+    exc_class = type(event['type'], (base,), {'__str__': lambda self: description})
+    return exc_class(*(args or (description,)))
+
+
+class ScriptedTeam:
+    """ A team which replays the recorded replies of a team in a moves file.
+
+    Parameters
+    ----------
+    team_name : str
+        The recorded team name
+    turns : list
+        The recorded turns of this team
+    setup_error : dict, optional
+        The recorded fatal error of the team during the setup
+    """
+    def __init__(self, team_name, turns, setup_error=None):
+        self.team_name = team_name
+        self._turns = iter(turns)
+        self._setup_error = setup_error
+
+    def set_initial(self, team_id, game_state):
+        if self._setup_error is not None:
+            # `_set_initial_failed` takes the team name from the arguments
+            name = self.team_name[3:-3] if self.team_name.startswith('%%%') else ''
+            args = (name, self._setup_error['description']) if name and name != 'error' else None
+            raise _replayed_exception(self._setup_error, fatal=True, args=args)
+        return self.team_name
+
+    def get_move(self, game_state):
+        try:
+            entry = next(self._turns)
+        except StopIteration:
+            raise ValueError("The moves file has no more moves for this team.") from None
+        if 'fatal' in entry:
+            raise _replayed_exception(entry['fatal'], fatal=True)
+        if 'error' in entry:
+            raise _replayed_exception(entry['error'], fatal=False)
+        return {'move': entry['move'], 'say': entry.get('say', '')}
+
+    def _exit(self, game_state=None):
+        pass
+
+    def __repr__(self):
+        return f'ScriptedTeam({self.team_name!r})'
+
+
+class _StateCollector:
+    """ A viewer which collects the states of a re-simulation (with the
+    same types as the states that are read from a replay). """
+    serialization = 'json'
+
+    def __init__(self):
+        self._states = []
+
+    def show_encoded_state(self, game_state, encoded_state):
+        self._states.append(json.loads(encoded_state))
+
+    def pop_states(self):
+        states, self._states = self._states, []
+        return states
+
+
+def resimulate(moves, engine='dict'):
+    """ Re-simulates a game from a moves-only replay and iterates over the
+    viewer states of all turns (starting with the states of the setup).
+
+    The states are the same as in the original game, apart from the time
+    that the teams needed (`team_time`). A re-simulation that diverges
+    from the recorded moves therefore points to non-determinism in the engine.
+
+    Parameters
+    ----------
+    moves : dict or str or Path
+        The moves (see `load_moves`) or the path of a moves file
+    engine : str
+        The engine for the game state (see `pelita.game.run_game`)
+    """
+    from . import game
+
+    if not isinstance(moves, dict):
+        moves = load_moves(moves)
+    if layout_hash(moves['layout']) != moves['layout_hash']:
+        raise ValueError("The layout does not match its hash.")
+
+    if 'seed' in moves['rng']:
+        rng = Random(moves['rng']['seed'])
+    else:
+        version, state, gauss_next = moves['rng']['state']
+        rng = Random()
+        rng.setstate((version, tuple(state), gauss_next))
+
+    turns = moves['turns']
+    teams = [ScriptedTeam(team_name, turns[idx::2], setup_error=(errors[0] if errors else None))
+             for idx, (team_name, errors) in enumerate(zip(moves['team_names'], moves['setup_errors']))]
+
+    collector = _StateCollector()
+    game_state = game.setup_game(teams, layout_dict=layout.parse_layout(moves['layout']),
+                                 max_rounds=moves['max_rounds'], rng=rng,
+                                 allow_camping=moves['allow_camping'], error_limit=moves['error_limit'],
+                                 timeout_length=moves['timeout_length'],
+                                 team_infos=tuple(moves['team_infos']),
+                                 viewers=[collector], print_result=False, engine=engine)
+    yield from collector.pop_states()
+    while not game_state['gameover']:
+        game_state = game.play_turn(game_state)
+        yield from collector.pop_states()
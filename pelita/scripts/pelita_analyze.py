@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+
+import logging
+from pathlib import Path
+
+import click
+from rich import print as pprint
+
+from ..analyze import update_stats
+from .script_utils import start_logging
+
+_logger = logging.getLogger(__name__)
+
+
+def print_summary(stats, new_files):
+    games = int(stats['games'])
+    pprint(f"Analysed [b]{len(new_files)}[/b] new replays ({games} games in total).")
+    if not games:
+        return
+    wins = stats['wins']
+    pprint(f"Wins: team 0: {wins[0]}, team 1: {wins[1]}, draws: {wins[2]}")
+    moves = stats['moves']
+    for team in (0, 1):
+        error_rate = stats['errors'][team] / moves[team] if moves[team] else 0
+        enemy_zone = stats['enemy_zone'][team].sum() / moves[team] if moves[team] else 0
+        pprint(f"Team {team}: "
+               f"{stats['food_eaten'][team].sum() / games:.1f} food eaten per game, "
+               f"{enemy_zone:.1%} of the moves in the enemy homezone, "
+               f"error rate {error_rate:.2%}, "
+               f"{stats['fatal_errors'][team]} fatal errors")
+
+
+@click.command(help="Collect statistics from all replays in DIRECTORY "
+                    "(e.g. the log folder of a tournament). Only the replays that are "
+                    "not in OUTPUT yet are analysed.")
+@click.argument('directory', type=click.Path(exists=True, file_okay=False, path_type=Path))
+@click.option('--output', '-o', type=click.Path(dir_okay=False, path_type=Path),
+              help="The .npz file for the statistics (default: DIRECTORY/analysis.npz)")
+@click.option('--jobs', '-j', type=int, default=None,
+              help="The number of processes (default: number of CPUs)")
+@click.option('--log',
+              is_flag=False, flag_value="-", default=None, metavar='LOGFILE',
+              help="print debugging log information to LOGFILE (default 'stderr')")
+def main(directory, output, jobs, log):
+    if log is not None:
+        start_logging(log)
+    if output is None:
+        output = directory / 'analysis.npz'
+    stats, new_files = update_stats(directory, output, processes=jobs)
+    print_summary(stats, new_files)
+    if new_files:
+        pprint(f"Saved to {output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -9,13 +9,9 @@ from pathlib import Path
 from urllib.parse import urlparse
 
 import zmq
-from rich.console import Console
-from rich.prompt import Prompt
 
 import pelita
 from pelita.network import PELITA_PORT
-# TODO: The check_team option
-from pelita.tournament import check_team
 
 from .script_utils import start_logging
 
@@ -29,6 +25,8 @@ def scan(team_spec):
         return team_spec
     from queue import Empty, Queue
 
+    from rich.console import Console
+    from rich.prompt import Prompt
     from zeroconf import ServiceBrowser, ServiceStateChange, Zeroconf
 
     SCAN_TIME = 5 # seconds
@@ -102,6 +100,9 @@ def scan(team_spec):
 
 
 def scan_server(team_spec):
+    from rich.console import Console
+    from rich.prompt import Prompt
+
     parsed_url = urlparse(team_spec)
     if parsed_url.port:
         port = parsed_url.port
@@ -211,6 +212,9 @@ parser.add_argument('--log', help='Print debugging log information to'
                     metavar='LOGFILE', const='-', nargs='?')
 parser.add_argument('--write-replay', help=long_help('Print game dumps to file (will be overwritten)'),
                     metavar='REPLAYFILE', const='pelita.dump', nargs='?')
+parser.add_argument('--write-moves', help=long_help('Record only the moves of the game to file (will be overwritten). '
+                                                    'Such a file can be replayed with --replay as well.'),
+                    metavar='MOVESFILE', dest='write_moves')
 parser.add_argument('--replay', help=long_help('Replay a dumped game'),
                     metavar='REPLAYFILE', dest='replayfile', const='pelita.dump', nargs='?')
 parser.add_argument('--store-output', help=long_help('Write all player’s stdout/stderr to the given folder (must exist)'),
@@ -277,10 +281,25 @@ parser.set_defaults(viewer='tk')
 advanced_settings = parser.add_argument_group('Advanced settings')
 advanced_settings.add_argument('--reply-to', type=str, metavar='URL', dest='reply_to',
                                help=long_help('Communicate the result of the game on this channel.'))
+advanced_settings.add_argument('--reply-subscription', type=str, metavar='SPEC', dest='reply_subscription',
+                               help=long_help('The states that are sent to --reply-to: '
+                                              '"turn" (default), "round[/N]" (every Nth round) or "final", '
+                                              'optionally followed by ":field,field,..." to only send these fields.'))
 advanced_settings.add_argument('--publish', type=str, metavar='URL', dest='publish_to',
                                help=long_help('Publish the game to this zmq socket.'))
+advanced_settings.add_argument('--publish-max-fps', type=float, metavar='FPS', dest='publish_max_fps',
+                               help=long_help('Publish at most FPS states per second (the initial and '
+                                              'the final states are always published).'))
+advanced_settings.add_argument('--publish-hwm', type=int, metavar='N', dest='publish_hwm',
+                               help=long_help('Drop published states for subscribers which are more than N messages behind '
+                                              '(this may drop the initial and the final states as well).'))
 advanced_settings.add_argument('--controller', type=str, metavar='URL', default="tcp://127.0.0.1",
                                help=long_help('Channel for controlling the game.'))
+advanced_settings.add_argument('--player-pool', type=str, metavar='URL', dest='player_pool',
+                               help=long_help('Start the remote players through the player pool at this address.'))
+advanced_settings.add_argument('--transport', type=str, choices=['tcp', 'ipc', 'inproc'], default='tcp',
+                               help=long_help('Connect to the local players and the viewer over tcp (default), '
+                                              'ipc (socket files) or inproc (players in threads of the game process).'))
 
 parser.epilog = """\
 Team Specification:
@@ -326,6 +345,9 @@ def main():
         raise ValueError(f"Must play at least one round (rounds={args.rounds}).")
 
     if args.check_team:
+        # TODO: The check_team option
+        from pelita.tournament import check_team
+
         if not args.team_specs:
             raise ValueError("No teams specified.")
         for team_spec in args.team_specs:
@@ -360,28 +382,24 @@ def main():
         viewers = [(args.viewer, None)]
 
     if args.reply_to:
-        viewers.append(('reply-to', args.reply_to))
+        viewers.append(('reply-to', {'address': args.reply_to, 'subscription': args.reply_subscription}))
     if args.publish_to:
-        viewers.append(('publish-to', args.publish_to))
+        viewers.append(('publish-to', {'address': args.publish_to, 'max_fps': args.publish_max_fps,
+                                       'hwm': args.publish_hwm}))
     if args.write_replay:
         viewers.append(('write-replay-to', args.write_replay))
+    if args.write_moves:
+        viewers.append(('record-moves-to', args.write_moves))
 
     if args.replayfile:
-        viewer_state = pelita.game.setup_viewers(viewers)
+        viewer_state = pelita.game.setup_viewers(viewers, transport=args.transport)
         if pelita.game.controller_exit(viewer_state, await_action='set_initial'):
             sys.exit(0)
 
-        old_game = Path(args.replayfile).read_text().split("\x04")
-        for state in old_game:
-            if not state.strip():
-                continue
-            state = json.loads(state)
-            # walls, bots, food must be list of tuple
-            state['walls'] = list(map(tuple, state['walls']))
-            state['bots'] = list(map(tuple, state['bots']))
-            state['food'] = list(map(tuple, state['food']))
-            for viewer in viewer_state['viewers']:
-                viewer.show_state(state)
+        # walls, bots, food must be list of tuple
+        for state in pelita.replay.read_replay(args.replayfile, tuples=True):
+            viewers = pelita.viewer.subscribed_viewers(viewer_state['viewers'], state)
+            pelita.viewer.show_viewer_state(viewers, state)
             if pelita.game.controller_exit(viewer_state):
                 break
 
@@ -461,10 +479,18 @@ def main():
         # We only want to print this, when no seed has been given.
         print(f"Replay this game with --seed {seed}")
 
+    if args.player_pool:
+        from pelita.launcher import PoolClient
+        launcher = PoolClient(args.player_pool)
+    else:
+        launcher = None
+
     pelita.game.run_game(team_specs=team_specs, max_rounds=args.rounds, layout_dict=layout_dict, rng=rng,
                          allow_camping=args.allow_camping, timeout_length=args.timeout_length, error_limit=args.error_limit,
                          viewers=viewers,
                          store_output=args.store_output,
+                         launcher=launcher,
+                         transport=args.transport,
                          team_infos=(args.append_blue, args.append_red))
 
 if __name__ == '__main__':
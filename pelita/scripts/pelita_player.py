@@ -1,17 +1,21 @@
 #!/usr/bin/env python3
 
 import contextlib
-import hashlib
 import importlib
 import json
 import logging
+import os
+import signal
 import sys
+import traceback
 from pathlib import Path
 
 import click
 import zmq
 
-from ..network import json_default_handler
+from ..launcher import hash_files
+from ..network import (choose_protocol, decode_message, encode_message,
+                       message_protocol)
 from ..team import make_team
 from .script_utils import start_logging
 
@@ -26,7 +30,7 @@ def with_sys_path(dirname):
     finally:
         sys.path.remove(dirname)
 
-def run_player(team_spec, address, team_name_override=False, silent_bots=False):
+def run_player(team_spec, address, team_name_override=False, silent_bots=False, team=None, zmq_context=None):
     """ Creates a team from `team_spec` and runs
     a game through the zmq PAIR socket on `address`.
 
@@ -36,12 +40,17 @@ def run_player(team_spec, address, team_name_override=False, silent_bots=False):
         path to the module that declares the team
     address : address to zmq PAIR socket
         the address of the remote team socket
+    team : Team, optional
+        the already loaded team for `team_spec` (used by the fork server)
+    zmq_context : zmq.Context, optional
+        the context for the socket (an inproc address must be connected
+        from the context that it has been bound in)
 
     """
 
     address = address.replace('*', 'localhost')
     # Connect to the given address
-    context = zmq.Context()
+    context = zmq_context if zmq_context is not None else zmq.Context()
     socket = context.socket(zmq.PAIR)
     try:
         socket.connect(address)
@@ -49,26 +58,13 @@ def run_player(team_spec, address, team_name_override=False, silent_bots=False):
         raise IOError(f"Failed to connect the client to address {address}: {e}")
 
     try:
-        team = load_team(team_spec)
+        if team is None:
+            team = load_team(team_spec)
     except Exception as e:
         # We could not load the team.
         # Wait for the set_initial message from the server
         # and reply with an error.
-        try:
-            json_message = socket.recv_unicode()
-            py_obj = json.loads(json_message)
-            uuid_ = py_obj["__uuid__"]
-            _action = py_obj["__action__"]
-            _data = py_obj["__data__"]
-
-            socket.send_json({
-                '__uuid__': uuid_,
-                '__error__': e.__class__.__name__,
-                '__error_msg__': f'Could not load {team_spec}: {e}'
-            })
-        except zmq.ZMQError as e:
-            raise IOError('failed to connect the client to address %s: %s'
-                          % (address, e))
+        reply_load_error(socket, team_spec, address, e)
         # TODO: Do not raise here but wait for zmq to return a sensible error message
         # We need a way to distinguish between syntax errors in the client
         # and general zmq disconnects
@@ -79,9 +75,193 @@ def run_player(team_spec, address, team_name_override=False, silent_bots=False):
     while True:
         cont = player_handle_request(socket, team, team_name_override=team_name_override, silent_bots=silent_bots)
         if not cont:
+            socket.close()
             return
 
 
+def reply_load_error(socket, team_spec, address, error):
+    """ Waits for the first request on `socket` and replies with the
+    error that occurred while loading the team. """
+    try:
+        py_obj = decode_message(socket.recv())
+        uuid_ = py_obj["__uuid__"]
+        _action = py_obj["__action__"]
+        _data = py_obj["__data__"]
+
+        socket.send_json({
+            '__uuid__': uuid_,
+            '__error__': error.__class__.__name__,
+            '__error_msg__': f'Could not load {team_spec}: {error}'
+        })
+    except zmq.ZMQError as e:
+        raise IOError('failed to connect the client to address %s: %s'
+                      % (address, e))
+
+
+@contextlib.contextmanager
+def redirect_output(stdout=None, stderr=None):
+    """ Redirects the stdout and stderr file descriptors of the process
+    to the files at the given paths (None keeps the current one). """
+    redirected = []
+    try:
+        for path, stream, fd in [(stdout, sys.stdout, 1), (stderr, sys.stderr, 2)]:
+            if path is None:
+                continue
+            stream.flush()
+            saved_fd = os.dup(fd)
+            with open(path, 'w') as f:
+                os.dup2(f.fileno(), fd)
+            redirected.append((stream, fd, saved_fd))
+        yield
+    finally:
+        for stream, fd, saved_fd in redirected:
+            stream.flush()
+            os.dup2(saved_fd, fd)
+            os.close(saved_fd)
+
+
+def run_pool_worker(team_spec, control_address):
+    """ Loads the team from `team_spec` once and plays all games
+    that a `pelita.launcher.PlayerPool` sends to `control_address`.
+
+    Parameters
+    ----------
+    team_spec : str
+        path to the module that declares the team
+    control_address : str
+        the address of the pool’s control socket for this worker
+    """
+    context = zmq.Context()
+    control = context.socket(zmq.PAIR)
+    control.connect(control_address)
+
+    try:
+        team = load_team(team_spec)
+        load_error = None
+    except Exception as e:
+        team = None
+        load_error = e
+    else:
+        # the pool restarts the worker when one of these files changes
+        files = team_module_files(team_spec)
+        control.send_json({'status': 'loaded', 'files': files, 'hash': hash_files(files)})
+
+    while True:
+        message = control.recv_json()
+        if message['action'] == 'exit':
+            break
+
+        address = message['address'].replace('*', 'localhost')
+        with redirect_output(message.get('stdout'), message.get('stderr')):
+            socket = context.socket(zmq.PAIR)
+            socket.connect(address)
+            try:
+                if team is None:
+                    reply_load_error(socket, team_spec, address, load_error)
+                else:
+                    _logger.info(f"Running player '{team_spec}' ({team.team_name}) on {address}")
+                    while player_handle_request(socket, team):
+                        pass
+            finally:
+                # give the last reply some time to be delivered
+                socket.close(linger=1000)
+
+        if team is None:
+            control.send_json({'status': 'failed'})
+            break
+        control.send_json({'status': 'done'})
+
+    control.close(linger=1000)
+    context.term()
+
+
+def run_fork_server(reply_fd, preload=()):
+    """ Forks a new player process for every request on stdin.
+
+    The fork server imports everything that a player usually needs (and
+    the teams in `preload`) once, so that the forked players can start
+    playing right away. It must not create a zmq context itself, as zmq
+    does not survive a fork; the players create their own contexts.
+
+    Every request is a line of JSON with the keys 'team_spec', 'address',
+    'stdout' and 'stderr' (see `pelita.launcher.ForkServer`). Only the teams
+    which have been preloaded can be requested: the forked process has
+    imported their modules, so it could not load another team with the
+    same module name. The pid of
+    the forked player is written as a line of JSON to the file descriptor
+    `reply_fd`. The fork server exits when stdin is closed.
+
+    Before the first request, the source files of every preloaded team
+    (and their hash) are written to `reply_fd`, so that the launcher knows
+    when a preloaded team has changed.
+
+    Parameters
+    ----------
+    reply_fd : int
+        the file descriptor for the replies
+    preload : list of str
+        team specs to load in advance
+    """
+    # Import what the players would import anyway
+    from .. import game, layout  # noqa: F401
+    for module in ['numpy', 'networkx']:
+        try:
+            importlib.import_module(module)
+        except ImportError:
+            pass
+
+    teams = {}
+    for team_spec in preload:
+        try:
+            teams[team_spec] = load_team(team_spec)
+        except Exception as e:
+            # The launcher starts this team in a new process, which reports the error
+            _logger.warning(f"Could not preload team {team_spec}: {e!r}")
+
+    preloaded = {}
+    for team_spec in teams:
+        files = team_module_files(team_spec)
+        preloaded[team_spec] = {'files': files, 'hash': hash_files(files)}
+
+    # The players are reaped automatically
+    signal.signal(signal.SIGCHLD, signal.SIG_IGN)
+
+    with os.fdopen(reply_fd, 'w') as reply:
+        reply.write(json.dumps({'preloaded': preloaded}) + '\n')
+        reply.flush()
+        for line in sys.stdin:
+            request = json.loads(line)
+            pid = os.fork()
+            if pid == 0:
+                reply.close()
+                _run_forked_player(request, teams.get(request['team_spec']))
+            reply.write(json.dumps({'pid': pid}) + '\n')
+            reply.flush()
+
+
+def _run_forked_player(request, team):
+    """ Runs the player for `request` in the forked process and exits. """
+    exitcode = 1
+    try:
+        signal.signal(signal.SIGCHLD, signal.SIG_DFL)
+        # Detach from the requests of the fork server
+        # and send the output to the requested files
+        with open(os.devnull) as devnull:
+            os.dup2(devnull.fileno(), 0)
+        for path, fd in [(request.get('stdout'), 1), (request.get('stderr'), 2)]:
+            if path is not None:
+                with open(path, 'w') as f:
+                    os.dup2(f.fileno(), fd)
+        run_player(request['team_spec'], request['address'], team=team)
+        exitcode = 0
+    except Exception:
+        traceback.print_exc()
+    finally:
+        sys.stdout.flush()
+        sys.stderr.flush()
+        os._exit(exitcode)
+
+
 def player_handle_request(socket, team, team_name_override=False, silent_bots=False):
     """ Awaits a new request on `socket` and dispatches it
     to `team`.
@@ -103,9 +283,17 @@ def player_handle_request(socket, team, team_name_override=False, silent_bots=Fa
     # Waits for incoming requests and tries to get a proper
     # answer from the player.
 
+    # We reply with the protocol of the request
+    protocol = None
+    # and accept the offer of a compact protocol
+    chosen_protocol = None
+
     try:
-        json_message = socket.recv_unicode()
-        py_obj = json.loads(json_message)
+        message = socket.recv()
+        protocol = message_protocol(message)
+        py_obj = decode_message(message)
+        if "__protocols__" in py_obj:
+            chosen_protocol = choose_protocol(py_obj["__protocols__"])
         msg_id = py_obj["__uuid__"]
         action = py_obj["__action__"]
         data = py_obj["__data__"]
@@ -114,8 +302,11 @@ def player_handle_request(socket, team, team_name_override=False, silent_bots=Fa
         # feed client actor here …
         if action == "set_initial":
             retval = team.set_initial(**data)
-        elif action == "get_move":
-            retval = team.get_move(**data)
+        elif action in ("get_move", "get_move_delta"):
+            if action == "get_move":
+                retval = team.get_move(**data)
+            else:
+                retval = team.get_move_delta(**data)
             if silent_bots:
                 # We want to remove a speak attribute
                 # but we don’t care if it fails at all
@@ -182,11 +373,15 @@ def player_handle_request(socket, team, team_name_override=False, silent_bots=Fa
         return False
 
     finally:
-        # we use our own json_default_handler
-        # to automatically convert numpy ints to json
-        json_message = json.dumps(message_obj, default=json_default_handler)
+        if chosen_protocol is not None:
+            message_obj['__protocol__'] = chosen_protocol
+        # numpy ints are converted automatically
+        message = encode_message(message_obj, protocol)
         # return the message
-        socket.send_unicode(json_message)
+        if isinstance(message, str):
+            socket.send_unicode(message)
+        else:
+            socket.send(message)
         if '__error__' in message_obj:
             _logger.warning("o-!> %r [%s]", message_obj['__error__'], msg_id)
         else:
@@ -320,6 +515,20 @@ def remote_game(team, address, team_name_override, silent_bots):
     run_player(team, address, team_name_override=team_name_override, silent_bots=silent_bots)
 
 
+@main.command("pool-worker", hidden=True, help="Load team and play the games sent to the control address.")
+@click.argument('team')
+@click.argument('control_address')
+def pool_worker(team, control_address):
+    run_pool_worker(team, control_address)
+
+
+@main.command("fork-server", hidden=True, help="Fork a player for every request on stdin.")
+@click.argument('reply_fd', type=int)
+@click.option('--preload', multiple=True, metavar='TEAM', help='Load TEAM in advance')
+def fork_server(reply_fd, preload):
+    run_fork_server(reply_fd, preload)
+
+
 @main.command("check-team", help="Load team and print its name.")
 @click.argument('team')
 def cli_check_team(team):
@@ -333,26 +542,30 @@ def cli_hash_team(team):
 def check_team(team):
     print(load_team(team).team_name)
 
-def hash_team(team):
-    # Load the team so that we have the modules ready
-    load_team(team)
+def team_module_files(team):
+    """ Returns the source files of all imported modules that belong to
+    `team` (i.e. that are in the folder of the team), sorted by module name.
 
+    The team must have been loaded already.
+    """
     folder = Path(team).parent.resolve()
     modules = []
-    for name, module in sys.modules.items():
+    for name, module in list(sys.modules.items()):
         if hasattr(module, '__file__') and module.__file__:
             path = Path(module.__file__)
             if path.is_relative_to(folder):
-                modules.append([name, path])
+                modules.append([name, str(path)])
+    return [path for name, path in sorted(modules)]
 
-    _logger.debug(f"Hashing module {team}")
+def hash_team(team):
+    # Load the team so that we have the modules ready
+    load_team(team)
 
-    # sort relative paths by module name and generate our sha
-    sha1 = hashlib.sha1()
-    for module, path in sorted(modules):
-        _logger.debug(f"Hashing {team}: Adding {module}")
-        sha1.update(path.read_bytes())
-    res = sha1.hexdigest()
+    _logger.debug(f"Hashing module {team}")
+    files = team_module_files(team)
+    for path in files:
+        _logger.debug(f"Hashing {team}: Adding {path}")
+    res = hash_files(files)
     _logger.debug(f"SHA1 for {team}: {res}.")
     return res
 
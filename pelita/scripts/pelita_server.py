@@ -24,7 +24,7 @@ from rich import print as pprint
 from rich.progress import (BarColumn, MofNCompleteColumn, Progress,
                            SpinnerColumn, Task, TextColumn, TimeElapsedColumn)
 
-from ..network import PELITA_PORT
+from ..network import PELITA_PORT, decode_message
 from .script_utils import start_logging
 
 _logger = logging.getLogger(__name__)
@@ -348,7 +348,7 @@ class PelitaServer:
             return
 
         try:
-            msg_obj = json.loads(process_info.info.last_msg)
+            msg_obj = decode_message(process_info.info.last_msg)
         except ValueError as e:
             progress.console.log(f"Error {e!r} when parsing incoming message. Ignoring.")
             _logger.warning(f"Error {e!r} when parsing incoming message. Ignoring.")
@@ -1,6 +1,7 @@
 #!/usr/bin/env python3
 
 import argparse
+import contextlib
 import datetime
 import itertools
 import re
@@ -13,6 +14,7 @@ from random import Random
 import yaml
 
 from .. import tournament
+from ..launcher import PlayerPool
 from .script_utils import start_logging
 
 
@@ -229,6 +231,8 @@ def main():
                         action='store_true')
     parser.add_argument('--dry-run', help='do not actually play',
                         action='store_true')
+    parser.add_argument('--player-pool', help='reuse the player processes across matches',
+                        action='store_true')
 
     args = parser.parse_args()
     if args.help:
@@ -287,11 +291,17 @@ def main():
     else:
         tournament.present_teams(config)
 
-    rr_ranking = tournament.play_round1(config, state, rng)
-    state.round2["round_robin_ranking"] = rr_ranking
-    state.save(args.state)
+    with contextlib.ExitStack() as stack:
+        if args.player_pool:
+            pool = stack.enter_context(PlayerPool())
+            config.player_pool = pool.serve([config.team_spec(team) for team in config.team_ids],
+                                            output_dir=config.tournament_log_folder)
+
+        rr_ranking = tournament.play_round1(config, state, rng)
+        state.round2["round_robin_ranking"] = rr_ranking
+        state.save(args.state)
 
-    winner = tournament.play_round2(config, rr_ranking, state, rng)
+        winner = tournament.play_round2(config, rr_ranking, state, rng)
 
     config.print('The winner of the %s Pelita tournament is...' % config.location, wait=2, end=" ")
     config.print('{team_group}: {team_name}. Congratulations'.format(
@@ -1,22 +1,21 @@
 
 import logging
-import os
-import subprocess
-import sys
+import math
 import traceback
+from collections.abc import Sequence
 from io import StringIO
-from pathlib import Path
 from random import Random
 from urllib.parse import urlparse
 
-import networkx as nx
 import zmq
 
 from . import layout
 from .exceptions import PlayerDisconnected, PlayerTimeout
+from .launcher import SubprocessLauncher, ThreadLauncher
 from .layout import BOT_I2N, layout_as_str, wall_dimensions
-from .network import (PELITA_PORT, ZMQClientError, ZMQConnection,
-                      ZMQReplyTimeout, ZMQUnreachablePeer)
+from .network import (PELITA_PORT, AsyncZMQConnection, ZMQClientError,
+                      ZMQConnection, ZMQReplyTimeout, ZMQUnreachablePeer,
+                      bind_socket, local_address, remove_address)
 
 _logger = logging.getLogger(__name__)
 
@@ -30,6 +29,53 @@ def _ensure_tuple_tuples(set):
     return tuple(sorted(tuple(item) for item in set))
 
 
+#: Position lists in the bot state that are sent as differences
+_DELTA_LISTS = ('food', 'shaded_food')
+
+def _state_delta(previous, game_state):
+    """ Returns the changes in the bot state `game_state` since the bot
+    state `previous`. Unchanged values in the team and enemy states are
+    left out and the food lists are sent as added and removed positions.
+
+    The full state can be restored with `_apply_state_delta`.
+    """
+    delta = {key: value for key, value in game_state.items() if key not in ('team', 'enemy')}
+    for side in ('team', 'enemy'):
+        old_state = previous[side]
+        changed = {}
+        added = {}
+        removed = {}
+        for key, value in game_state[side].items():
+            old_value = old_state.get(key)
+            if old_value == value:
+                continue
+            if key in _DELTA_LISTS and old_value is not None:
+                old_positions = set(old_value)
+                positions = set(value)
+                added[key] = sorted(positions - old_positions)
+                removed[key] = sorted(old_positions - positions)
+            else:
+                changed[key] = value
+        delta[side] = {'changed': changed, 'added': added, 'removed': removed}
+    return delta
+
+def _apply_state_delta(previous, delta):
+    """ Restores the full bot state from the state `previous`
+    and the changes `delta` as returned by `_state_delta`. """
+    game_state = {key: value for key, value in delta.items() if key not in ('team', 'enemy')}
+    for side in ('team', 'enemy'):
+        side_state = dict(previous[side])
+        side_delta = delta[side]
+        side_state.update(side_delta['changed'])
+        for key, added in side_delta['added'].items():
+            positions = set(_ensure_list_tuples(side_state[key]))
+            positions.difference_update(_ensure_list_tuples(side_delta['removed'][key]))
+            positions.update(_ensure_list_tuples(added))
+            side_state[key] = sorted(positions)
+        game_state[side] = side_state
+    return game_state
+
+
 def create_homezones(shape, walls):
     width, height = shape
     return [
@@ -64,6 +110,8 @@ def walls_to_graph(walls, shape=None):
     adjacent squares. Adjacent means that you can go from one square to one of
     its adjacent squares by making one single step (up, down, left, or right).
     """
+    import networkx as nx
+
     graph = nx.Graph()
     if shape is not None:
         width, height = shape
@@ -105,6 +153,7 @@ class Team:
         - bot._initial_position
         - bot.homezone
         - bot.graph
+        - the maze distances for bot.maze_distance and bot.next_step_towards
 
     Parameters
     ----------
@@ -126,6 +175,9 @@ class Team:
         #: The history of bot positions
         self._bot_track = [[], []]
 
+        #: The last bot state, which a remote game only sends changes for
+        self._last_game_state = None
+
 
     def set_initial(self, team_id, game_state):
         """ Sets the bot indices for the team and returns the team name.
@@ -154,25 +206,37 @@ class Team:
         # Reset the bot tracks
         self._bot_track = [[], []]
 
-        # Store the walls, which are only transmitted once
-        self._walls = _ensure_tuple_tuples(game_state['walls'])
+        self._last_game_state = None
 
-        # Store the shape, which is only transmitted once
-        self._shape = tuple(game_state['shape'])
+        # The walls and the shape are only transmitted once. Everything that we
+        # can derive from them is taken from the (per-process cached) layout index
+        layout_index = layout.get_layout_index(game_state['walls'], game_state['shape'])
+        self._layout_index = layout_index
+
+        # Store the walls and the shape
+        self._walls = layout_index.walls
+        self._shape = layout_index.shape
 
         # Cache the initial positions so that we don’t have to calculate them at each step
-        self._initial_positions = layout.initial_positions(self._walls, self._shape)
+        self._initial_positions = layout_index.initial_positions
 
         # Cache the homezone so that we don’t have to create it at each step
-        self._homezone = create_homezones(self._shape, self._walls)
+        self._homezone = layout_index.homezones
 
-        # Cache the graph representation of the maze -> stores a read-only view of the
+        # The graph representation of the maze is only created (and networkx
+        # only imported) when a bot asks for it -> this is a read-only view of the
         # graph, so that local modifications in the move function are not carried
         # over
-        self._graph = walls_to_graph(self._walls, shape=self._shape).copy(as_view=True)
+        self._graph = None
 
         return self.team_name
 
+    def _team_graph(self):
+        """ Returns the graph of the maze for this game. """
+        if self._graph is None:
+            self._graph = self._layout_index.new_graph()
+        return self._graph
+
     def get_move(self, game_state):
         """ Requests a move from the Player who controls the Bot with id `bot_id`.
 
@@ -188,6 +252,8 @@ class Team:
         -------
         move : dict
         """
+        self._last_game_state = game_state
+
         me = make_bots(walls=self._walls,
                        shape=self._shape,
                        initial_positions=self._initial_positions,
@@ -197,7 +263,9 @@ class Team:
                        round=game_state['round'],
                        bot_turn=game_state['bot_turn'],
                        rng=self._rng,
-                       graph=self._graph)
+                       graph=self._team_graph,
+                       max_rounds=game_state.get('max_rounds'),
+                       layout_index=self._layout_index)
 
         team = me._team
 
@@ -216,7 +284,8 @@ class Team:
             if me._bot_turn != idx:
                 self._bot_track[idx].append(mybot.position)
 
-            mybot.track = self._bot_track[idx][:]
+            # the track list is only appended to, so a view is a snapshot
+            mybot.track = Track(self._bot_track[idx])
 
         try:
             # request a move from the current bot
@@ -244,6 +313,14 @@ class Team:
             "say": me._say
         }
 
+    def get_move_delta(self, game_state):
+        """ Requests a move like `get_move`, but `game_state` only contains
+        the changes since the last request (see `RemoteTeam.get_move`).
+        """
+        if self._last_game_state is None:
+            raise ValueError("Received a state delta without a previous game state.")
+        return self.get_move(_apply_state_delta(self._last_game_state, game_state))
+
     def _exit(self, game_state=None):
         """ Dummy function. Only needed for `RemoteTeam`. """
         pass
@@ -276,9 +353,23 @@ class RemoteTeam:
         It helps in debugging issues with the clients.
         In the special case of store_output==subprocess.DEVNULL, stdout of
         the remote clients will be suppressed.
+    launcher
+        The launcher that starts the player process (see `pelita.launcher`).
+        If None, a new subprocess is started (or a thread for transport 'inproc').
+    transport
+        The transport for the connection to a local player: 'tcp', 'ipc'
+        (a socket file, not available on Windows) or 'inproc' (for players
+        in a thread of this process, see `pelita.launcher.ThreadLauncher`)
     """
-    def __init__(self, team_spec, *, team_name=None, zmq_context=None, idx=None, store_output=False):
-        if zmq_context is None:
+    def __init__(self, team_spec, *, team_name=None, zmq_context=None, idx=None, store_output=False,
+                 launcher=None, transport='tcp'):
+        # the address is checked before anything is started
+        bind_address = local_address(transport)
+
+        if transport == 'inproc':
+            # inproc sockets must share the context with the player threads
+            zmq_context = zmq.Context.instance()
+        elif zmq_context is None:
             zmq_context = zmq.Context()
 
         self._team_spec = team_spec
@@ -287,6 +378,9 @@ class RemoteTeam:
         #: Default timeout for a request, unless specified in the game_state
         self._request_timeout = 3
 
+        #: The last bot state that has been sent to the player
+        self._last_game_state = None
+
         if team_spec.startswith('pelita://'):
             # We connect to a remote player that is listening
             # on the given team_spec address.
@@ -323,55 +417,35 @@ class RemoteTeam:
             self.proc = None
 
         else:
-            # We bind to a local tcp port with a zmq PAIR socket
-            # and start a new subprocess of pelita_player.py
-            # that includes the address of that socket and the
-            # team_spec as command line arguments.
-            # The subprocess will then connect to this address
+            # We bind a zmq PAIR socket to a local address (tcp port,
+            # ipc socket file or inproc name) and let the launcher start
+            # a player (by default a new subprocess of pelita_player.py)
+            # with the address of that socket and the team_spec.
+            # The player will then connect to this address
             # and load the team.
 
             socket = zmq_context.socket(zmq.PAIR)
-            port = socket.bind_to_random_port('tcp://*')
-            self.bound_to_address = f"tcp://localhost:{port}"
+            self.bound_to_address = bind_socket(socket, bind_address)
             if idx == 0:
                 color='blue'
             elif idx == 1:
                 color='red'
             else:
                 color=''
-            self.proc = self._call_pelita_player(team_spec, self.bound_to_address,
-                                                 color=color, store_output=store_output)
+            if launcher is None:
+                launcher = ThreadLauncher.instance() if transport == 'inproc' else SubprocessLauncher()
+            try:
+                #: Handle of the player process
+                self.proc = launcher.launch(team_spec, self.bound_to_address,
+                                            color=color, store_output=store_output)
+            except Exception:
+                socket.close(linger=0)
+                raise
 
-        self.zmqconnection = ZMQConnection(socket)
+        self.zmqconnection = self._make_connection(socket)
 
-    def _call_pelita_player(self, team_spec, address, color='', store_output=False):
-        """ Starts another process with the same Python executable,
-        the same start script (pelitagame) and runs `team_spec`
-        as a standalone client on URL `addr`.
-        """
-        player = 'pelita.scripts.pelita_player'
-        external_call = [sys.executable,
-                         '-m',
-                         player,
-                         'remote-game',
-                         team_spec,
-                         address]
-
-        _logger.debug("Executing: %r", external_call)
-        if store_output == subprocess.DEVNULL:
-            return (subprocess.Popen(external_call, stdout=store_output), None, None)
-        elif store_output:
-            store_path = Path(store_output)
-            stdout = (store_path / f"{color or team_spec}.out").open('w')
-            stderr = (store_path / f"{color or team_spec}.err").open('w')
-
-            # We must run in unbuffered mode to enforce flushing of stdout/stderr,
-            # otherwise we may lose some of what is printed
-            proc = subprocess.Popen(external_call, stdout=stdout, stderr=stderr,
-                                    env=dict(os.environ, PYTHONUNBUFFERED='x'))
-            return (proc, stdout, stderr)
-        else:
-            return (subprocess.Popen(external_call), None, None)
+    def _make_connection(self, socket):
+        return ZMQConnection(socket)
 
     @property
     def team_name(self):
@@ -414,7 +488,15 @@ class RemoteTeam:
     def get_move(self, game_state):
         timeout_length = game_state['timeout_length']
         try:
-            msg_id = self.zmqconnection.send("get_move", {"game_state": game_state})
+            # Players that have negotiated a compact protocol keep the
+            # previous state and only need to know what has changed
+            if self._last_game_state is not None and self.zmqconnection.protocol is not None:
+                msg_id = self.zmqconnection.send("get_move_delta", {
+                    "game_state": _state_delta(self._last_game_state, game_state)
+                })
+            else:
+                msg_id = self.zmqconnection.send("get_move", {"game_state": game_state})
+            self._last_game_state = game_state
             reply = self.zmqconnection.recv_timeout(msg_id, timeout_length)
             # make sure it is a dict
             reply = dict(reply)
@@ -452,16 +534,22 @@ class RemoteTeam:
             if self.zmqconnection.socket.closed:
                 return
             # TODO: Include final state with exit message
-            self.zmqconnection.send("exit", payload, timeout=1)
+            self._send_exit(payload)
             self._sent_exit = True
+            if self.proc:
+                self.proc.release()
         except ZMQUnreachablePeer:
             _logger.info("Remote Player %r is already dead during exit. Ignoring.", self)
 
+    def _send_exit(self, payload):
+        self.zmqconnection.send("exit", payload, timeout=1)
+
     def __del__(self):
         try:
             self._exit()
             if self.proc:
-                self.proc[0].terminate()
+                self.proc.terminate()
+            remove_address(self.bound_to_address)
         except AttributeError:
             # in case we exit before self.proc or self.zmqconnection have been set
             pass
@@ -471,7 +559,89 @@ class RemoteTeam:
         return f"RemoteTeam<{self._team_spec}{team_name} on {self.bound_to_address}>"
 
 
-def make_team(team_spec, team_name=None, zmq_context=None, idx=None, store_output=False):
+class AsyncRemoteTeam(RemoteTeam):
+    """ A `RemoteTeam` for an asyncio game loop (see `pelita.game.run_game_async`).
+
+    The player is started (or connected to) like for a `RemoteTeam`, but
+    `set_initial` and `get_move` are coroutines that do not block the event
+    loop while the player is thinking. The exit message is sent without
+    waiting. By default, all teams share the global zmq context.
+    """
+    def __init__(self, team_spec, *, zmq_context=None, **kwargs):
+        if zmq_context is None:
+            zmq_context = zmq.Context.instance()
+        super().__init__(team_spec, zmq_context=zmq_context, **kwargs)
+
+    def _make_connection(self, socket):
+        import zmq.asyncio
+
+        # the asyncio socket shadows the socket that we have bound (or connected)
+        self._socket = socket
+        return AsyncZMQConnection(zmq.asyncio.Socket.shadow(socket.underlying))
+
+    @property
+    def team_name(self):
+        # We cannot wait for the player here. The name is known after set_initial.
+        return self._team_name
+
+    async def set_initial(self, team_id, game_state):
+        timeout_length = game_state['timeout_length']
+        try:
+            msg_id = await self.zmqconnection.send("set_initial", {"team_id": team_id,
+                                                                  "game_state": game_state})
+            team_name = await self.zmqconnection.recv_timeout(msg_id, timeout_length)
+            if team_name:
+                self._team_name = team_name
+            return team_name
+        except ZMQReplyTimeout:
+            # answer did not arrive in time
+            raise PlayerTimeout()
+        except ZMQUnreachablePeer:
+            _logger.info("Could not properly send the message. Maybe just a slow client. Ignoring in set_initial.")
+        except ZMQClientError as e:
+            error_message = e.message
+            error_type = e.error_type
+            _logger.warning(f"Client connection failed ({error_type}): {error_message}")
+            raise PlayerDisconnected(*e.args) from None
+
+    async def get_move(self, game_state):
+        timeout_length = game_state['timeout_length']
+        try:
+            if self._last_game_state is not None and self.zmqconnection.protocol is not None:
+                msg_id = await self.zmqconnection.send("get_move_delta", {
+                    "game_state": _state_delta(self._last_game_state, game_state)
+                })
+            else:
+                msg_id = await self.zmqconnection.send("get_move", {"game_state": game_state})
+            self._last_game_state = game_state
+            reply = await self.zmqconnection.recv_timeout(msg_id, timeout_length)
+            # make sure it is a dict
+            reply = dict(reply)
+            if "error" in reply:
+                return reply
+            # make sure that the move is a tuple
+            reply["move"] = tuple(reply.get("move"))
+            return reply
+        except ZMQReplyTimeout:
+            # answer did not arrive in time
+            raise PlayerTimeout()
+        except TypeError:
+            # if we could not convert into a tuple or dict (e.g. bad reply)
+            return None
+        except ZMQUnreachablePeer:
+            # if the remote connection is closed
+            raise PlayerDisconnected()
+
+    def _send_exit(self, payload):
+        self.zmqconnection.send_nowait("exit", payload)
+
+    def __repr__(self):
+        team_name = f" ({self._team_name})" if self._team_name else ""
+        return f"AsyncRemoteTeam<{self._team_spec}{team_name} on {self.bound_to_address}>"
+
+
+def make_team(team_spec, team_name=None, zmq_context=None, idx=None, store_output=False, launcher=None,
+              transport='tcp'):
     """ Creates a Team object for the given team_spec.
 
     If no zmq_context is passed for a remote team, then a new context
@@ -480,8 +650,10 @@ def make_team(team_spec, team_name=None, zmq_context=None, idx=None, store_outpu
 
     Parameters
     ----------
-    team_spec : callable or str
+    team_spec : callable or str or team
         A move function or a team_spec that is passed on to pelita_player
+        or an object with `set_initial` and `get_move` methods (like
+        `pelita.replay.ScriptedTeam`), which is used as it is
 
     team_name : str, optional
         Optional team name for a local team
@@ -489,6 +661,12 @@ def make_team(team_spec, team_name=None, zmq_context=None, idx=None, store_outpu
     zmq_context : zmq context, optional
         ZMQ context to avoid having to create a new context for every team
 
+    launcher : optional
+        The launcher for the process of a remote team (see `pelita.launcher`)
+
+    transport : str, optional
+        The transport for a local remote team: 'tcp', 'ipc' or 'inproc'
+
     Returns
     -------
     team_player, zmq_context : tuple
@@ -496,7 +674,9 @@ def make_team(team_spec, team_name=None, zmq_context=None, idx=None, store_outpu
         The new ZMQ context
 
     """
-    if callable(team_spec):
+    if hasattr(team_spec, 'set_initial') and hasattr(team_spec, 'get_move'):
+        team_player = team_spec
+    elif callable(team_spec):
         _logger.info("Making a local team for %s", team_spec)
         # wrap the move function in a Team
         if team_name is None:
@@ -507,14 +687,105 @@ def make_team(team_spec, team_name=None, zmq_context=None, idx=None, store_outpu
         # set up the zmq connections and build a RemoteTeam
         if not zmq_context:
             zmq_context = zmq.Context()
-        team_player = RemoteTeam(team_spec=team_spec, zmq_context=zmq_context, idx=idx, store_output=store_output)
+        team_player = RemoteTeam(team_spec=team_spec, zmq_context=zmq_context, idx=idx, store_output=store_output,
+                                 launcher=launcher, transport=transport)
     else:
         raise TypeError(f"Not possible to create team from {team_spec} (wrong type).")
 
     return team_player, zmq_context
 
 
+class Track(Sequence):
+    """ A read-only view on the first `length` positions of a bot track.
+
+    The team keeps the positions of each bot in an append-only list, which
+    is replaced by a new list when the bot is killed. A Track is therefore an
+    O(1) snapshot of the track at the time of the turn, instead of a copy of
+    the whole history. It can be indexed and sliced (slices are lists),
+    concatenated with lists and compares equal to a list with the same
+    positions.
+    """
+    __slots__ = ('_positions', '_length')
+
+    def __init__(self, positions=(), length=None):
+        self._positions = positions
+        self._length = len(positions) if length is None else length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._positions[i] for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("track index out of range")
+        return self._positions[index]
+
+    def __iter__(self):
+        positions = self._positions
+        for i in range(self._length):
+            yield positions[i]
+
+    def __eq__(self, other):
+        if isinstance(other, (Track, list, tuple)):
+            return len(self) == len(other) and all(a == b for a, b in zip(self, other))
+        return NotImplemented
+
+    __hash__ = None
+
+    def __add__(self, other):
+        return list(self) + list(other)
+
+    def __radd__(self, other):
+        return list(other) + list(self)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class _TeamData:
+    """ The data that is shared by both bots of a team.
+
+    The food lists are only converted to lists of tuples on first access.
+    Every bot gets its own copy of them (see `Bot.food`).
+    """
+    __slots__ = ('score', 'error_count', 'team_name', 'team_time',
+                 '_raw_food', '_raw_shaded_food', '_food', '_shaded_food')
+
+    def __init__(self, *, score, food, shaded_food, team_name, team_time, error_count):
+        self.score = score
+        self.error_count = error_count
+        self.team_name = team_name
+        self.team_time = team_time
+        self._raw_food = food
+        self._raw_shaded_food = shaded_food
+        self._food = None
+        self._shaded_food = None
+
+    @property
+    def food(self):
+        if self._food is None:
+            self._food = _ensure_list_tuples(self._raw_food)
+        return self._food
+
+    @property
+    def shaded_food(self):
+        if self._shaded_food is None:
+            self._shaded_food = _ensure_list_tuples(self._raw_shaded_food)
+        return self._shaded_food
+
+
 class Bot:
+    # Bots are created four times per turn. Attributes that are expensive
+    # to compute are only computed on first access and the data of the
+    # team is shared by both of its bots.
+    __slots__ = ('_bots', '_say', '_team_data', '_food', '_shaded_food', '_is_on_team', '_bot_index', '_bot_turn',
+                 '_initial_position', '_legal_positions', 'track',
+                 'random', 'position', 'walls', 'homezone', 'shape', 'kills', 'deaths',
+                 'was_killed', 'round', 'char', 'is_blue', 'is_noisy', '_graph')
+
     def __init__(self, *, bot_index,
                           is_on_team,
                           position,
@@ -522,9 +793,7 @@ class Bot:
                           walls,
                           shape,
                           homezone,
-                          food,
-                          shaded_food,
-                          score,
+                          team_data,
                           kills,
                           deaths,
                           was_killed,
@@ -533,30 +802,31 @@ class Bot:
                           round,
                           bot_char,
                           is_blue,
-                          team_name,
-                          team_time,
-                          error_count,
                           is_noisy,
                           bot_turn=None):
         self._bots = None
         self._say = None
 
         #: The previous positions of this bot including the current one.
-        self.track = []
+        #: A read-only `Track` view on the history kept by the team.
+        self.track = Track()
 
         #: Is this a friendly bot?
         self._is_on_team = is_on_team
 
+        #: Data shared with the other bot of the team
+        self._team_data = team_data
+        # The copies of the food lists of the team (on first access)
+        self._food = None
+        self._shaded_food = None
+
         self.random = random
         self.position = tuple(position)
         self._initial_position = tuple(initial_position)
         self.walls = walls
 
         self.homezone = homezone
-        self.food = food
-        self.shaded_food = shaded_food
         self.shape = shape
-        self.score  = score
         self.kills = kills
         self.deaths = deaths
         self.was_killed = was_killed
@@ -564,28 +834,80 @@ class Bot:
         self.round = round
         self.char = bot_char
         self.is_blue = is_blue
-        self.team_name = team_name
-        self.team_time = team_time
-        self.error_count = error_count
         self.is_noisy = is_noisy
-        self.has_exact_position = not is_noisy
-        self.graph = graph
-
-        # The legal positions that the bot can reach from its current position,
-        # including the current position.
-        self.legal_positions = []
+        # The graph or a function that creates it on first access
+        self._graph = graph
 
-        for direction in [(0, 0), (-1, 0), (1, 0), (0, 1), (0, -1)]:
-            new_pos = (position[0] + direction[0],
-                       position[1] + direction[1])
-            if new_pos not in self.walls:
-                self.legal_positions.append(new_pos)
+        # The legal positions are computed on first access
+        self._legal_positions = None
 
         # Attributes for Bot
         if self._is_on_team:
             assert bot_turn is not None
             self._bot_turn = bot_turn
 
+    @property
+    def score(self):
+        """ The score of the bot’s team. """
+        return self._team_data.score
+
+    @property
+    def food(self):
+        """ The food of the bot’s team (the food that the enemies can eat). """
+        # a copy, so that changing it does not change the food of the other bot
+        if self._food is None:
+            self._food = list(self._team_data.food)
+        return self._food
+
+    @property
+    def shaded_food(self):
+        """ The food of the bot’s team that is in the shadow of its ghosts. """
+        if self._shaded_food is None:
+            self._shaded_food = list(self._team_data.shaded_food)
+        return self._shaded_food
+
+    @property
+    def team_name(self):
+        return self._team_data.team_name
+
+    @property
+    def team_time(self):
+        return self._team_data.team_time
+
+    @property
+    def error_count(self):
+        return self._team_data.error_count
+
+    @property
+    def graph(self):
+        """ A read-only networkx graph of the maze (see `walls_to_graph`). """
+        if callable(self._graph):
+            self._graph = self._graph()
+        return self._graph
+
+    @property
+    def has_exact_position(self):
+        return not self.is_noisy
+
+    @property
+    def legal_positions(self):
+        """ The legal positions that the bot can reach from its current position,
+        including the current position. """
+        if self._legal_positions is None:
+            position = self.position
+            walls = self.walls
+            self._legal_positions = []
+            for direction in [(0, 0), (-1, 0), (1, 0), (0, 1), (0, -1)]:
+                new_pos = (position[0] + direction[0],
+                           position[1] + direction[1])
+                if new_pos not in walls:
+                    self._legal_positions.append(new_pos)
+        return self._legal_positions
+
+    @legal_positions.setter
+    def legal_positions(self, value):
+        self._legal_positions = value
+
     @property
     def _team(self):
        """ Both of our bots.
@@ -618,6 +940,79 @@ class Bot:
         """ Print some text in the graphical interface. """
         self._say = text
 
+    def maze_distance(self, pos1, pos2):
+        """ Returns the length of the shortest path between `pos1` and `pos2`
+        in the maze.
+
+        The distances to a position are computed once per maze and then cached,
+        so that all further lookups are cheap.
+
+        Raises
+        ------
+        ValueError
+            if one of the positions is a wall or outside of the maze or if
+            there is no path between them
+        """
+        return self._layout_index.maze_distance(pos1, pos2)
+
+    def next_step_towards(self, target):
+        """ Returns the next position on a shortest path from the bot’s
+        position to `target`.
+
+        If the bot is already at `target`, its position is returned.
+
+        Raises
+        ------
+        ValueError
+            if target is a wall or outside of the maze or if there is no
+            path to it
+        """
+        return self._layout_index.next_step(self.position, target)
+
+    @property
+    def _layout_index(self):
+        if self._bots.get('layout_index') is None:
+            self._bots['layout_index'] = layout.get_layout_index(self.walls, self.shape)
+        return self._bots['layout_index']
+
+    def simulate(self, moves=()):
+        """ Simulate the next turns of the game with the given moves.
+
+        The simulation starts from the current position, as seen by this bot.
+        The first move is the move of the bot whose turn it is, the following
+        moves are for the bots in turn order (blue and red alternating).
+        The moves are applied with the same rules as in the real game.
+
+        The returned `pelita.engine.GameState` is a forward model: use
+        `state.fork()` to branch off copies and `state.step(position)` to play
+        further moves. All positions and the food are from the perspective of
+        this bot, so that noisy enemy positions are used as if they were
+        exact. As the age of the food is unknown to the bot, food is never
+        relocated in the simulation.
+
+        Parameters
+        ----------
+        moves : sequence of (int, int)
+            the positions that the bots move to, starting with the current bot
+
+        Returns
+        -------
+        game_state : pelita.engine.GameState
+            the state of the game after the moves
+
+        Raises
+        ------
+        ValueError
+            if one of the moves is illegal or the game is over before all
+            moves have been played
+        """
+        if 'game_state' not in self._bots:
+            self._bots['game_state'] = _bot_game_state(self._bots)
+        state = self._bots['game_state'].fork()
+        for move in moves:
+            state.step(move)
+        return state
+
     # def get_direction(self, position):
         # """ Return the direction needed to get to the given position.
 
@@ -735,9 +1130,65 @@ class Bot:
         return f'<Bot: {self.char} ({"blue" if self.is_blue else "red"}), {self.position}, turn: {self.turn}, round: {self.round}>'
 
 
+def _bot_game_state(bots):
+    """ Creates the array-backed game state before the current move from
+    the information of the bots (see `Bot.simulate`). """
+    from .engine import GameState
+
+    team_bots = bots['team']
+    enemy_bots = bots['enemy']
+    me = team_bots[0]
+    team_index = 0 if me.is_blue else 1
+
+    def by_turn(team_values, enemy_values):
+        values = [None] * 4
+        values[team_index::2] = team_values
+        values[1 - team_index::2] = enemy_values
+        return values
+
+    def by_team(team_value, enemy_value):
+        return [team_value, enemy_value] if team_index == 0 else [enemy_value, team_value]
+
+    # the state is set up such that the next turn is the current bot’s turn
+    turn = team_index + 2 * me._bot_turn
+    round = me.round if me.round is not None else 1
+    if turn == 0:
+        if round == 1:
+            turn, round = None, None
+        else:
+            turn, round = 3, round - 1
+    else:
+        turn = turn - 1
+
+    max_rounds = bots.get('max_rounds')
+    game_state = {
+        'walls': me.walls,
+        'shape': me.shape,
+        'food': by_team(me.food, enemy_bots[0].food),
+        'food_age': [{}, {}],
+        'turn': turn,
+        'round': round,
+        'gameover': False,
+        'whowins': None,
+        'bots': by_turn([b.position for b in team_bots], [b.position for b in enemy_bots]),
+        'score': by_team(me.score, enemy_bots[0].score),
+        'fatal_errors': [[], []],
+        'errors': [{}, {}],
+        'max_rounds': max_rounds if max_rounds is not None else math.inf,
+        'max_food_age': math.inf,
+        'error_limit': 0,
+        'deaths': by_turn([b.deaths for b in team_bots], [b.deaths for b in enemy_bots]),
+        'kills': by_turn([b.kills for b in team_bots], [b.kills for b in enemy_bots]),
+        'bot_was_killed': by_turn([b.was_killed for b in team_bots], [b.was_killed for b in enemy_bots]),
+        'rng': None,
+    }
+    return GameState(game_state)
+
+
 # def __init__(self, *, bot_index, position, initial_position, walls, homezone, food, is_noisy, score, random, round, is_blue):
-def make_bots(*, walls, shape, initial_positions, homezone, team, enemy, round, bot_turn, rng, graph):
-    bots = {}
+def make_bots(*, walls, shape, initial_positions, homezone, team, enemy, round, bot_turn, rng, graph,
+              max_rounds=None, layout_index=None):
+    bots = {'max_rounds': max_rounds, 'layout_index': layout_index}
 
     team_index = team['team_index']
     enemy_index = enemy['team_index']
@@ -745,18 +1196,21 @@ def make_bots(*, walls, shape, initial_positions, homezone, team, enemy, round,
     team_initial_positions = initial_positions[team_index::2]
     enemy_initial_positions = initial_positions[enemy_index::2]
 
+    team_data = _TeamData(score=team['score'],
+                          food=team['food'],
+                          shaded_food=team['shaded_food'],
+                          team_name=team['name'],
+                          team_time=team['team_time'],
+                          error_count=team['error_count'])
     team_bots = []
     for idx, position in enumerate(team['bot_positions']):
         b = Bot(bot_index=idx,
             is_on_team=True,
-            score=team['score'],
+            team_data=team_data,
             deaths=team['deaths'][idx],
             kills=team['kills'][idx],
             was_killed=team['bot_was_killed'][idx],
             is_noisy=False,
-            error_count=team['error_count'],
-            food=_ensure_list_tuples(team['food']),
-            shaded_food=_ensure_list_tuples(team['shaded_food']),
             walls=walls,
             shape=shape,
             round=round,
@@ -767,24 +1221,25 @@ def make_bots(*, walls, shape, initial_positions, homezone, team, enemy, round,
             position=team['bot_positions'][idx],
             initial_position=team_initial_positions[idx],
             is_blue=team_index % 2 == 0,
-            homezone=homezone[team_index],
-            team_name=team['name'],
-            team_time=team['team_time'])
+            homezone=homezone[team_index])
         b._bots = bots
         team_bots.append(b)
 
+    enemy_data = _TeamData(score=enemy['score'],
+                           food=enemy['food'],
+                           shaded_food=[],
+                           team_name=enemy['name'],
+                           team_time=enemy['team_time'],
+                           error_count=enemy['error_count'])
     enemy_bots = []
     for idx, position in enumerate(enemy['bot_positions']):
         b = Bot(bot_index=idx,
             is_on_team=False,
-            score=enemy['score'],
+            team_data=enemy_data,
             kills=enemy['kills'][idx],
             deaths=enemy['deaths'][idx],
             was_killed=enemy['bot_was_killed'][idx],
             is_noisy=enemy['is_noisy'][idx],
-            error_count=enemy['error_count'],
-            food=_ensure_list_tuples(enemy['food']),
-            shaded_food=[],
             walls=walls,
             shape=shape,
             round=round,
@@ -794,9 +1249,7 @@ def make_bots(*, walls, shape, initial_positions, homezone, team, enemy, round,
             position=enemy['bot_positions'][idx],
             initial_position=enemy_initial_positions[idx],
             is_blue=enemy_index % 2 == 0,
-            homezone=homezone[enemy_index],
-            team_name=enemy['name'],
-            team_time=enemy['team_time'])
+            homezone=homezone[enemy_index])
         b._bots = bots
         enemy_bots.append(b)
 
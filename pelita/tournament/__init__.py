@@ -15,6 +15,7 @@ from dataclasses import dataclass
 import yaml
 import zmq
 
+from ..network import bind_socket, local_address, remove_address
 from ..team import make_team
 from . import knockout_mode, roundrobin
 
@@ -93,9 +94,13 @@ def run_and_terminate_process(args, **kwargs):
                     p.kill()
 
 
-def call_pelita(team_specs, *, rounds, size, viewer, seed, team_infos=None, write_replay=False, store_output=False):
+def call_pelita(team_specs, *, rounds, size, viewer, seed, team_infos=None, write_replay=False, store_output=False,
+                player_pool=None, transport='tcp'):
     """ Starts a new process with the given command line arguments and waits until finished.
 
+    With transport 'ipc', the game process and its players are connected
+    over socket files instead of loopback tcp ports.
+
     Returns
     =======
     tuple of (game_state, stdout, stderr)
@@ -121,9 +126,7 @@ def call_pelita(team_specs, *, rounds, size, viewer, seed, team_infos=None, writ
     ctx = zmq.Context()
     reply_sock = ctx.socket(zmq.PAIR)
 
-    addr = 'tcp://127.0.0.1'
-    reply_port = reply_sock.bind_to_random_port(addr)
-    reply_addr = 'tcp://127.0.0.1' + ':' + str(reply_port)
+    reply_addr = bind_socket(reply_sock, local_address('ipc' if transport == 'ipc' else 'tcp'))
 
     rounds = ['--rounds', str(rounds)] if rounds else []
     size = ['--size', size] if size else []
@@ -131,12 +134,16 @@ def call_pelita(team_specs, *, rounds, size, viewer, seed, team_infos=None, writ
     seed = ['--seed', seed] if seed else []
     write_replay = ['--write-replay', write_replay] if write_replay else []
     store_output = ['--store-output', store_output] if store_output else []
+    player_pool = ['--player-pool', player_pool] if player_pool else []
+    transport = ['--transport', transport] if transport != 'tcp' else []
     append_blue = ['--append-blue', team_infos[0]] if team_infos[0] else []
     append_red = ['--append-red', team_infos[1]] if team_infos[1] else []
 
     cmd = [sys.executable, '-m', 'pelita.scripts.pelita_main',
            team1, team2,
            '--reply-to', reply_addr,
+           # we only need the final state
+           '--reply-subscription', 'final',
            *append_blue,
            *append_red,
            *rounds,
@@ -144,7 +151,9 @@ def call_pelita(team_specs, *, rounds, size, viewer, seed, team_infos=None, writ
            *viewer,
            *seed,
            *write_replay,
-           *store_output]
+           *store_output,
+           *player_pool,
+           *transport]
 
     # We need to run a process in the background in order to await the zmq events
     # stdout and stderr are written to temporary files in order to be more portable
@@ -192,6 +201,9 @@ def call_pelita(team_specs, *, rounds, size, viewer, seed, team_infos=None, writ
                     except KeyError:
                         pass
 
+        reply_sock.close()
+        remove_address(reply_addr)
+
         stdout_buf.seek(0)
         stderr_buf.seek(0)
         return (final_game_state, stdout_buf.read(), stderr_buf.read())
@@ -285,6 +297,9 @@ class Config:
         self.tournament_log_folder = None
         self.tournament_log_file = None
 
+        #: Address of a served `pelita.launcher.PlayerPool` which starts the players
+        self.player_pool = None
+
     @property
     def team_ids(self):
         return self.teams.keys()
@@ -476,6 +491,7 @@ def play_game_with_config(config, teams, rng, *, match_id=None):
                                 viewer=config.viewer,
                                 team_infos=team_infos,
                                 seed=seed,
+                                player_pool=config.player_pool,
                                 **log_kwargs)
 
     if log_folder:
@@ -1,5 +1,7 @@
 import logging
 import platform
+import time
+from collections import deque
 
 import zmq
 
@@ -98,6 +100,34 @@ if "macOS" in platform.platform():
     BUTTON_PADDING = {}
     LABEL_STYLE = {}
 
+# The layers of the game canvas and the keys of the game state that they
+# depend on. A layer is only redrawn when one of its keys has changed (or
+# when everything is redrawn, e.g. after resizing the window).
+# The grid, background and maze only change on a redraw.
+LAYER_KEYS = {
+    'overlay': ('overlays',),
+    'selected': ('food', 'bots', 'walls', 'shape'),
+    'line_of_sight': ('turn', 'requested_moves', 'bots', 'sight_distance', 'shape'),
+    'bot_shadow': ('turn', 'requested_moves', 'bots', 'shadow_distance', 'shape'),
+    'food': ('food', 'food_age', 'max_food_age'),
+    'title': ('team_names', 'team_infos', 'score', 'fatal_errors', 'deaths', 'kills', 'num_errors', 'team_time'),
+    'shadow_bots': ('turn', 'noisy_positions'),
+    'bots': ('bots', 'say', 'bot_was_killed'),
+    'moves': ('turn', 'requested_moves', 'bots'),
+    'status_info': ('round', 'max_rounds', 'turn'),
+    'end_of_game': ('whowins', 'team_names'),
+}
+
+# Number of frames for the frame time counter (shown in debug mode)
+FRAME_TIME_WINDOW = 30
+
+
+def dirty_layers(previous, game_state):
+    """ Returns the layers that have to be redrawn when the game state
+    changes from `previous` to `game_state`. """
+    return {layer for layer, keys in LAYER_KEYS.items()
+            if any(previous.get(key) != game_state.get(key) for key in keys)}
+
 
 def guess_size(display_string, bounding_width, bounding_height, rel_size=0):
     no_lines = display_string.count("\n") + 1
@@ -248,7 +278,16 @@ class TkApplication:
         self.shadow_sprites = {}
         self.init_bot_sprites([None] * 4)
 
+        # the food items on the canvas by position (see draw_food)
+        self.food_items = {}
+        self._max_food_age = None
+
         self._game_state = {}
+        # layers that must be redrawn on the next update without a new state
+        self._dirty_layers = set()
+        # the draw times and the start times of the last frames
+        self._frame_times = deque(maxlen=FRAME_TIME_WINDOW)
+        self._frame_starts = deque(maxlen=FRAME_TIME_WINDOW)
 
         self.ui_game_canvas = tkinter.Canvas(window)
         self.ui_game_canvas.configure(background="white", bd=0, highlightthickness=0, relief='flat')
@@ -374,6 +413,7 @@ class TkApplication:
             self.window.after_idle(self.request_initial)
 
     def update(self, game_state=None, redraw=False):
+        previous = self._game_state
         if game_state is not None:
             if self._game_state.get("shape") != game_state.get("shape"):
                 redraw = True
@@ -384,6 +424,7 @@ class TkApplication:
         game_state = self._game_state
         if not game_state:
             return
+        frame_start = time.perf_counter()
 
         self.mesh_graph.update_mesh_shape(game_state['shape'])
 
@@ -402,44 +443,93 @@ class TkApplication:
             if self._default_font.cget('size') != self._default_font_size:
                 self._default_font.configure(size=self._default_font_size)
 
-        self.draw_universe(game_state, redraw=redraw)
-
-        eaten_food = []
-        for food_pos, food_item in self.food_items.items():
-            food_item.food_age = game_state['food_age'].get(food_pos, 0)
-            if food_pos not in game_state["food"]:
-                self.ui_game_canvas.delete(food_item.tag)
-                eaten_food.append(food_pos)
-        for food_pos in eaten_food:
-            del self.food_items[food_pos]
-
-        winning_team_idx = game_state.get("whowins")
-        if winning_team_idx is None:
-            self.draw_end_of_game(None)
-        elif winning_team_idx in (0, 1):
-            team_name = game_state["team_names"][winning_team_idx]
-            self.draw_game_over(team_name)
-        elif winning_team_idx == 2:
-            self.draw_game_draw()
-
-
-    def draw_universe(self, game_state, redraw):
-        self.draw_overlay(game_state.get('overlays', []))
+        if redraw:
+            layers = set(LAYER_KEYS)
+        else:
+            layers = dirty_layers(previous, game_state) | self._dirty_layers
+        self._dirty_layers = set()
+
+        self.draw_universe(game_state, redraw=redraw, layers=layers, previous=previous)
+
+        if 'end_of_game' in layers:
+            winning_team_idx = game_state.get("whowins")
+            if winning_team_idx is None:
+                self.draw_end_of_game(None)
+            elif winning_team_idx in (0, 1):
+                team_name = game_state["team_names"][winning_team_idx]
+                self.draw_game_over(team_name)
+            elif winning_team_idx == 2:
+                self.draw_game_draw()
+
+        self._frame_times.append(time.perf_counter() - frame_start)
+        if game_state is not previous:
+            # only count new game states for the frame rate
+            self._frame_starts.append(frame_start)
+        self.draw_frame_time()
+
+
+    def draw_universe(self, game_state, redraw, layers=None, previous=None):
+        """ Draws the game state.
+
+        Only the given `layers` (see `LAYER_KEYS`) are drawn, all of them if
+        `layers` is None. The bots are only redrawn if they differ from the
+        `previous` game state.
+        """
+        if layers is None:
+            layers = set(LAYER_KEYS)
+
+        if 'overlay' in layers:
+            self.draw_overlay(game_state.get('overlays', []))
         self.draw_grid(redraw=redraw)
-        self.draw_selected(game_state)
-        self.draw_line_of_sight(game_state)
-        self.draw_bot_shadow(game_state)
+        if 'selected' in layers:
+            self.draw_selected(game_state)
+        if 'line_of_sight' in layers:
+            self.draw_line_of_sight(game_state)
+        if 'bot_shadow' in layers:
+            self.draw_bot_shadow(game_state)
         self.draw_background(redraw=redraw)
         self.draw_maze(game_state, redraw=redraw)
-        self.draw_food(game_state)
-
-        self.draw_title(game_state)
-        self.draw_shadow_bots(game_state, redraw=redraw)
-        self.draw_bots(game_state, redraw=redraw)
+        if 'food' in layers:
+            self.draw_food(game_state, redraw=redraw)
+
+        if 'title' in layers:
+            self.draw_title(game_state)
+        if 'shadow_bots' in layers:
+            self.draw_shadow_bots(game_state, redraw=redraw)
+        if 'bots' in layers:
+            self.draw_bots(game_state, redraw=redraw, previous=previous)
+
+        if 'moves' in layers:
+            self.draw_moves(game_state)
+
+        if 'status_info' in layers:
+            self.draw_status_info(game_state)
+
+        # Bots which have not been redrawn would end up below the shadow bots
+        # that have just been created. Restore the stacking of a full redraw:
+        # the bots (with their texts) above the shadow bots, the arrows on top.
+        for bot_sprite in self.bot_sprites.values():
+            for tag in (bot_sprite.tag, "speak" + bot_sprite.tag, "show_id" + bot_sprite.tag):
+                self.ui_game_canvas.tag_raise(tag)
+        self.ui_game_canvas.tag_raise("arrow")
+
+    def draw_frame_time(self):
+        """ Shows the average time for drawing a frame and the frame rate
+        in debug mode. """
+        self.ui_game_canvas.delete("frame_time")
+        if not self._grid_enabled or not self._frame_times:
+            return
 
-        self.draw_moves(game_state)
+        draw_time = sum(self._frame_times) / len(self._frame_times)
+        frame_info = f"draw {draw_time * 1000:.1f} ms"
+        if len(self._frame_starts) > 1:
+            interval = (self._frame_starts[-1] - self._frame_starts[0]) / (len(self._frame_starts) - 1)
+            if interval > 0:
+                frame_info += f", {1 / interval:.0f} fps"
 
-        self.draw_status_info(game_state)
+        self.ui_game_canvas.create_text(MAZE_PADDING, self.mesh_graph.screen_height - 2, text=frame_info,
+                                        font=(self._default_font, 8), fill="#884488", tags="frame_time",
+                                        anchor=tkinter.SW)
 
     def draw_grid(self, redraw):
         """ Draws a light grid on the background.
@@ -751,6 +841,7 @@ class TkApplication:
             self.selected = None
         else:
             self.selected = selected
+        self._dirty_layers.add('selected')
         self.update()
 
     def draw_background(self, redraw):
@@ -933,22 +1024,39 @@ class TkApplication:
 
     def clear(self):
         self.ui_game_canvas.delete(tkinter.ALL)
-
-    def draw_food(self, game_state):
-        self.ui_game_canvas.delete("food")
         self.food_items = {}
+
+    def draw_food(self, game_state, redraw):
+        """ Updates the food on the canvas.
+
+        The food items are kept between the frames. Only the eaten and the
+        new food is removed and added and only the food which has changed
+        its colour is recoloured (unless everything has to be redrawn).
+        """
         max_food_age = game_state.get("max_food_age")
-        for position in game_state['food']:
-            model_x, model_y = position
+        if redraw or max_food_age != self._max_food_age:
+            self.ui_game_canvas.delete("food")
+            self.food_items = {}
+            self._max_food_age = max_food_age
+
+        food = set(game_state['food'])
+        for position in self.food_items.keys() - food:
+            self.food_items.pop(position).delete(self.ui_game_canvas)
+
+        for position in food:
             food_age = game_state['food_age'].get(position, 0)
-            food_item = Food(
-                self.mesh_graph,
-                position=(model_x, model_y),
-                food_age=food_age,
-                max_food_age=max_food_age,
-            )
-            food_item.draw(self.ui_game_canvas, show_lifetime=False)
-            self.food_items[position] = food_item
+            food_item = self.food_items.get(position)
+            if food_item is None:
+                food_item = Food(
+                    self.mesh_graph,
+                    position=position,
+                    food_age=food_age,
+                    max_food_age=max_food_age,
+                )
+                food_item.draw(self.ui_game_canvas, show_lifetime=False)
+                self.food_items[position] = food_item
+            elif food_item.food_age != food_age:
+                food_item.update_age(self.ui_game_canvas, food_age)
 
     def draw_maze(self, game_state, redraw):
         if not redraw:
@@ -1035,13 +1143,23 @@ class TkApplication:
             self.arrow_items.append(arrow_item)
 
 
-    def draw_bots(self, game_state, redraw):
-        if game_state:
-            for bot_id, was_killed in enumerate(game_state.get("bot_was_killed", [])):
-                if was_killed:
-                    self.bot_sprites[bot_id].position = None
+    def draw_bots(self, game_state, redraw, previous=None):
+        bot_was_killed = game_state.get("bot_was_killed", []) if game_state else []
+        for bot_id, was_killed in enumerate(bot_was_killed):
+            if was_killed:
+                self.bot_sprites[bot_id].position = None
+
+        def unchanged(key, bot_id):
+            try:
+                return previous[key][bot_id] == game_state[key][bot_id]
+            except (KeyError, IndexError, TypeError):
+                return False
 
         for bot_id, bot_sprite in self.bot_sprites.items():
+            if (previous and not redraw and bot_sprite.position is not None
+                and unchanged('bots', bot_id) and unchanged('say', bot_id)):
+                # nothing to do for this bot
+                continue
             if game_state and "say" in game_state:
                 say = game_state["say"][bot_id]
             else:
@@ -307,18 +307,30 @@ class Food(TkSprite):
     def food_pos_tag(cls, position):
         return "Food" + str(position)
 
-    def draw(self, canvas, game_state=None, show_lifetime=False):
+    def is_expiring(self):
+        return bool(self.food_age and self.food_age + FOOD_WARNING_TIME > self.max_food_age)
+
+    def fill_color(self):
+        if self.is_expiring():
+            return GREY
         if self.position[0] < self.mesh.mesh_width // 2:
-            fill_col = BLUE
-        else:
-            fill_col = RED
-        text_col = "#000"
+            return BLUE
+        return RED
+
+    def update_age(self, canvas, food_age):
+        """ Sets the new food age and changes the colour of the
+        drawn food if needed. """
+        fill_col = self.fill_color()
+        self.food_age = food_age
+        if self.fill_color() != fill_col:
+            canvas.itemconfigure(self.food_pos_tag(self.position), fill=self.fill_color())
+
+    def draw(self, canvas, game_state=None, show_lifetime=False):
+        fill_col = self.fill_color()
+        text_col = YELLOW if self.is_expiring() else "#000"
 
         food_age = self.food_age
 
-        if food_age and food_age + FOOD_WARNING_TIME > self.max_food_age:
-            fill_col = GREY
-            text_col = YELLOW
         canvas.create_oval(self.bounding_box(0.4), fill=fill_col, width=0, tags=(self.tag, self.food_pos_tag(self.position), "food"))
 
         canvas.delete("show_food_age" + str(self.position))
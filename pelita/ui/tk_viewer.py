@@ -7,6 +7,7 @@ import tkinter
 
 import zmq
 
+from ..network import is_key_state
 from .tk_canvas import TkApplication
 
 _logger = logging.getLogger(__name__)
@@ -71,6 +72,9 @@ class TkViewer:
     app : The TkApplication class
 
     """
+    #: The maximum number of messages that are read from the queue at once
+    MAX_DRAIN = 1000
+
     def __init__(self, address, controller_address=None, standalone_mode=False,
                        geometry=None, delay=1, stop_after=None, stop_after_kill=False,
                        fullscreen=False):
@@ -144,13 +148,8 @@ class TkViewer:
             # if queue is empty, try again in a few ms
             # we don’t want to block here and lock
             # Tk animations
-            message = self.socket.recv_unicode(flags=zmq.NOBLOCK)
-            message = json.loads(message)
-
-            _logger.debug(message["__action__"])
-            # we currently don’t care about the action
-            game_state = message["__data__"]
-            if game_state:
+            game_states = self._drain_queue()
+            for game_state in game_states:
                 self.app.observe(game_state, self.standalone_mode)
 
             self._delay = 2
@@ -164,6 +163,37 @@ class TkViewer:
             self._after(self._delay, self.read_queue)
             self._delay = self._delay * 2
 
+    def _drain_queue(self):
+        """ Receives all states that are waiting in the queue (but at most
+        `MAX_DRAIN` of them) and returns the ones that should be shown.
+
+        When the game is faster than the viewer, only the newest state and the
+        initial and final states (see `pelita.network.is_key_state`) are
+        shown, so that the viewer does not fall behind.
+
+        Raises zmq.Again if the queue is empty.
+        """
+        game_states = []
+        for _ in range(self.MAX_DRAIN):
+            try:
+                message = self.socket.recv_unicode(flags=zmq.NOBLOCK)
+            except zmq.Again:
+                if not game_states:
+                    raise
+                break
+            message = json.loads(message)
+
+            _logger.debug(message["__action__"])
+            # we currently don’t care about the action
+            game_state = message["__data__"]
+            if game_state:
+                game_states.append(game_state)
+
+        if len(game_states) > 1:
+            _logger.debug('Received %d states at once.', len(game_states))
+        return [game_state for idx, game_state in enumerate(game_states)
+                if idx == len(game_states) - 1 or is_key_state(game_state)]
+
     def _after(self, delay, fun, *args):
         """ Execute fun(*args) after delay milliseconds.
 
@@ -3,13 +3,13 @@ from random import Random
 from .base_utils import default_rng
 from .game import SHADOW_DISTANCE, split_food
 from .gamestate_filters import manhattan_dist
-from .layout import BOT_N2I, initial_positions, parse_layout
+from .layout import BOT_N2I, get_layout_index, parse_layout
 from .maze_generator import generate_maze
-from .team import create_homezones, make_bots
+from .team import make_bots
 
 # this import is needed for backward compatibility, do not remove or you'll break
 # older clients!
-from .team import walls_to_graph  # isort: skip
+from .team import walls_to_graph  # noqa: F401 isort: skip
 
 
 # this is a dumbed-down version of pelita.game.run_game, useful to be exposed to the
@@ -251,15 +251,18 @@ def setup_test_game(*, layout, is_blue=True, round=None, score=None, seed=None,
         'team_time': 0.0,
     }
 
-    bot = make_bots(walls=layout['walls'],
-                    shape=layout['shape'],
-                    initial_positions=initial_positions(layout['walls'], layout['shape']),
-                    homezone=create_homezones(layout['shape'], layout['walls']),
+    layout_index = get_layout_index(layout['walls'], layout['shape'])
+
+    bot = make_bots(walls=layout_index.walls,
+                    shape=layout_index.shape,
+                    initial_positions=layout_index.initial_positions,
+                    homezone=layout_index.homezones,
                     team=team,
                     enemy=enemy,
                     round=round,
                     bot_turn=0,
                     rng=rng,
-                    graph=walls_to_graph(layout['walls']))
+                    graph=layout_index.new_graph(),
+                    layout_index=layout_index)
     return bot
 
@@ -1,25 +1,142 @@
 """ The observers. """
 
-import json
 import logging
 import sys
 
 import zmq
-from rich.console import Console
-from rich.progress import (BarColumn, MofNCompleteColumn, Progress,
-                           SpinnerColumn, TextColumn, TimeElapsedColumn)
 
 from . import layout
-from .network import SetEncoder
+from .network import encode_viewer_state
 
 _logger = logging.getLogger(__name__)
 _mswindows = (sys.platform == "win32")
 
-# Only highlight explicit markup
-pprint = Console(highlight=False).print
+_console = None
+
+def pprint(*args, **kwargs):
+    """ Prints with rich (which is only imported when needed). """
+    global _console
+    if _console is None:
+        from rich.console import Console
+
+        # Only highlight explicit markup
+        _console = Console(highlight=False)
+    _console.print(*args, **kwargs)
+
+class Subscription:
+    """ Describes which states a viewer wants to receive.
+
+    A viewer subscribes by setting a `subscription` attribute. Viewers
+    without one receive the full state of every turn.
+
+    Parameters
+    ----------
+    every : str
+        'turn' for every state, 'round' for the state after every `nth` round
+        and the final state or 'final' for the final state only
+    nth : int
+        The interval in rounds (only used for every='round')
+    fields : collection of str, optional
+        Only these keys of the viewer state are sent (all keys if None)
+    initial : bool
+        Whether the states before the first round are sent as well (always
+        true for every='turn')
+    """
+    EVERY = ('turn', 'round', 'final')
+
+    def __init__(self, every='turn', nth=1, fields=None, initial=False):
+        if every not in self.EVERY:
+            raise ValueError(f"Unknown subscription {every!r} (must be one of {', '.join(self.EVERY)}).")
+        if nth < 1:
+            raise ValueError(f"Subscription interval must be positive (got {nth}).")
+        self.every = every
+        self.nth = nth
+        self.fields = frozenset(fields) if fields is not None else None
+        self.initial = initial
+
+    @classmethod
+    def from_string(cls, spec):
+        """ Parses a subscription from a string `every[/nth][:field,field,...]`.
+
+        Examples: 'final', 'round/10', 'turn:bots,score'
+        """
+        spec, _, fields = spec.partition(':')
+        every, _, nth = spec.partition('/')
+        try:
+            nth = int(nth) if nth else 1
+        except ValueError:
+            raise ValueError(f"Subscription interval must be an integer (got {nth!r}).") from None
+        fields = [field.strip() for field in fields.split(',') if field.strip()] if fields else None
+        return cls(every=every, nth=nth, fields=fields)
+
+    def wants(self, game_state):
+        """ Returns True if the subscriber wants to receive this state. """
+        if game_state.get('gameover') or self.every == 'turn':
+            return True
+        if game_state['round'] is None:
+            return self.initial
+        if self.every == 'final':
+            return False
+        return game_state['turn'] == 3 and game_state['round'] % self.nth == 0
+
+    def __repr__(self):
+        fields = sorted(self.fields) if self.fields is not None else None
+        return f"Subscription(every={self.every!r}, nth={self.nth!r}, fields={fields!r}, initial={self.initial!r})"
+
+
+#: The subscription of viewers which do not declare their own
+ALL_STATES = Subscription()
+
+
+def subscribed_viewers(viewers, game_state):
+    """ Returns the viewers which want to receive the given state. """
+    return [viewer for viewer in viewers
+            if getattr(viewer, 'subscription', ALL_STATES).wants(game_state)]
+
+
+def subscribed_fields(viewers):
+    """ Returns all keys of the viewer state that the viewers subscribed to
+    or None if one of them wants the full state. """
+    fields = set()
+    for viewer in viewers:
+        viewer_fields = getattr(viewer, 'subscription', ALL_STATES).fields
+        if viewer_fields is None:
+            return None
+        fields |= viewer_fields
+    return fields
+
+
+def show_viewer_state(viewers, viewer_state):
+    """ Shows the viewer state in all viewers.
+
+    Viewers which subscribed to a subset of the fields only get these keys.
+    Viewers which declare a `serialization` get the encoded state in
+    `show_encoded_state`. It is encoded only once for every format (and
+    subset of fields), no matter how many viewers use it. All other viewers
+    get the dict in `show_state`.
+    """
+    encoded = {}
+    for viewer in viewers:
+        fields = getattr(viewer, 'subscription', ALL_STATES).fields
+        if fields is None:
+            state = viewer_state
+        else:
+            state = {key: value for key, value in viewer_state.items() if key in fields}
+
+        serialization = getattr(viewer, 'serialization', None)
+        if serialization is None:
+            viewer.show_state(state)
+            continue
+        if (serialization, fields) not in encoded:
+            encoded[serialization, fields] = encode_viewer_state(state, serialization)
+        viewer.show_encoded_state(state, encoded[serialization, fields])
+
 
 class ProgressViewer:
     def __init__(self) -> None:
+        from rich.progress import (BarColumn, MofNCompleteColumn, Progress,
+                                   SpinnerColumn, TextColumn, TimeElapsedColumn)
+
         self.progress = Progress(
             SpinnerColumn(),
             TextColumn("[progress.description]{task.description}"),
@@ -140,7 +257,10 @@ class AsciiViewer:
 class ReplyToViewer:
     """ A viewer which dumps to a given stream.
     """
-    def __init__(self, reply_to):
+    serialization = 'json'
+
+    def __init__(self, reply_to, subscription=ALL_STATES):
+        self.subscription = subscription
         ctx = zmq.Context()
         self.sock = ctx.socket(zmq.PAIR)
 
@@ -154,24 +274,27 @@ class ReplyToViewer:
         self.pollout = zmq.Poller()
         self.pollout.register(self.sock, zmq.POLLOUT)
 
-    def _send(self, message):
+    def _send(self, as_json):
         socks = dict(self.pollout.poll(300))
         if socks.get(self.sock) == zmq.POLLOUT:
-            as_json = json.dumps(message, cls=SetEncoder)
             self.sock.send_unicode(as_json, flags=zmq.NOBLOCK)
 
     def show_state(self, game_state):
-        self._send(game_state)
+        self.show_encoded_state(game_state, encode_viewer_state(game_state, self.serialization))
+
+    def show_encoded_state(self, game_state, encoded_state):
+        self._send(encoded_state)
 
 
 class ReplayWriter:
     """ A viewer which dumps to a given stream.
     """
+    serialization = 'json'
+
     def __init__(self, stream):
         self.stream = stream
 
-    def _send(self, message):
-        as_json = json.dumps(message, cls=SetEncoder)
+    def _send(self, as_json):
         self.stream.write(as_json)
         # We use 0x04 (EOT) as a separator between the events.
         # The additional newline is for improved readability
@@ -180,10 +303,16 @@ class ReplayWriter:
         self.stream.flush()
 
     def show_state(self, game_state):
-        self._send(game_state)
+        self.show_encoded_state(game_state, encode_viewer_state(game_state, self.serialization))
+
+    def show_encoded_state(self, game_state, encoded_state):
+        self._send(encoded_state)
 
 
 class ResultPrinter:
+    # prints the team names before the first round and the result at the end
+    subscription = Subscription('final', initial=True)
+
     def show_state(self, state):
         if (state['turn'] is None and
             state['round'] is None):
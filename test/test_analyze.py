@@ -0,0 +1,197 @@
+import numpy as np
+import pytest
+
+from pelita import viewer
+from pelita.analyze import (analyze_replay, empty_stats, find_replays,
+                            load_stats, merge_stats, update_stats)
+from pelita.game import play_turn, run_game, setup_game
+from pelita.layout import parse_layout
+from pelita.player import food_eating_player, random_player
+from pelita.replay import MovesWriter, ReplayWriter
+
+LAYOUT = """
+##################
+#. ... .##.     y#
+# # #  .  .### #x#
+# # ##.   .      #
+#      .   .## # #
+#a# ###.  .  # # #
+#b     .##. ... .#
+##################
+"""
+
+
+def write_replay(path, kind, rng, max_rounds=30):
+    if kind == 'legacy':
+        f = open(path, 'w')
+        writer = viewer.ReplayWriter(f)
+    else:
+        f = open(path, 'wb')
+        writer = ReplayWriter(f) if kind == 'v2' else MovesWriter(f)
+    with f:
+        return run_game([food_eating_player, random_player], layout_dict=parse_layout(LAYOUT),
+                        max_rounds=max_rounds, rng=rng, viewers=[writer], print_result=False)
+
+
+@pytest.mark.parametrize('kind', ['legacy', 'v2', 'moves'])
+def test_analyze_replay(tmp_path, kind):
+    path = tmp_path / 'replay'
+    state = write_replay(path, kind, rng=1)
+    stats = analyze_replay(path)
+
+    assert stats['games'] == 1
+    assert list(stats['files']) == [str(path)]
+    # the game ends when the food has been eaten
+    num_rounds = state['round']
+    assert stats['rounds'].tolist() == [1] * num_rounds
+    assert stats['moves'].sum() == 4 * (num_rounds - 1) + state['turn'] + 1
+    assert stats['wins'].sum() == 1
+    assert stats['wins'][state['whowins']] == 1
+
+    layout = parse_layout(LAYOUT)
+    initial_food = [sum(1 for pos in layout['food'] if (pos[0] < 9) == (team == 0)) for team in (0, 1)]
+    remaining_food = [len(food) for food in state['food']]
+    # team 0 eats the food of team 1 and vice versa
+    assert stats['food_eaten'].sum(axis=1).tolist() == [initial_food[1] - remaining_food[1],
+                                                        initial_food[0] - remaining_food[0]]
+    assert stats['food_eaten'].sum() > 0
+
+    kills = stats['kills_18x8']
+    assert kills.sum(axis=(1, 2)).tolist() == [sum(state['deaths'][0::2]), sum(state['deaths'][1::2])]
+    positions = stats['positions_18x8']
+    assert positions.sum(axis=(1, 2)).tolist() == stats['moves'].tolist()
+    # team 0 is in the enemy homezone if x >= 9
+    assert stats['enemy_zone'][0].sum() == positions[0, 9:].sum()
+    assert stats['enemy_zone'][1].sum() == positions[1, :9].sum()
+
+
+def write_incomplete_replay(path, kind, rounds=3):
+    """ Writes the first rounds of a game, as if the game was still running. """
+    if kind == 'legacy':
+        f = open(path, 'w')
+        writer = viewer.ReplayWriter(f)
+    else:
+        f = open(path, 'wb')
+        writer = ReplayWriter(f, keyframe_interval=2)
+    with f:
+        state = setup_game([food_eating_player, random_player], layout_dict=parse_layout(LAYOUT),
+                           max_rounds=30, rng=1, viewers=[writer], print_result=False)
+        while state['round'] is None or state['round'] <= rounds:
+            state = play_turn(state)
+        assert not state['gameover']
+
+
+@pytest.mark.parametrize('kind', ['legacy', 'v2'])
+def test_analyze_incomplete_replay(tmp_path, kind):
+    path = tmp_path / 'replay'
+    write_incomplete_replay(path, kind)
+    with pytest.raises(ValueError, match='incomplete'):
+        analyze_replay(path)
+
+
+def test_kill_locations(tmp_path):
+    # the bots of both teams walk into each other
+    layout = parse_layout("""
+        ########
+        #a .. y#
+        #b .. x#
+        ########
+    """)
+    def right(bot, state):
+        return (bot.position[0] + 1, bot.position[1])
+    def left(bot, state):
+        return (bot.position[0] - 1, bot.position[1])
+    path = tmp_path / 'replay'
+    with open(path, 'wb') as f:
+        state = run_game([right, left], layout_dict=layout, max_rounds=3, rng=1,
+                         viewers=[ReplayWriter(f)], print_result=False)
+    assert state['deaths'] == [1, 1, 0, 0]
+    kills = analyze_replay(path)['kills_8x4']
+    # a walks into y in the homezone of team 1
+    assert kills[0, 4, 1] == 1
+    # x walks into b in the homezone of team 0
+    assert kills[1, 3, 2] == 1
+    assert kills.sum() == 2
+
+
+def test_merge_stats():
+    a = empty_stats()
+    a['rounds'] = np.array([1, 1])
+    a['food_eaten'] = np.array([[1, 2], [3, 4]])
+    a['kills_4x2'] = np.ones((2, 4, 2), dtype=int)
+    b = empty_stats()
+    b['rounds'] = np.array([1, 1, 1])
+    b['food_eaten'] = np.array([[1, 1, 1], [1, 1, 1]])
+    b['files'] = np.array(['b'])
+    merged = merge_stats(a, b)
+    assert merged['rounds'].tolist() == [2, 2, 1]
+    assert merged['food_eaten'].tolist() == [[2, 3, 1], [4, 5, 1]]
+    assert merged['kills_4x2'].sum() == 16
+    assert merged['files'].tolist() == ['b']
+
+
+def test_update_stats(tmp_path, monkeypatch):
+    replays = tmp_path / 'replays'
+    for idx, kind in enumerate(['legacy', 'v2', 'moves']):
+        (replays / f'match-{idx}').mkdir(parents=True)
+        write_replay(replays / f'match-{idx}' / 'replay', kind, rng=idx)
+    (replays / 'notes.txt').write_text('not a replay')
+    # the JSON output of a player
+    (replays / 'match-0' / 'blue.out').write_text('{"bot": 0, "round": 1}\n\x04\n{"bot": 1}\n')
+    (replays / 'match-0' / 'red.out').write_text('{"walls": []}\n')
+    output = tmp_path / 'analysis.npz'
+
+    assert len(find_replays(replays)) == 3
+    stats, new_files = update_stats(replays, output, processes=2)
+    assert new_files == ['match-0/replay', 'match-1/replay', 'match-2/replay']
+    assert stats['games'] == 3
+    expected = empty_stats()
+    for path in find_replays(replays):
+        expected = merge_stats(expected, analyze_replay(path))
+    assert stats.keys() == expected.keys()
+    for key in expected:
+        if key == 'files':
+            assert sorted(stats[key]) == new_files
+        else:
+            assert np.array_equal(stats[key], expected[key])
+
+    saved = load_stats(output)
+    assert saved.keys() == stats.keys()
+    assert saved['games'] == 3
+
+    # only the new replay is analysed
+    previous = stats
+    (replays / 'match-3').mkdir()
+    write_replay(replays / 'match-3' / 'replay', 'v2', rng=3, max_rounds=40)
+    stats, new_files = update_stats(replays, output, processes=2)
+    assert new_files == ['match-3/replay']
+    assert stats['games'] == 4
+    new_stats = analyze_replay(replays / 'match-3' / 'replay')
+    assert np.array_equal(stats['rounds'], merge_stats(previous, new_stats)['rounds'])
+    assert load_stats(output)['games'] == 4
+
+    stats, new_files = update_stats(replays, output, processes=2)
+    assert new_files == []
+    assert stats['games'] == 4
+
+    # the same directory given by another path
+    stats, new_files = update_stats(replays.resolve(), output, processes=2)
+    assert new_files == []
+    assert stats['games'] == 4
+    monkeypatch.chdir(tmp_path)
+    stats, new_files = update_stats('replays', output, processes=2)
+    assert new_files == []
+    assert stats['games'] == 4
+
+    # a replay which is still being written is analysed when it is complete
+    (replays / 'match-4').mkdir()
+    write_incomplete_replay(replays / 'match-4' / 'replay', 'v2')
+    stats, new_files = update_stats(replays, output, processes=2)
+    assert new_files == []
+    assert stats['games'] == 4
+    assert 'match-4/replay' not in load_stats(output)['files']
+
+    write_replay(replays / 'match-4' / 'replay', 'v2', rng=4)
+    stats, new_files = update_stats(replays, output, processes=2)
+    assert new_files == ['match-4/replay']
+    assert stats['games'] == 5
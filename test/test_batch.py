@@ -0,0 +1,70 @@
+import pytest
+
+from pelita.batch import GameResult, play_game, run_games
+from pelita.game import run_game
+from pelita.layout import parse_layout
+from pelita.player import nq_random_player, smart_eating_player, stopping_player
+
+LAYOUT = """
+##################
+#a#.  .  # .     #
+#b#####    #####y#
+#     . #  .  .#x#
+##################
+"""
+
+
+def test_run_games_serial():
+    specs = [(nq_random_player, smart_eating_player), (stopping_player, smart_eating_player)]
+    results = list(run_games(specs, [LAYOUT], range(3), workers=1, max_rounds=20))
+    assert [r.index for r in results] == list(range(6))
+    assert [r.spec_index for r in results] == [0, 0, 0, 1, 1, 1]
+    assert [r.seed for r in results] == [0, 1, 2, 0, 1, 2]
+    for result in results:
+        assert isinstance(result, GameResult)
+        assert result.rounds <= 20
+        assert result.whowins in (0, 1, 2)
+        assert len(result.score) == 2
+        assert len(result.team_time) == 2
+        assert result.fatal_errors == ((), ())
+        assert result.duration > 0
+
+
+def test_run_games_matches_run_game():
+    layout = parse_layout(LAYOUT)
+    result, = run_games([(nq_random_player, smart_eating_player)], [layout], [42],
+                        workers=1, max_rounds=30)
+    state = run_game([nq_random_player, smart_eating_player], layout_dict=layout, rng=42,
+                     max_rounds=30, print_result=False)
+    assert list(result.score) == state['score']
+    assert result.whowins == state['whowins']
+    assert result.rounds == state['round']
+    assert list(result.deaths) == state['deaths']
+
+
+def test_run_games_parallel_is_deterministic():
+    specs = [(nq_random_player, smart_eating_player)]
+    layouts = [LAYOUT, None]
+    serial = list(run_games(specs, layouts, range(4), workers=1, max_rounds=30))
+    parallel = list(run_games(specs, layouts, range(4), workers=3, max_rounds=30))
+    assert len(parallel) == 8
+    parallel = sorted(parallel, key=lambda r: r.index)
+
+    def outcome(r):
+        return r.index, r.layout_index, r.seed, r.score, r.whowins, r.rounds, r.deaths, r.kills
+
+    assert [outcome(r) for r in serial] == [outcome(r) for r in parallel]
+
+
+def test_play_game_random_layout():
+    # layouts are generated from the seed of the game
+    game = (0, 0, (stopping_player, stopping_player), 0, None, 7)
+    first = play_game(*game, {'max_rounds': 2, 'print_result': False})
+    second = play_game(*game, {'max_rounds': 2, 'print_result': False})
+    assert first.score == second.score
+    assert first.rounds == second.rounds == 2
+
+
+def test_run_games_workers():
+    with pytest.raises(ValueError):
+        list(run_games([(stopping_player, stopping_player)], [LAYOUT], [1], workers=0))
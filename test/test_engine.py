@@ -0,0 +1,187 @@
+"""Tests for the array-backed game state in pelita.engine"""
+
+from random import Random
+
+import pytest
+
+from pelita.engine import GameState
+from pelita.game import play_turn, run_game, setup_game
+from pelita.layout import parse_layout
+from pelita.maze_generator import generate_maze
+from pelita.player import SANE_PLAYERS, stepping_player, stopping_player
+
+
+def comparable(game_state):
+    """ Returns a dict of the game state without the non-comparable parts. """
+    state = dict(game_state)
+    for key in ('teams', 'rng', 'viewers', 'controller', 'team_time'):
+        del state[key]
+    state['food'] = [set(team_food) for team_food in state['food']]
+    return state
+
+
+def test_unknown_engine():
+    layout = parse_layout("""
+        ########
+        #a  . x#
+        #b .  y#
+        ########
+        """)
+    with pytest.raises(ValueError):
+        setup_game([stopping_player, stopping_player], layout_dict=layout, engine='unknown')
+
+
+def test_array_state_has_same_keys():
+    layout = parse_layout("""
+        ########
+        #a  . x#
+        #b .  y#
+        ########
+        """)
+    dict_state = setup_game([stopping_player, stopping_player], layout_dict=layout, rng=0)
+    array_state = setup_game([stopping_player, stopping_player], layout_dict=layout, rng=0, engine='array')
+    assert isinstance(array_state, GameState)
+    assert set(dict_state) == set(array_state)
+    assert comparable(dict_state) == comparable(array_state)
+
+
+def test_array_state_assignment():
+    layout = parse_layout("""
+        ########
+        #a  . x#
+        #b .  y#
+        ########
+        """)
+    state = setup_game([stopping_player, stopping_player], layout_dict=layout, engine='array')
+    assert state['food'] == [{(3, 2)}, {(4, 1)}]
+    state['food'] = [{(2, 1)}, set()]
+    assert state['food'] == [{(2, 1)}, set()]
+    state['bots'] = [(1, 1), (6, 1), (1, 2), (5, 2)]
+    assert state['bots'] == [(1, 1), (6, 1), (1, 2), (5, 2)]
+    with pytest.raises(ValueError):
+        state['walls'] = set()
+
+
+@pytest.mark.parametrize('seed', range(8))
+def test_engines_play_identical_games(seed):
+    rng = Random(seed)
+    layout = generate_maze(rng=rng)
+    teams = [SANE_PLAYERS[seed % len(SANE_PLAYERS)], SANE_PLAYERS[(3 * seed + 1) % len(SANE_PLAYERS)]]
+
+    states = []
+    for engine in ['dict', 'array']:
+        state = run_game(teams, layout_dict=layout, max_rounds=100, rng=seed,
+                         print_result=False, allow_exceptions=True, engine=engine)
+        states.append(state)
+
+    dict_state, array_state = states
+    assert comparable(dict_state) == comparable(array_state)
+    # the random number generators must have been used in the same way
+    assert dict_state['rng'].random() == array_state['rng'].random()
+
+
+def test_engines_relocate_identically():
+    # The blue bots are camping next to their food, so it is relocated
+    layout = parse_layout("""
+        ##################
+        #   .. ##  .     #
+        # # #     .### #x#
+        # # ##.   .      #
+        #.    .a   .## # #
+        # # ###.b .  # # #
+        #      .##. ... y#
+        ##################
+        """)
+    states = []
+    for engine in ['dict', 'array']:
+        state = setup_game([stopping_player, stopping_player], layout_dict=layout, max_rounds=80,
+                           rng=1, engine=engine)
+        while not state['gameover']:
+            state = play_turn(state)
+            states.append(comparable(state))
+
+    dict_states, array_states = states[:len(states) // 2], states[len(states) // 2:]
+    assert dict_states == array_states
+    # food has been moved
+    assert dict_states[-1]['food'] != dict_states[0]['food']
+
+
+def test_array_engine_errors():
+    layout = parse_layout("""
+        ########
+        #a  . x#
+        #b .  y#
+        ########
+        """)
+    # a moves into a wall
+    teams = [stepping_player('^', '-'), stopping_player]
+    state = run_game(teams, layout_dict=layout, max_rounds=3, print_result=False, engine='array')
+    assert state['gameover']
+    assert state['whowins'] == 1
+    assert state['fatal_errors'][0][0]['type'] == 'IllegalPosition'
+
+
+@pytest.mark.parametrize('seed', range(4))
+def test_step_follows_play_turn(seed):
+    rng = Random(seed)
+    layout = generate_maze(rng=rng)
+    teams = [SANE_PLAYERS[seed % len(SANE_PLAYERS)], SANE_PLAYERS[(seed + 1) % len(SANE_PLAYERS)]]
+    # the teams consume random numbers, so we must not relocate the food
+    state = setup_game(teams, layout_dict=layout, max_rounds=40, rng=seed, allow_camping=True,
+                       engine='array')
+    forked = state.fork()
+
+    keys = ('food', 'food_age', 'bots', 'score', 'kills', 'deaths', 'bot_was_killed',
+            'round', 'turn', 'gameover', 'whowins')
+    while not state['gameover']:
+        state = play_turn(state, allow_exceptions=True)
+        forked.step(state['requested_moves'][state['turn']]['requested_position'])
+        assert {key: state[key] for key in keys} == {key: forked[key] for key in keys}
+
+
+def test_fork_is_independent():
+    layout = parse_layout("""
+        ########
+        #a  . x#
+        #b .  y#
+        ########
+        """)
+    state = setup_game([stopping_player, stopping_player], layout_dict=layout, rng=0, engine='array')
+    forked = state.fork()
+    assert forked['teams'] is None
+    assert forked['viewers'] == []
+    forked.step((2, 1))
+    forked.step((6, 1))
+    forked.step((2, 2))
+    assert forked['bots'] == [(2, 1), (6, 1), (2, 2), (6, 2)]
+    assert forked['round'] == 1
+    assert forked['turn'] == 2
+    assert state['bots'] == [(1, 1), (6, 1), (1, 2), (6, 2)]
+    assert state['round'] is None
+    assert forked.fork()['bots'] == forked['bots']
+    # the random number generators are independent copies
+    assert forked['rng'] is not state['rng']
+    assert forked['rng'].random() == state['rng'].random()
+
+
+def test_step_errors():
+    layout = parse_layout("""
+        ########
+        #a  . x#
+        #b .  y#
+        ########
+        """)
+    state = setup_game([stopping_player, stopping_player], layout_dict=layout, max_rounds=1,
+                       rng=0, engine='array')
+    with pytest.raises(ValueError):
+        state.step((1, 0))
+    # nothing has changed
+    assert state['bots'] == [(1, 1), (6, 1), (1, 2), (6, 2)]
+    assert state['round'] is None and state['turn'] is None
+
+    for move in [(1, 1), (6, 1), (1, 2), (6, 2)]:
+        state.step(move)
+    assert state['gameover']
+    assert state['whowins'] == 2
+    with pytest.raises(ValueError):
+        state.step((6, 2))
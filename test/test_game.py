@@ -3,6 +3,7 @@ import inspect
 import itertools
 import os
 import sys
+import threading
 from contextlib import contextmanager
 from pathlib import Path
 from random import Random
@@ -1132,6 +1133,146 @@ def test_setup_game_run_game_have_same_args():
         assert setup_game.__kwdefaults__[kwarg] == run_game.__kwdefaults__[kwarg], f"Default values for {kwarg} are different"
 
 
+def test_setup_teams_is_concurrent(monkeypatch):
+    # both teams are initialised at the same time
+    from pelita.team import Team
+    set_initial = Team.set_initial
+    # each team waits for the other one, which only works if they run concurrently
+    barrier = threading.Barrier(2)
+    def waiting_set_initial(self, team_id, game_state):
+        barrier.wait(timeout=10)
+        return set_initial(self, team_id, game_state)
+    monkeypatch.setattr(Team, 'set_initial', waiting_set_initial)
+
+    state = setup_game([stopping_player, stopping_player], layout_dict=parse_layout(small_layout), max_rounds=1)
+    assert not barrier.broken
+    assert state['fatal_errors'] == [[], []]
+    assert state['team_names'] == ['local-team (stopping_player)'] * 2
+
+
+def test_viewers_share_encoded_state(monkeypatch, tmp_path):
+    import io
+    import json
+    from pelita import viewer
+    from pelita.network import encode_viewer_state
+
+    encoded = []
+    def counting_encode(viewer_state, serialization):
+        encoded.append(serialization)
+        return encode_viewer_state(viewer_state, serialization)
+    monkeypatch.setattr(viewer, 'encode_viewer_state', counting_encode)
+
+    class DictViewer:
+        def __init__(self):
+            self.states = []
+        def show_state(self, game_state):
+            self.states.append(game_state)
+
+    streams = [io.StringIO(), io.StringIO()]
+    dict_viewer = DictViewer()
+    state = setup_game([stopping_player, stopping_player], layout_dict=parse_layout(small_layout), max_rounds=2)
+    state['viewers'] = [viewer.ReplayWriter(streams[0]), dict_viewer, viewer.ReplayWriter(streams[1])]
+    while not state['gameover']:
+        state = play_turn(state)
+
+    # every state has been encoded once for both replay writers
+    assert len(encoded) == len(dict_viewer.states) == 8
+    assert set(encoded) == {'json'}
+    assert streams[0].getvalue() == streams[1].getvalue()
+    replay = [json.loads(frame) for frame in streams[0].getvalue().split('\x04') if frame.strip()]
+    assert replay[-1]['gameover']
+    assert replay[-1]['bots'] == [list(pos) for pos in dict_viewer.states[-1]['bots']]
+
+
+def test_no_viewers_no_viewer_state(monkeypatch):
+    def fail(game_state):
+        raise AssertionError("viewer state prepared without viewers")
+    monkeypatch.setattr(game, 'prepare_viewer_state', fail)
+    state = run_game([stopping_player, stopping_player], layout_dict=parse_layout(small_layout), max_rounds=2,
+                     print_result=False)
+    assert state['gameover']
+
+
+@pytest.mark.parametrize('spec, expected', [
+    ('turn', ('turn', 1, None)),
+    ('final', ('final', 1, None)),
+    ('round/10', ('round', 10, None)),
+    ('final:score, whowins', ('final', 1, {'score', 'whowins'})),
+    ('round/2:bots', ('round', 2, {'bots'})),
+])
+def test_subscription_from_string(spec, expected):
+    from pelita.viewer import Subscription
+    subscription = Subscription.from_string(spec)
+    assert (subscription.every, subscription.nth, subscription.fields) == expected
+
+
+@pytest.mark.parametrize('spec', ['every', 'round/0', 'round/x', 'final/'])
+def test_subscription_invalid(spec):
+    from pelita.viewer import Subscription
+    if spec == 'final/':
+        # an empty interval is the default
+        assert Subscription.from_string(spec).nth == 1
+        return
+    with pytest.raises(ValueError):
+        Subscription.from_string(spec)
+
+
+def test_viewer_subscriptions(monkeypatch):
+    from pelita.viewer import Subscription
+
+    prepared_fields = []
+    prepare_viewer_state = game.prepare_viewer_state
+    def recording_prepare(game_state, fields=None):
+        prepared_fields.append(fields)
+        return prepare_viewer_state(game_state, fields=fields)
+    monkeypatch.setattr(game, 'prepare_viewer_state', recording_prepare)
+
+    class SubscribedViewer:
+        def __init__(self, spec):
+            self.subscription = Subscription.from_string(spec)
+            self.states = []
+        def show_state(self, game_state):
+            self.states.append(game_state)
+
+    final, rounds, score = [SubscribedViewer(spec) for spec in ['final', 'round/2', 'turn:score,turn']]
+    state = setup_game([stopping_player, stopping_player], layout_dict=parse_layout(small_layout), max_rounds=5)
+    state['viewers'] = [final, rounds]
+    prepared_fields.clear()
+    while not state['gameover']:
+        state = play_turn(state)
+
+    assert len(final.states) == 1
+    assert final.states[0]['gameover']
+    # rounds 2 and 4 and the final state
+    assert [s['round'] for s in rounds.states] == [2, 4, 5]
+    assert [s['turn'] for s in rounds.states] == [3, 3, 3]
+    # no state is prepared when nobody listens
+    assert len(prepared_fields) == 3
+
+    state = setup_game([stopping_player, stopping_player], layout_dict=parse_layout(small_layout), max_rounds=2)
+    state['viewers'] = [score]
+    prepared_fields.clear()
+    while not state['gameover']:
+        state = play_turn(state)
+    assert prepared_fields == [{'score', 'turn'}] * 8
+    assert [sorted(s) for s in score.states] == [['score', 'turn']] * 8
+
+    # the result printer only needs the states before the first round and the final state
+    prepared_fields.clear()
+    state = run_game([stopping_player, stopping_player], layout_dict=parse_layout(small_layout), max_rounds=2)
+    assert state['gameover']
+    assert prepared_fields == [None] * 3
+
+
+def test_prepare_viewer_state_fields(game_state):
+    full = game.prepare_viewer_state(game_state)
+    assert 'teams' not in full and 'rng' not in full
+    assert full['num_errors'] == [0, 0]
+
+    subset = game.prepare_viewer_state(game_state, fields={'food', 'num_errors', 'teams'})
+    assert subset == {'food': full['food'], 'num_errors': full['num_errors']}
+
+
 @pytest.mark.parametrize('bot_to_move', range(4))
 # all combinations of True False in a list of 4
 @pytest.mark.parametrize('bot_was_killed_flags', itertools.product(*[(True, False)] * 4))
@@ -0,0 +1,41 @@
+import subprocess
+import sys
+
+import pytest
+
+# Modules that must not be imported by a module
+# (that would slow down the start of every game)
+UNWANTED_IMPORTS = {
+    'pelita': {'zmq', 'networkx', 'numpy', 'rich', 'pelita.game'},
+    'pelita.scripts.pelita_player': {'networkx', 'numpy', 'rich', 'yaml', 'zeroconf',
+                                     'pelita.game', 'pelita.viewer', 'pelita.maze_generator'},
+    'pelita.scripts.pelita_main': {'networkx', 'numpy', 'rich', 'yaml', 'zeroconf',
+                                   'pelita.tournament'},
+    'pelita.game': {'networkx', 'rich', 'yaml', 'zeroconf'},
+}
+
+
+def imported_modules(module):
+    """ Returns the names of all modules that are loaded after importing `module`
+    in a fresh interpreter. """
+    code = f"import sys, {module}; print('\\n'.join(sys.modules))"
+    res = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    return set(res.stdout.split())
+
+
+@pytest.mark.parametrize('module', UNWANTED_IMPORTS)
+def test_unwanted_imports(module):
+    modules = imported_modules(module)
+    assert module in modules
+    assert not UNWANTED_IMPORTS[module] & modules
+
+
+def test_lazy_submodules():
+    code = "import pelita, sys; print('pelita.layout' in sys.modules); pelita.layout; print('pelita.layout' in sys.modules)"
+    res = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True, check=True)
+    assert res.stdout.split() == ['False', 'True']
+
+    import pelita
+    assert 'game' in dir(pelita)
+    with pytest.raises(AttributeError):
+        pelita.no_such_module
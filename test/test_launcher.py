@@ -0,0 +1,326 @@
+import os
+import shutil
+import time
+from pathlib import Path
+
+import pytest
+import zmq
+
+import pelita.game
+import pelita.layout
+from pelita.launcher import (ForkedPlayer, ForkServer, PlayerPool, PlayerProcess, PoolClient,
+                             ThreadLauncher, hash_files)
+from pelita.tournament import call_pelita
+
+FIXTURE_DIR = Path(__file__).parent.resolve() / 'fixtures'
+
+LAYOUT = """
+    ##########
+    #  b  y  #
+    #a  ..  x#
+    ##########
+    """
+
+
+def test_pool_reuses_workers():
+    blue = str(FIXTURE_DIR / 'remote_dumps_with_failure_good.py')
+    red = 'pelita/player/StoppingPlayer.py'
+    layout = pelita.layout.parse_layout(LAYOUT)
+
+    with PlayerPool() as pool:
+        pids = []
+        for seed in range(3):
+            state = pelita.game.run_game([blue, red], max_rounds=2, layout_dict=layout, rng=seed,
+                                         launcher=pool, print_result=False)
+            assert state['fatal_errors'] == [[], []]
+            assert state['errors'] == [{}, {}]
+            assert state['team_names'][1] == 'Stopping Players'
+            pids.append(sorted(worker.proc.pid for worker in pool._workers))
+
+        assert pool.num_workers == 2
+        assert pids[0] == pids[1] == pids[2]
+        assert [worker.games for worker in pool._workers] == [3, 3]
+
+
+def test_pool_output_is_stored(tmp_path):
+    blue = FIXTURE_DIR / 'remote_dumps_are_written_blue.py'
+    red = FIXTURE_DIR / 'remote_dumps_are_written_red.py'
+    layout = pelita.layout.parse_layout(LAYOUT)
+
+    with PlayerPool() as pool:
+        for game in range(2):
+            out_folder = tmp_path / str(game)
+            out_folder.mkdir()
+            state = pelita.game.run_game([str(blue), str(red)], max_rounds=2, layout_dict=layout,
+                                         store_output=str(out_folder), launcher=pool, print_result=False)
+            assert state['fatal_errors'] == [[], []]
+
+            # every game writes to its own files
+            assert (out_folder / 'blue.out').read_text() == '1 0 p1\n1 1 p1\n2 0 p1\n2 1 p1\n'
+            assert (out_folder / 'red.out').read_text() == '1 0 p2\n1 1 p2\n2 0 p2\n2 1 p2\n'
+            assert (out_folder / 'blue.err').read_text() == 'p1err\np1err\np1err\np1err\n'
+
+
+def test_pool_load_error():
+    failing = str(FIXTURE_DIR / 'player_syntax_error')
+    good = str(FIXTURE_DIR / 'remote_dumps_with_failure_good.py')
+    layout = pelita.layout.parse_layout(LAYOUT)
+
+    with PlayerPool() as pool:
+        for _ in range(2):
+            state = pelita.game.run_game([failing, good], max_rounds=2, layout_dict=layout,
+                                         launcher=pool, print_result=False)
+            assert state['whowins'] == 1
+            assert state['fatal_errors'][0][0]['type'] == 'PlayerDisconnected'
+            assert 'SyntaxError' in state['fatal_errors'][0][0]['description']
+            assert state['fatal_errors'][1] == []
+        # the worker for the broken team does not stay around
+        for _ in range(50):
+            if pool.num_workers == 1:
+                break
+            time.sleep(0.1)
+        assert pool.num_workers == 1
+
+
+def test_pool_client():
+    teams = [str(FIXTURE_DIR / 'remote_dumps_with_failure_good.py'), 'pelita/player/StoppingPlayer.py']
+
+    with PlayerPool() as pool:
+        address = pool.serve(teams)
+        # a private socket file by default
+        assert address.startswith('ipc://')
+        for _ in range(2):
+            state = pelita.game.run_game(teams, max_rounds=2, layout_dict=pelita.layout.parse_layout(LAYOUT),
+                                         launcher=PoolClient(address), print_result=False)
+            assert state['fatal_errors'] == [[], []]
+
+        state, stdout, stderr = call_pelita(teams, rounds=2, size='small', viewer='null', seed=1,
+                                            player_pool=address)
+        assert state['fatal_errors'] == [[], []]
+        assert pool.num_workers == 2
+
+
+def test_pool_serve_invalid_requests(tmp_path):
+    team = 'pelita/player/StoppingPlayer.py'
+    with PlayerPool() as pool:
+        address = pool.serve([team], output_dir=tmp_path / 'logs')
+        socket_address, _, token = address.partition('#')
+        socket = zmq.Context.instance().socket(zmq.REQ)
+        socket.setsockopt(zmq.LINGER, 0)
+        socket.connect(socket_address)
+        launch = {'action': 'launch', 'team_spec': str(Path(team).resolve()), 'address': 'tcp://127.0.0.1:1'}
+        requests = [
+            b'not json', b'[1, 2]',
+            {'action': 'release', 'token': token},
+            {'action': 'launch', 'token': token},
+            # no or a wrong token
+            launch,
+            {**launch, 'token': 'wrong'},
+            # a team that the pool does not serve
+            {**launch, 'token': token, 'team_spec': str(FIXTURE_DIR / 'remote_dumps_with_failure_good.py')},
+            # output files outside of the output folder
+            {**launch, 'token': token, 'store_output': str(tmp_path)},
+            {**launch, 'token': token, 'store_output': str(tmp_path / 'logs'), 'color': '../blue'},
+        ]
+        for request in requests:
+            if isinstance(request, bytes):
+                socket.send(request)
+            else:
+                socket.send_json(request)
+            assert socket.poll(5000)
+            assert 'error' in socket.recv_json()
+        socket.close()
+        assert pool.num_workers == 0
+
+        # the pool still serves
+        (tmp_path / 'logs').mkdir()
+        state = pelita.game.run_game([team] * 2, max_rounds=2,
+                                     layout_dict=pelita.layout.parse_layout(LAYOUT),
+                                     store_output=str(tmp_path / 'logs'),
+                                     launcher=PoolClient(address), print_result=False)
+        assert state['fatal_errors'] == [[], []]
+        assert (tmp_path / 'logs' / 'blue.out').exists()
+
+
+def test_pool_client_resolves_team_specs(monkeypatch):
+    requests = []
+    def request(self, request):
+        requests.append(request)
+        return {'ok': True, 'worker': 1, 'game': 1}
+    monkeypatch.setattr(PoolClient, '_request', request)
+    # the pool may run in another working directory
+    monkeypatch.chdir(FIXTURE_DIR)
+    client = PoolClient('tcp://127.0.0.1:1')
+    for team_spec in ['remote_dumps_with_failure_good.py', 'player_syntax_error',
+                      'pelita.player.StoppingPlayer', 'pelita://127.0.0.1:5555/team']:
+        client.launch(team_spec, 'tcp://127.0.0.1:2', store_output='out')
+    assert [request['team_spec'] for request in requests] == [
+        str(FIXTURE_DIR / 'remote_dumps_with_failure_good.py'),
+        str(FIXTURE_DIR / 'player_syntax_error'),
+        'pelita.player.StoppingPlayer',
+        'pelita://127.0.0.1:5555/team',
+    ]
+    assert all(request['store_output'] == str(FIXTURE_DIR / 'out') for request in requests)
+
+
+def test_pool_closed():
+    pool = PlayerPool()
+    pool.close()
+    with pytest.raises(RuntimeError):
+        pool.launch('pelita/player/StoppingPlayer.py', 'tcp://127.0.0.1:1')
+
+
+needs_fork = pytest.mark.skipif(not hasattr(os, 'fork'), reason="needs os.fork")
+
+
+@needs_fork
+@pytest.mark.parametrize('preload', [False, True])
+def test_fork_server(tmp_path, preload):
+    blue = str(FIXTURE_DIR / 'remote_dumps_are_written_blue.py')
+    red = str(FIXTURE_DIR / 'remote_dumps_are_written_red.py')
+    layout = pelita.layout.parse_layout(LAYOUT)
+
+    with ForkServer(preload=[blue, red] if preload else []) as fork_server:
+        pids = set()
+        for game in range(2):
+            out_folder = tmp_path / str(game)
+            out_folder.mkdir()
+            state = pelita.game.run_game([blue, red], max_rounds=2, layout_dict=layout,
+                                         store_output=str(out_folder), launcher=fork_server, print_result=False)
+            assert state['fatal_errors'] == [[], []]
+            assert state['errors'] == [{}, {}]
+            handles = [team.proc for team in state['teams']]
+            # only the preloaded teams are forked
+            assert all(isinstance(handle, ForkedPlayer if preload else PlayerProcess) for handle in handles)
+            pids.update(handle.pid if preload else handle.proc.pid for handle in handles)
+
+            assert (out_folder / 'blue.out').read_text() == '1 0 p1\n1 1 p1\n2 0 p1\n2 1 p1\n'
+            assert (out_folder / 'red.out').read_text() == '1 0 p2\n1 1 p2\n2 0 p2\n2 1 p2\n'
+            assert (out_folder / 'red.err').read_text() == 'p2err\np2err\np2err\np2err\n'
+
+        # every player is a new process
+        assert len(pids) == 4
+        assert os.getpid() not in pids
+
+
+@needs_fork
+def test_fork_server_load_error():
+    failing = str(FIXTURE_DIR / 'player_syntax_error')
+    good = str(FIXTURE_DIR / 'remote_dumps_with_failure_good.py')
+
+    with ForkServer(preload=[failing]) as fork_server:
+        state = pelita.game.run_game([failing, good], max_rounds=2, layout_dict=pelita.layout.parse_layout(LAYOUT),
+                                     launcher=fork_server, print_result=False)
+    assert state['whowins'] == 1
+    assert state['fatal_errors'][0][0]['type'] == 'PlayerDisconnected'
+    assert 'SyntaxError' in state['fatal_errors'][0][0]['description']
+
+
+@needs_fork
+def test_fork_server_restarts_on_change(tmp_path):
+    team = tmp_path / 'team.py'
+    shutil.copy(FIXTURE_DIR / 'remote_dumps_with_failure_good.py', team)
+    teams = [str(team), 'pelita/player/StoppingPlayer.py']
+    layout = pelita.layout.parse_layout(LAYOUT)
+
+    with ForkServer(preload=[str(team)]) as fork_server:
+        state = pelita.game.run_game(teams, max_rounds=2, layout_dict=layout, launcher=fork_server, print_result=False)
+        assert state['team_names'][0] == 'good'
+        server_pid = fork_server._proc.pid
+
+        team.write_text(team.read_text().replace('"good"', '"changed"'))
+        state = pelita.game.run_game(teams, max_rounds=2, layout_dict=layout, launcher=fork_server, print_result=False)
+        assert state['team_names'][0] == 'changed'
+        assert fork_server._proc.pid != server_pid
+
+
+@needs_fork
+@pytest.mark.parametrize('preload', ['first', 'both'])
+def test_fork_server_same_module_name(tmp_path, preload):
+    # two versions of a team with the same module name
+    teams = []
+    for version in ['v1', 'v2']:
+        (tmp_path / version).mkdir()
+        team = tmp_path / version / 'team.py'
+        team.write_text(f'TEAM_NAME = "{version}"\n'
+                        "def move(bot, state):\n"
+                        "    return bot.position\n")
+        teams.append(str(team))
+    layout = pelita.layout.parse_layout(LAYOUT)
+
+    with ForkServer(preload=teams[:1] if preload == 'first' else teams) as fork_server:
+        state = pelita.game.run_game(teams, max_rounds=2, layout_dict=layout, launcher=fork_server, print_result=False)
+    assert state['fatal_errors'] == [[], []]
+    assert state['team_names'] == ['v1', 'v2']
+
+
+@pytest.mark.parametrize('transport', ['tcp', 'ipc', 'inproc'])
+def test_transports(transport):
+    if transport == 'ipc' and not zmq.has('ipc'):
+        pytest.skip("ipc is not available")
+    layout = pelita.layout.parse_layout(LAYOUT)
+
+    states = []
+    for _ in range(2):
+        state = pelita.game.run_game(['0', '1'], max_rounds=10, layout_dict=layout, rng=1,
+                                     transport=transport, print_result=False)
+        assert state['fatal_errors'] == [[], []]
+        assert state['errors'] == [{}, {}]
+        assert all(team.bound_to_address.startswith(f'{transport}://') for team in state['teams'])
+        states.append(state)
+
+    assert states[0]['bots'] == states[1]['bots']
+    assert states[0]['score'] == states[1]['score']
+
+
+def test_thread_launcher_load_error():
+    failing = str(FIXTURE_DIR / 'player_syntax_error')
+    state = pelita.game.run_game([failing, '1'], max_rounds=2, layout_dict=pelita.layout.parse_layout(LAYOUT),
+                                 transport='inproc', print_result=False)
+    assert state['whowins'] == 1
+    assert state['fatal_errors'][0][0]['type'] == 'PlayerDisconnected'
+    assert 'SyntaxError' in state['fatal_errors'][0][0]['description']
+    assert ThreadLauncher.instance() is ThreadLauncher.instance()
+
+
+def test_unknown_transport():
+    with pytest.raises(ValueError):
+        pelita.game.run_game(['0', '1'], max_rounds=2, layout_dict=pelita.layout.parse_layout(LAYOUT),
+                             transport='udp', print_result=False)
+
+
+def test_pool_restarts_on_change(tmp_path):
+    # the team imports a helper module from its folder
+    team = tmp_path / 'team.py'
+    team.write_text("from team_helper import TEAM_NAME\n"
+                    "def move(bot, state):\n"
+                    "    return bot.position\n")
+    helper = tmp_path / 'team_helper.py'
+    helper.write_text('TEAM_NAME = "first"\n')
+    teams = [str(team), 'pelita/player/StoppingPlayer.py']
+    layout = pelita.layout.parse_layout(LAYOUT)
+
+    with PlayerPool() as pool:
+        state = pelita.game.run_game(teams, max_rounds=2, layout_dict=layout, launcher=pool, print_result=False)
+        assert state['team_names'][0] == 'first'
+        worker_pid = pool._workers[0].proc.pid
+
+        helper.write_text('TEAM_NAME = "second"\n')
+        state = pelita.game.run_game(teams, max_rounds=2, layout_dict=layout, launcher=pool, print_result=False)
+        assert state['team_names'][0] == 'second'
+        assert worker_pid not in [worker.proc.pid for worker in pool._workers]
+
+
+def test_hash_files(tmp_path):
+    a = tmp_path / 'a.py'
+    b = tmp_path / 'b.py'
+    a.write_text('a = 1\n')
+    b.write_text('b = 1\n')
+    old_hash = hash_files([a, b])
+    assert hash_files([str(a), str(b)]) == old_hash
+
+    b.write_text('b = 2\n')
+    assert hash_files([a, b]) != old_hash
+
+    b.unlink()
+    assert hash_files([a, b]) != hash_files([a])
@@ -1,10 +1,16 @@
 import itertools
+import pickle
 from textwrap import dedent
 
+import networkx
 import pytest
 
-from pelita.layout import (BOT_N2I, get_legal_positions, layout_as_str,
-                           parse_layout, wall_dimensions)
+from pelita.layout import (BOT_N2I, LayoutIndex, Walls, get_layout_index,
+                           get_legal_positions, initial_positions,
+                           layout_as_str, layout_hash, parse_layout,
+                           wall_dimensions)
+from pelita.gamestate_filters import noise_positions
+from pelita.team import create_homezones
 
 
 def test_legal_layout():
@@ -437,3 +443,152 @@ def test_parse_layout_game_bad_number_of_bots(bots_hidden):
     else:
         with pytest.raises(ValueError):
             parse_layout(test_layout)
+
+
+def test_layout_index():
+    layout = parse_layout("""
+        ##########
+        #a  .# x #
+        #b ### . #
+        #  .    y#
+        ##########
+        """)
+    walls, shape = layout['walls'], layout['shape']
+    index = LayoutIndex(walls, shape)
+
+    assert index.walls == walls
+    assert index.shape == shape
+    assert index.initial_positions == initial_positions(walls, shape)
+    assert list(index.homezones) == create_homezones(shape, walls)
+    assert index.border == (4, 5)
+    assert all(pos[0] not in (4, 5) for zone in index.inner_homezones for pos in zone)
+
+    width, height = shape
+    for x in range(width):
+        for y in range(height):
+            if (x, y) in walls:
+                assert (x, y) not in index.legal_positions
+                with pytest.raises(ValueError):
+                    index.get_legal_positions((x, y))
+            else:
+                assert index.get_legal_positions((x, y)) == get_legal_positions(walls, shape, (x, y))
+
+    with pytest.raises(ValueError):
+        index.get_legal_positions((20, 20))
+
+    assert set(index.graph.nodes) == set(index.legal_positions)
+
+    for pos in index.legal_positions:
+        for radius in (1, 5):
+            assert list(index.noise_positions(pos, radius)) == noise_positions(pos, radius, walls, shape)
+
+
+def test_layout_index_is_cached():
+    layout = parse_layout("""
+        ##########
+        #a  .# x #
+        #b ### . #
+        #  .    y#
+        ##########
+        """)
+    walls, shape = layout['walls'], layout['shape']
+    index = get_layout_index(walls, shape)
+    # the order of the walls does not matter
+    assert get_layout_index(list(reversed(walls)), list(shape)) is index
+    assert layout_hash(walls, shape) == layout_hash(set(walls), shape) == index.hash
+
+    # new graphs are independent of each other
+    graph = index.new_graph()
+    graph[1, 1][1, 2]['weight'] = 5
+    assert index.new_graph()[1, 1][1, 2].get('weight') is None
+
+
+def test_layout_index_distances():
+    layout = parse_layout("""
+        ##########
+        #a  .# x #
+        #b ### .##
+        #  .   y##
+        ##########
+        """)
+    walls, shape = layout['walls'], layout['shape']
+    index = LayoutIndex(walls, shape)
+    graph = index.graph
+    lengths = dict(networkx.all_pairs_shortest_path_length(graph))
+
+    for pos1 in index.legal_positions:
+        for pos2 in index.legal_positions:
+            assert index.maze_distance(pos1, pos2) == lengths[pos1][pos2]
+            next_pos = index.next_step(pos1, pos2)
+            if pos1 == pos2:
+                assert next_pos == pos1
+            else:
+                assert next_pos in graph[pos1]
+                assert lengths[next_pos][pos2] == lengths[pos1][pos2] - 1
+
+    distance_map = index.distance_map((1, 1))
+    assert distance_map.shape == shape
+    assert distance_map[0, 0] == -1
+    assert distance_map[1, 1] == 0
+    assert index.distance_map([1, 1]) is distance_map
+    with pytest.raises(ValueError):
+        distance_map[1, 1] = 5
+
+    with pytest.raises(ValueError):
+        index.maze_distance((0, 0), (1, 1))
+    with pytest.raises(ValueError):
+        index.next_step((1, 1), (20, 1))
+
+
+def test_layout_index_no_path():
+    layout = parse_layout("""
+        ##########
+        #a  .# x #
+        #b  .# y #
+        ##########
+        """, strict=False)
+    index = LayoutIndex(layout['walls'], layout['shape'])
+    assert index.distance_map((1, 1))[7, 1] == -1
+    with pytest.raises(ValueError):
+        index.maze_distance((1, 1), (7, 1))
+    with pytest.raises(ValueError):
+        index.next_step((1, 1), (7, 1))
+
+
+def test_walls():
+    layout = parse_layout("""
+        ##########
+        #a  .# x #
+        #b ### . #
+        #  .    y#
+        ##########
+        """)
+    walls = Walls(reversed(layout['walls']))
+    # behaves like the sorted tuple
+    assert walls == layout['walls']
+    assert isinstance(walls, tuple)
+    assert list(walls) == sorted(layout['walls'])
+    assert walls[0] == (0, 0)
+    assert len(walls) == len(layout['walls'])
+    assert walls.shape == layout['shape'] == (10, 5)
+
+    for x in range(-1, 11):
+        for y in range(-1, 6):
+            inside = 0 <= x < 10 and 0 <= y < 5
+            assert ((x, y) in walls) == ((x, y) in layout['walls'])
+            assert walls.is_wall(x, y) == ((x, y) in layout['walls'] or not inside)
+            if (x, y) in layout['walls'] or not inside:
+                continue
+            legal = get_legal_positions(layout['walls'], layout['shape'], (x, y))
+            assert walls.neighbors((x, y)) == [pos for pos in legal if pos != (x, y)]
+
+    assert [1, 1] not in walls
+    assert [0, 0] not in walls
+    assert walls.grid.shape == (10, 5)
+    assert walls.grid[0, 0] and not walls.grid[1, 1]
+    assert walls.grid.sum() == len(walls)
+
+    unpickled = pickle.loads(pickle.dumps(walls))
+    assert unpickled == walls
+    assert unpickled.shape == walls.shape
+    assert unpickled.is_wall(5, 1)
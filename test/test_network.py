@@ -1,10 +1,17 @@
+import json
+import os
 import sys
+import time
 import uuid
 
 import pytest
 import zmq
 
-from pelita.network import bind_socket
+from pelita.network import (PROTOCOL_V2, PROTOCOL_V2_MSGPACK,
+                            AsyncZMQConnection, ZMQConnection, ZMQPublisher,
+                            ZMQReplyTimeout,
+                            bind_socket, decode_message, encode_message,
+                            local_address, message_protocol, remove_address)
 from pelita.scripts.pelita_player import player_handle_request
 from pelita.team import make_team
 
@@ -29,6 +36,34 @@ def test_bind_socket_fail(zmq_context):
         bind_socket(socket, "bad-address", '--publish')
     socket.close()
 
+@pytest.mark.parametrize('transport', [
+    'tcp',
+    pytest.param('ipc', marks=pytest.mark.skipif(_mswindows, reason="No IPC sockets on Windows.")),
+    'inproc'])
+def test_bind_socket_transport(zmq_context, transport):
+    bound = zmq_context.socket(zmq.PAIR)
+    address = bind_socket(bound, local_address(transport))
+    assert address.startswith(f'{transport}://')
+    # every address is new
+    other = zmq_context.socket(zmq.PAIR)
+    assert bind_socket(other, local_address(transport)) != address
+    other.close()
+
+    connected = zmq_context.socket(zmq.PAIR)
+    connected.connect(address)
+    connected.send(b'ping')
+    assert bound.recv() == b'ping'
+    connected.close()
+    bound.close()
+
+    remove_address(address)
+    if transport == 'ipc':
+        assert not os.path.exists(address[len('ipc://'):])
+
+def test_unknown_transport():
+    with pytest.raises(ValueError):
+        local_address('udp')
+
 
 def test_simpleclient(zmq_context):
     res = []
@@ -128,3 +163,310 @@ def test_simpleclient(zmq_context):
     sock.send_json(exit_msg)
 
     assert res[0] == "success"
+
+
+MESSAGE = {
+    '__uuid__': 3,
+    '__action__': 'get_move',
+    '__data__': {
+        'game_state': {
+            'team': {
+                'bot_positions': [(1, 1), (300, 2)],
+                'food': {(1, 2), (3, 4)},
+                'shaded_food': [],
+                'kills': [0, 1],
+                'is_noisy': [False, True],
+                'name': 'dummy',
+            },
+            'noisy_positions': [None, (1, 2)],
+            'shape': (32, 16),
+            'team_time': 0.5,
+        }
+    }
+}
+
+EXPECTED = {
+    '__uuid__': 3,
+    '__action__': 'get_move',
+    '__data__': {
+        'game_state': {
+            'team': {
+                'bot_positions': [(1, 1), (300, 2)],
+                'food': [(1, 2), (3, 4)],
+                'shaded_food': [],
+                'kills': [0, 1],
+                'is_noisy': [False, True],
+                'name': 'dummy',
+            },
+            'noisy_positions': [None, [1, 2]],
+            'shape': [32, 16],
+            'team_time': 0.5,
+        }
+    }
+}
+
+
+def normalize(obj):
+    """ Converts all tuples to lists and sorts the food. """
+    if isinstance(obj, dict):
+        return {key: sorted(normalize(value)) if key == 'food' else normalize(value)
+                for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return [normalize(value) for value in obj]
+    return obj
+
+
+def test_encode_json():
+    message = encode_message(MESSAGE)
+    assert isinstance(message, str)
+    assert message_protocol(message) is None
+    assert normalize(decode_message(message)) == normalize(EXPECTED)
+
+
+@pytest.mark.parametrize('protocol', [PROTOCOL_V2, PROTOCOL_V2_MSGPACK])
+def test_encode_v2(protocol):
+    if protocol == PROTOCOL_V2_MSGPACK:
+        pytest.importorskip('msgpack')
+    message = encode_message(MESSAGE, protocol)
+    assert isinstance(message, bytes)
+    assert message_protocol(message) == protocol
+    # positions are decoded as lists of tuples
+    decoded = decode_message(message)
+    assert decoded['__data__']['game_state']['team']['bot_positions'] == [(1, 1), (300, 2)]
+    assert normalize(decoded) == normalize(EXPECTED)
+    # and the message is smaller than the JSON message
+    large = {'food': [(x, y) for x in range(32) for y in range(16)]}
+    assert len(encode_message(large, protocol)) < len(encode_message(large)) / 2
+
+
+def test_encode_v2_numpy():
+    np = pytest.importorskip('numpy')
+    message = {'food': [(np.int64(1), np.int64(2))], 'score': np.int64(3)}
+    assert decode_message(encode_message(message, PROTOCOL_V2)) == {'food': [(1, 2)], 'score': 3}
+
+
+def test_encode_v2_fallback():
+    # coordinates that do not fit into 16 bits are sent as JSON
+    message = {'food': [(-1, 2), (70000, 1)]}
+    encoded = encode_message(message, PROTOCOL_V2)
+    assert message_protocol(encoded) is None
+    assert decode_message(encoded) == {'food': [[-1, 2], [70000, 1]]}
+
+
+@pytest.mark.parametrize('protocol', [PROTOCOL_V2, PROTOCOL_V2_MSGPACK])
+def test_encode_v2_only_position_fields(protocol):
+    if protocol == PROTOCOL_V2_MSGPACK:
+        pytest.importorskip('msgpack')
+    # pairs in other fields are not positions
+    message = {'food': [(1, 2)], 'scores': [[-1, 2], [3, 4]], 'names': [['a', 'b']], 'shape': [32, 16]}
+    encoded = encode_message(message, protocol)
+    assert message_protocol(encoded) == protocol
+    assert decode_message(encoded) == {'food': [(1, 2)], 'scores': [[-1, 2], [3, 4]],
+                                       'names': [['a', 'b']], 'shape': [32, 16]}
+
+
+def test_decode_invalid():
+    with pytest.raises(ValueError):
+        decode_message(b'PEL2')
+    with pytest.raises(ValueError):
+        decode_message(b'not json')
+
+
+@pytest.mark.parametrize('protocols, expected', [
+    (None, PROTOCOL_V2),
+    ([], None),
+    (['unknown-protocol'], None),
+])
+def test_negotiate_protocol(zmq_context, protocols, expected):
+    def stopping(bot, state):
+        return bot.position
+
+    sock = zmq_context.socket(zmq.PAIR)
+    port = sock.bind_to_random_port('tcp://127.0.0.1')
+    client_sock = zmq_context.socket(zmq.PAIR)
+    client_sock.connect(f'tcp://127.0.0.1:{port}')
+
+    connection = ZMQConnection(sock, protocols=protocols)
+    if protocols is None and PROTOCOL_V2_MSGPACK in connection.protocols:
+        expected = PROTOCOL_V2_MSGPACK
+    team, _ = make_team(stopping, team_name='test stopping player')
+
+    msg_id = connection.send('team_name', {})
+    player_handle_request(client_sock, team)
+    assert connection.recv_timeout(msg_id, 1) == 'test stopping player'
+    assert connection.protocol == expected
+
+    msg_id = connection.send('team_name', {})
+    message = client_sock.recv()
+    # the request uses the negotiated protocol
+    assert message_protocol(message) == expected
+    assert decode_message(message)['__uuid__'] == msg_id
+    # and so does the reply
+    sock.send(message)
+    player_handle_request(client_sock, team)
+    assert message_protocol(sock.recv()) == expected
+
+    sock.close()
+    client_sock.close()
+
+
+def test_old_player_keeps_json(zmq_context):
+    sock = zmq_context.socket(zmq.PAIR)
+    port = sock.bind_to_random_port('tcp://127.0.0.1')
+    client_sock = zmq_context.socket(zmq.PAIR)
+    client_sock.connect(f'tcp://127.0.0.1:{port}')
+
+    connection = ZMQConnection(sock)
+    for _ in range(2):
+        msg_id = connection.send('team_name', {})
+        request = client_sock.recv_json()
+        assert request['__uuid__'] == msg_id
+        # an old player ignores the offer
+        client_sock.send_json({'__uuid__': request['__uuid__'], '__return__': 'old player'})
+        assert connection.recv_timeout(msg_id, 1) == 'old player'
+        assert connection.protocol is None
+
+    sock.close()
+    client_sock.close()
+
+
+def test_async_connection(zmq_context):
+    import asyncio
+
+    import zmq.asyncio
+
+    def stopping(bot, state):
+        return bot.position
+
+    sock = zmq_context.socket(zmq.PAIR)
+    port = sock.bind_to_random_port('tcp://127.0.0.1')
+    client_sock = zmq_context.socket(zmq.PAIR)
+    client_sock.connect(f'tcp://127.0.0.1:{port}')
+    team, _ = make_team(stopping, team_name='test stopping player')
+
+    async def requests():
+        connection = AsyncZMQConnection(zmq.asyncio.Socket.shadow(sock.underlying))
+
+        msg_id = await connection.send('team_name', {})
+        # nobody answers
+        with pytest.raises(ZMQReplyTimeout):
+            await connection.recv_timeout(msg_id, 0.1)
+
+        # the late reply for the first request is skipped
+        player_handle_request(client_sock, team)
+        msg_id = await connection.send('team_name', {})
+        player_handle_request(client_sock, team)
+        assert await connection.recv_timeout(msg_id, 1) == 'test stopping player'
+        assert connection.protocol is not None
+
+        connection.send_nowait('exit', {})
+        assert not player_handle_request(client_sock, team)
+
+    asyncio.run(requests())
+    sock.close()
+    client_sock.close()
+
+
+def test_publisher_max_fps(zmq_context):
+    sub = zmq_context.socket(zmq.SUB)
+    sub.setsockopt_unicode(zmq.SUBSCRIBE, "")
+    port = sub.bind_to_random_port('tcp://127.0.0.1')
+    publisher = ZMQPublisher(f'tcp://127.0.0.1:{port}', bind=False, max_fps=1, hwm=50)
+    assert publisher.socket.sndhwm == 50
+
+    # wait until the subscription has arrived
+    for _ in range(100):
+        publisher.socket.send_unicode('{}')
+        if sub.poll(50):
+            sub.recv()
+            break
+    else:
+        pytest.fail("subscriber not connected")
+    while sub.poll(50):
+        sub.recv()
+
+    states = [{'round': None, 'turn': None, 'gameover': False}]
+    states += [{'round': r, 'turn': t, 'gameover': False} for r in range(1, 11) for t in range(4)]
+    states += [{'round': 10, 'turn': 3, 'gameover': True}]
+    for state in states:
+        publisher.show_encoded_state(state, json.dumps(state))
+
+    received = []
+    while sub.poll(200):
+        received.append(json.loads(sub.recv_string()))
+    assert all(message['__action__'] == 'observe' for message in received)
+    # the game is faster than one frame per second: only the initial and
+    # the final states are sent
+    assert [message['__data__'] for message in received] == [states[0], states[-1]]
+
+    # without a limit, every state is sent
+    publisher.min_interval = 0
+    for state in states:
+        publisher.show_state(state)
+    received = []
+    while sub.poll(200):
+        received.append(json.loads(sub.recv_string())['__data__'])
+    assert received == states
+    sub.close()
+    publisher.socket.close()
+
+
+def test_publisher_max_fps_sends_last_state(zmq_context):
+    sub = zmq_context.socket(zmq.SUB)
+    sub.setsockopt_unicode(zmq.SUBSCRIBE, "")
+    port = sub.bind_to_random_port('tcp://127.0.0.1')
+    publisher = ZMQPublisher(f'tcp://127.0.0.1:{port}', bind=False, max_fps=5)
+
+    # wait until the subscription has arrived
+    for _ in range(100):
+        publisher.socket.send_unicode('{}')
+        if sub.poll(50):
+            sub.recv()
+            break
+    else:
+        pytest.fail("subscriber not connected")
+    while sub.poll(50):
+        sub.recv()
+
+    # the game pauses after the last state (e.g. waiting for a slow player)
+    states = [{'round': None, 'turn': None, 'gameover': False}]
+    states += [{'round': 1, 'turn': t, 'gameover': False} for t in range(4)]
+    for state in states:
+        publisher.show_state(state)
+
+    received = []
+    while sub.poll(1000):
+        received.append(json.loads(sub.recv_string())['__data__'])
+    # the last state is sent once the interval has passed
+    assert received == [states[0], states[-1]]
+    sub.close()
+    publisher.socket.close()
+
+
+def test_tk_viewer_drains_queue(zmq_context):
+    pytest.importorskip('tkinter')
+    from pelita.ui.tk_viewer import TkViewer
+
+    pub = zmq_context.socket(zmq.PUB)
+    port = pub.bind_to_random_port('tcp://127.0.0.1')
+    viewer = TkViewer(f'tcp://127.0.0.1:{port}')
+    time.sleep(0.2)
+
+    with pytest.raises(zmq.Again):
+        viewer._drain_queue()
+
+    states = [{'round': None, 'turn': None, 'gameover': False}]
+    states += [{'round': r, 'turn': t, 'gameover': False} for r in range(1, 4) for t in range(4)]
+    for state in states:
+        pub.send_string(json.dumps({'__action__': 'observe', '__data__': state}))
+    time.sleep(0.2)
+    # the initial and the newest state
+    assert viewer._drain_queue() == [states[0], states[-1]]
+
+    final = {'round': 3, 'turn': 3, 'gameover': True}
+    for state in [states[1], final, states[2]]:
+        pub.send_string(json.dumps({'__action__': 'observe', '__data__': state}))
+    time.sleep(0.2)
+    assert viewer._drain_queue() == [final, states[2]]
+    viewer.socket.close()
+    pub.close()
@@ -1,3 +1,4 @@
+import asyncio
 import sys
 import tempfile
 from pathlib import Path
@@ -6,6 +7,8 @@ from random import Random
 import pytest
 
 import pelita.game
+import pelita.network
+from pelita.maze_generator import generate_maze
 from pelita.tournament import call_pelita, run_and_terminate_process
 
 _mswindows = (sys.platform == "win32")
@@ -254,3 +257,68 @@ def test_remote_move_failures(player_name, is_setup_error, error_type):
         assert state['fatal_errors'][0][0]['round'] == 1
         assert state['fatal_errors'][1] == []
         assert state['errors'] == [{}, {}]
+
+
+def test_remote_state_delta(monkeypatch):
+    # players that negotiate a compact protocol only receive the changes in
+    # the game state; the game must be the same as with the full states
+    teams = ['pelita/player/FoodEatingPlayer', 'pelita/player/SmartRandomPlayer']
+    layout_dict = generate_maze(rng=1)
+
+    state = pelita.game.run_game(teams, max_rounds=30, layout_dict=layout_dict, rng=1, print_result=False)
+    assert all(team.zmqconnection.protocol is not None for team in state['teams'])
+
+    monkeypatch.setattr(pelita.network, 'supported_protocols', lambda: [])
+    full_state = pelita.game.run_game(teams, max_rounds=30, layout_dict=layout_dict, rng=1, print_result=False)
+    assert all(team.zmqconnection.protocol is None for team in full_state['teams'])
+
+    assert state['fatal_errors'] == full_state['fatal_errors'] == [[], []]
+    for key in ['bots', 'food', 'score', 'kills', 'deaths', 'whowins']:
+        assert state[key] == full_state[key]
+
+
+def test_remote_run_game_async():
+    teams = ['pelita/player/FoodEatingPlayer', 'pelita/player/SmartRandomPlayer']
+    layout_dict = generate_maze(rng=1)
+
+    async def play_games():
+        games = [pelita.game.run_game_async(teams, max_rounds=20, layout_dict=layout_dict, rng=seed,
+                                            print_result=False)
+                 for seed in range(3)]
+        return await asyncio.gather(*games)
+
+    states = asyncio.run(play_games())
+    for seed, state in enumerate(states):
+        assert state['fatal_errors'] == [[], []]
+        assert state['errors'] == [{}, {}]
+        # the same game as in the blocking loop
+        sync_state = pelita.game.run_game(teams, max_rounds=20, layout_dict=layout_dict, rng=seed,
+                                          print_result=False)
+        for key in ['bots', 'food', 'score', 'round', 'whowins', 'team_names']:
+            assert state[key] == sync_state[key]
+
+
+def test_remote_run_game_async_failures():
+    layout = """
+        ##########
+        #  b  y  #
+        #a  ..  x#
+        ##########
+        """
+    failing = str(FIXTURE_DIR / 'player_syntax_error')
+    state = asyncio.run(pelita.game.run_game_async([failing, 'pelita/player/StoppingPlayer'], max_rounds=2,
+                                                   layout_dict=pelita.layout.parse_layout(layout),
+                                                   print_result=False))
+    assert state['whowins'] == 1
+    assert state['fatal_errors'][0][0]['type'] == 'PlayerDisconnected'
+    assert 'SyntaxError' in state['fatal_errors'][0][0]['description']
+
+    # a local team plays in the same loop
+    def stopping(bot, state):
+        return bot.position
+
+    state = asyncio.run(pelita.game.run_game_async([stopping, 'pelita/player/StoppingPlayer'], max_rounds=2,
+                                                   layout_dict=pelita.layout.parse_layout(layout),
+                                                   print_result=False))
+    assert state['whowins'] == 2
+    assert state['fatal_errors'] == [[], []]
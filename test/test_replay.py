@@ -0,0 +1,274 @@
+import io
+import json
+
+import pytest
+
+from pelita import viewer
+from pelita.exceptions import PlayerDisconnected, PlayerTimeout
+from pelita.game import play_turn, run_game, setup_game
+from pelita.layout import parse_layout
+from pelita.player import food_eating_player, random_player
+from pelita.replay import (MAGIC, LegacyReplayReader, MovesWriter,
+                           ReplayReader, ReplayWriter, is_moves_file,
+                           is_replay_v2, load_moves, open_replay, read_replay,
+                           resimulate)
+from pelita.team import Team
+
+LAYOUT = """
+##################
+#. ... .##.     y#
+# # #  .  .### #x#
+# # ##.   .      #
+#      .   .## # #
+#a# ###.  .  # # #
+#b     .##. ... .#
+##################
+"""
+
+
+class CollectingViewer:
+    serialization = 'json'
+
+    def __init__(self):
+        self.states = []
+
+    def show_encoded_state(self, game_state, encoded_state):
+        self.states.append(json.loads(encoded_state))
+
+
+def normalized(state):
+    return {**state, 'food': sorted(state['food'])}
+
+
+def play_game(viewers, max_rounds=20):
+    state = setup_game([food_eating_player, random_player], layout_dict=parse_layout(LAYOUT),
+                       max_rounds=max_rounds, rng=1)
+    state['viewers'] = viewers
+    while not state['gameover']:
+        state = play_turn(state)
+    return state
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip', 'zstd'])
+def test_replay_roundtrip(tmp_path, compression):
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    path = tmp_path / 'replay'
+    collected = CollectingViewer()
+    with open(path, 'wb') as f:
+        writer = ReplayWriter(f, compression=compression, keyframe_interval=7)
+        play_game([writer, collected])
+        assert writer.closed
+
+    assert is_replay_v2(path)
+    with ReplayReader(path) as reader:
+        assert reader.header['compression'] == compression
+        assert len(reader) == len(collected.states) == 80
+        # 80 states in blocks of 7
+        assert len(reader.index) == 12
+        states = list(reader)
+
+    assert states == [normalized(state) for state in collected.states]
+    # the food has been eaten
+    assert len(states[-1]['food']) < len(states[0]['food'])
+    assert states[-1]['gameover']
+
+
+def test_replay_seek(tmp_path):
+    path = tmp_path / 'replay'
+    collected = CollectingViewer()
+    with open(path, 'wb') as f:
+        play_game([ReplayWriter(f, keyframe_interval=10), collected])
+    expected = [normalized(state) for state in collected.states]
+
+    with ReplayReader(path) as reader:
+        assert list(reader.states(round=1)) == expected
+        states = reader.states(round=12, turn=2)
+        assert next(states) == expected[11 * 4 + 2]
+        assert list(states) == expected[11 * 4 + 3:]
+        assert list(reader.states(round=21)) == []
+
+
+def test_replay_without_index(tmp_path):
+    path = tmp_path / 'replay'
+    collected = CollectingViewer()
+    with open(path, 'wb') as f:
+        writer = ReplayWriter(f, keyframe_interval=10)
+        play_game([writer, collected])
+    data = path.read_bytes()
+    # an aborted game only has its complete blocks
+    index_offset = ReplayReader(path).index[-1][0]
+    path.write_bytes(data[:index_offset + 10])
+
+    with ReplayReader(path) as reader:
+        assert len(reader.index) == 7
+        assert list(reader) == [normalized(state) for state in collected.states[:70]]
+
+
+def test_replay_stores_walls_once(tmp_path):
+    old_stream = io.StringIO()
+    new_stream = io.BytesIO()
+    collected = CollectingViewer()
+    play_game([viewer.ReplayWriter(old_stream), ReplayWriter(new_stream, compression=None), collected])
+    walls = collected.states[0]['walls']
+    assert old_stream.getvalue().count(json.dumps(walls)) == 80
+    assert new_stream.getvalue().count(json.dumps(walls, separators=(',', ':')).encode()) == 1
+    assert len(new_stream.getvalue()) < len(old_stream.getvalue()) / 5
+
+
+def test_read_replay_old_format(tmp_path):
+    old_path = tmp_path / 'old'
+    new_path = tmp_path / 'new'
+    with open(old_path, 'w') as f, open(new_path, 'wb') as g:
+        play_game([viewer.ReplayWriter(f), ReplayWriter(g)])
+
+    assert not is_replay_v2(old_path)
+    assert new_path.read_bytes().startswith(MAGIC)
+    old_states = [normalized(state) for state in read_replay(old_path)]
+    assert old_states == list(read_replay(new_path))
+
+
+def test_replay_random_access(tmp_path):
+    path = tmp_path / 'replay'
+    collected = CollectingViewer()
+    with open(path, 'wb') as f:
+        play_game([ReplayWriter(f, keyframe_interval=10), collected])
+    expected = [normalized(state) for state in collected.states]
+
+    with ReplayReader(path) as reader:
+        assert [reader[idx] for idx in (0, 9, 10, 47, 79)] == [expected[idx] for idx in (0, 9, 10, 47, 79)]
+        assert reader[-1] == expected[-1]
+        with pytest.raises(IndexError):
+            reader[80]
+        with pytest.raises(TypeError):
+            reader['1']
+
+
+def test_replay_tuples(tmp_path):
+    old_path = tmp_path / 'old'
+    new_path = tmp_path / 'new'
+    with open(old_path, 'w') as f, open(new_path, 'wb') as g:
+        play_game([viewer.ReplayWriter(f), ReplayWriter(g)])
+
+    for path in [old_path, new_path]:
+        with open_replay(path, tuples=True) as reader:
+            states = list(reader.states(round=3))
+        assert (states[0]['round'], states[0]['turn']) == (3, 0)
+        assert len(states) == 18 * 4
+        for state in states:
+            for key in ('walls', 'bots', 'food'):
+                assert all(type(pos) is tuple for pos in state[key])
+            # the walls are decoded only once
+            assert state['walls'] is states[0]['walls']
+    assert list(read_replay(old_path, tuples=True))[9]['bots'] == states[1]['bots']
+
+
+def test_legacy_replay_reader(tmp_path):
+    path = tmp_path / 'old'
+    collected = CollectingViewer()
+    with open(path, 'w') as f:
+        play_game([viewer.ReplayWriter(f), collected])
+
+    with open_replay(path) as reader:
+        assert isinstance(reader, LegacyReplayReader)
+        assert len(reader) == 80
+        assert reader[13] == collected.states[13]
+        assert list(reader.states(round=20, turn=3)) == collected.states[-1:]
+
+    path.write_bytes(b'')
+    with LegacyReplayReader(path) as reader:
+        assert list(reader) == []
+    with pytest.raises(ValueError):
+        ReplayReader(path)
+
+
+def test_replay_writer_errors():
+    with pytest.raises(ValueError):
+        ReplayWriter(io.BytesIO(), compression='lzma')
+    with pytest.raises(ValueError):
+        ReplayWriter(io.BytesIO(), keyframe_interval=0)
+
+    writer = ReplayWriter(io.BytesIO())
+    writer.close()
+    with pytest.raises(ValueError):
+        writer.write_state({'round': None, 'turn': None})
+
+
+def without_team_time(states):
+    # the engines store the walls and food ages in a different order
+    return [{key: sorted(value) if key in ('walls', 'food_age') else value
+             for key, value in normalized(state).items() if key != 'team_time'}
+            for state in states]
+
+
+class FlakyTeam(Team):
+    """ A random team which times out every seventh move and disconnects in round 15. """
+    def __init__(self):
+        super().__init__(random_player, team_name='flaky')
+        self._requests = 0
+
+    def get_move(self, game_state):
+        self._requests += 1
+        if game_state['round'] == 15:
+            raise PlayerDisconnected('gone', 'ZMQError')
+        if self._requests % 7 == 0:
+            raise PlayerTimeout()
+        return super().get_move(game_state)
+
+
+@pytest.mark.parametrize('rng', [1, 'random'])
+@pytest.mark.parametrize('engine', ['dict', 'array'])
+def test_moves_resimulate(tmp_path, rng, engine):
+    if engine == 'array':
+        pytest.importorskip('numpy')
+    import random
+    path = tmp_path / 'moves'
+    collected = CollectingViewer()
+    game_rng = 1 if rng == 1 else random.Random(1)
+    with open(path, 'wb') as f:
+        state = run_game([food_eating_player, FlakyTeam()], layout_dict=parse_layout(LAYOUT), max_rounds=20,
+                         rng=game_rng, viewers=[MovesWriter(f), collected], print_result=False, engine=engine)
+
+    assert state['whowins'] == 0
+    assert state['fatal_errors'][1][0]['type'] == 'PlayerDisconnected'
+    assert len(state['errors'][1]) > 0
+
+    assert is_moves_file(path)
+    moves = load_moves(path)
+    assert ('seed' in moves['rng']) == (rng == 1)
+    assert moves['team_names'] == ['local-team (food_eating_player)', 'flaky']
+
+    states = list(resimulate(path, engine=engine))
+    assert without_team_time(states) == without_team_time(collected.states)
+    assert states[-1]['errors'] == collected.states[-1]['errors']
+    assert without_team_time(read_replay(path)) == without_team_time(collected.states)
+
+
+def test_moves_are_small(tmp_path):
+    moves = io.BytesIO()
+    replay = io.BytesIO()
+    run_game([food_eating_player, random_player], layout_dict=parse_layout(LAYOUT), max_rounds=100, rng=1,
+             viewers=[MovesWriter(moves), ReplayWriter(replay)], print_result=False)
+    assert len(moves.getvalue()) < len(replay.getvalue()) / 5
+
+
+def test_moves_setup_error(tmp_path):
+    class BrokenTeam(Team):
+        def set_initial(self, team_id, game_state):
+            raise PlayerDisconnected('Could not load team', 'SyntaxError')
+
+    path = tmp_path / 'moves'
+    collected = CollectingViewer()
+    with open(path, 'wb') as f:
+        state = run_game([BrokenTeam(random_player), random_player], layout_dict=parse_layout(LAYOUT),
+                         max_rounds=20, rng=1, viewers=[MovesWriter(f), collected], print_result=False)
+    assert state['gameover']
+    assert state['team_names'][0] == '%%%Could not load team%%%'
+    assert without_team_time(resimulate(path)) == without_team_time(collected.states)
+
+
+def test_moves_writer_needs_rng(tmp_path):
+    writer = MovesWriter(io.BytesIO())
+    with pytest.raises(ValueError):
+        # the writer was not set up with the game
+        play_game([writer])
@@ -726,3 +726,206 @@ def test_bot_repr():
     # assertions might have been caught in run_game
     # check that all is good
     assert state['fatal_errors'] == [[], []]
+
+
+def test_bot_simulate():
+    from pelita.utils import setup_test_game
+    test_layout = """
+        ##########
+        #  a.  .y#
+        #b .x    #
+        ##########
+    """
+    bot = setup_test_game(layout=test_layout, is_blue=True, round=3, score=[2, 1])
+    # no moves: the state before our move
+    state = bot.simulate()
+    assert state['round'] == 2
+    assert state['turn'] == 3
+    assert state['bots'] == [(3, 1), (4, 2), (1, 2), (8, 1)]
+    assert state['score'] == [2, 1]
+
+    # eat our own food: nothing happens
+    state = bot.simulate([(4, 1)])
+    assert state['round'] == 3
+    assert state['turn'] == 0
+    assert state['bots'][0] == (4, 1)
+    assert state['score'] == [2, 1]
+    assert state['food'][0] == {(4, 1), (3, 2)}
+
+    # red bot x eats food of the blue team, then our bot a kills it
+    state = bot.simulate([(3, 1), (3, 2)])
+    assert state['score'] == [2, 2]
+    assert state['food'][0] == {(4, 1)}
+    state = bot.simulate([(3, 1), (3, 2), (2, 2), (8, 1), (3, 2)])
+    assert state['score'] == [7, 2]
+    assert state['bots'][1] == initial_positions(bot.walls, bot.shape)[1]
+    assert state['deaths'] == [0, 1, 0, 0]
+    assert state['kills'] == [1, 0, 0, 0]
+    assert state['bot_was_killed'] == [False, True, False, False]
+
+    # the bot is not changed
+    assert bot.position == (3, 1)
+    assert bot.score == 2
+    assert bot.enemy[0].position == (4, 2)
+
+    with pytest.raises(ValueError):
+        bot.simulate([(3, 0)])
+    # x cannot jump
+    with pytest.raises(ValueError):
+        bot.simulate([(3, 1), (2, 2)])
+
+
+def test_bot_simulate_in_game():
+    # the simulation of the current state agrees with the bots
+    def simulating_team(bot, state):
+        sim = bot.simulate()
+        bots = [bot, bot.other, bot.enemy[0], bot.enemy[1]]
+        assert sorted(sim['bots']) == sorted(b.position for b in bots)
+        next_state = bot.simulate([bot.position])
+        assert next_state['bots'][next_state['turn']] == bot.position
+        assert next_state['round'] == bot.round
+        assert next_state['gameover'] == (bot.round == 3 and next_state['turn'] == 3)
+        return bot.random.choice(bot.legal_positions)
+
+    layout = parse_layout("""
+        ##########
+        #  a.  .y#
+        #b .  x  #
+        ##########
+    """)
+    state = run_game([simulating_team, simulating_team], layout_dict=layout, max_rounds=3,
+                     allow_exceptions=True, print_result=False)
+    assert state['fatal_errors'] == [[], []]
+    assert state['errors'] == [{}, {}]
+
+
+def test_bot_maze_distance():
+    from pelita.utils import setup_test_game
+    test_layout = """
+        ##########
+        #a #.  .y#
+        #b   x # #
+        ##########
+    """
+    bot = setup_test_game(layout=test_layout, is_blue=True)
+    assert bot.maze_distance(bot.position, bot.position) == 0
+    assert bot.maze_distance((1, 1), (4, 1)) == 5
+    assert bot.maze_distance((4, 1), (1, 1)) == 5
+    assert bot.next_step_towards((4, 1)) == (2, 1)
+    assert bot.other.next_step_towards((1, 1)) == (1, 1)
+    assert bot.enemy[0].next_step_towards((8, 1)) in [(5, 1), (6, 2)]
+    with pytest.raises(ValueError):
+        bot.maze_distance((0, 0), (1, 1))
+    with pytest.raises(ValueError):
+        bot.next_step_towards((3, 1))
+
+
+def test_bot_shares_team_data():
+    from pelita.utils import setup_test_game
+    test_layout = """
+        ##########
+        #a #.  .y#
+        #b . x # #
+        ##########
+    """
+    bot = setup_test_game(layout=test_layout, is_blue=True, score=[3, 4])
+    # bots have no instance dict
+    assert not hasattr(bot, '__dict__')
+    with pytest.raises(AttributeError):
+        bot.some_attribute = 1
+
+    assert bot.food == [(3, 2), (4, 1)]
+    assert bot.food is bot.food
+    assert bot.enemy[0].food == [(7, 1)]
+    # changing the food of a bot does not change the food of its teammate
+    bot.food.remove((3, 2))
+    bot.enemy[0].food.clear()
+    assert bot.food == [(4, 1)]
+    assert bot.other.food == [(3, 2), (4, 1)]
+    assert bot.enemy[1].food == [(7, 1)]
+    assert bot.shaded_food == []
+    assert bot.score == bot.other.score == 3
+    assert bot.enemy[1].score == 4
+
+    assert bot.legal_positions == [(1, 1), (2, 1), (1, 2)]
+    bot.legal_positions = []
+    assert bot.legal_positions == []
+    assert bot.other.legal_positions == [(1, 2), (2, 2), (1, 1)]
+    assert bot.track == []
+
+
+def test_track_view():
+    from pelita.team import Track
+    positions = [(1, 1), (1, 2), (2, 2)]
+    track = Track(positions)
+    assert len(track) == 3
+    assert track == positions
+    assert track == tuple(positions)
+    assert track != positions[:2]
+    assert track[0] == (1, 1)
+    assert track[-1] == (2, 2)
+    assert track[-2] == (1, 2)
+    assert track[1:] == [(1, 2), (2, 2)]
+    assert track[::-1] == [(2, 2), (1, 2), (1, 1)]
+    assert list(track) == positions
+    assert (1, 2) in track
+    assert track.index((2, 2)) == 2
+    assert track + [(3, 2)] == positions + [(3, 2)]
+    assert [(0, 1)] + track == [(0, 1)] + positions
+    assert type([(0, 1)] + track) is list
+    assert repr(track) == repr(positions)
+    with pytest.raises(IndexError):
+        track[3]
+    with pytest.raises(IndexError):
+        track[-4]
+    with pytest.raises(TypeError):
+        track[0] = (5, 5)
+
+    # the view does not change when the track grows
+    positions.append((3, 2))
+    assert len(track) == 3
+    assert track[-1] == (2, 2)
+    assert list(track) == positions[:3]
+    assert Track(positions)[-1] == (3, 2)
+    assert Track() == []
+
+
+@pytest.mark.parametrize('protocol', [None, 'pelita-v2'])
+def test_state_delta(protocol):
+    from pelita.game import prepare_bot_state
+    from pelita.network import decode_message, encode_message
+    from pelita.player import food_eating_player
+    from pelita.team import _apply_state_delta, _state_delta
+
+    def transfer(obj):
+        return decode_message(encode_message(obj, protocol))
+
+    def normalized(bot_state):
+        # the bots see the food lists as lists of tuples
+        for side in ('team', 'enemy'):
+            for key in ('food', 'shaded_food'):
+                bot_state[side][key] = [tuple(pos) for pos in bot_state[side][key]]
+        return bot_state
+
+    layout = generate_maze(rng=1)
+    state = setup_game([food_eating_player, randomBot], layout_dict=layout, max_rounds=100, rng=1)
+    # the last bot states that have been sent and received for each team
+    sent = [None, None]
+    received = [None, None]
+    while True:
+        state = play_turn(state)
+        if state['gameover']:
+            break
+        bot_state = prepare_bot_state(state)
+        team = state['turn'] % 2
+        if sent[team] is None:
+            received[team] = transfer(bot_state)
+        else:
+            delta = _state_delta(sent[team], bot_state)
+            assert len(encode_message(delta, protocol)) < len(encode_message(bot_state, protocol))
+            received[team] = _apply_state_delta(received[team], transfer(delta))
+            assert normalized(received[team]) == normalized(transfer(bot_state))
+        sent[team] = bot_state
+
+    # food has been eaten during the game
+    assert len(bot_state['team']['food']) + len(bot_state['enemy']['food']) < 60